@@ -1,7 +1,18 @@
 import json
+import math
+import os
+import random
 import pyarrow as pa
 import pyarrow.compute as pc
-import duckdb
+from utils.expression_utils import (filter_table, filter_batches, compile_filter_expression, map_table,
+                                    map_expression, project_table)
+from utils.aggregate_utils import (aggregate_batches, aggregate_columns, describe_batches, normalize_aggregations,
+                                   APPROXIMATE_FUNCTIONS, DEFAULT_CONFIDENCE, DEFAULT_SAMPLE_FRACTION,
+                                   estimate_from_clusters, estimate_from_sketch, exact_aggregate, exact_result)
+from compute.interactive.plan import LogicalPlan, TableSource
+from compute.interactive.sql_executor import cache_relation, sql_stream, sql_table
+from parser.cache_manager import arrow_file_num_rows, arrow_file_schema, is_parquet_file
+from parser.zone_map import load_zone_map
 
 def handle_compute_actions(connections, action):
     action_type = action.type
@@ -13,32 +24,203 @@ def handle_compute_actions(connections, action):
         return compute_min_action(connections, action)
     elif action_type == "compute_max":
         return compute_max_action(connections, action)
+    elif action_type == "compute_aggregate":
+        return compute_aggregate_action(connections, action)
+    elif action_type == "compute_describe":
+        return compute_describe_action(connections, action)
+    elif action_type == "compute_approximate":
+        return compute_approximate_action(connections, action)
     else:
         raise ValueError(f"Unsupported action type: {action_type}")
 
 def compute_sum_action(connections, action):
-    arrow_table = get_arrow_table(connections, action)
-    column = json.loads(action.body.to_pybytes().decode("utf-8")).get("column")
-    sum = pc.sum(arrow_table[column]).as_py()
-    return iter([pa.flight.Result(json.dumps({"result": sum}).encode("utf-8"))])
+    return compute_column_action(connections, action, "sum")
 
 def compute_mean_action(connections, action):
-    arrow_table = get_arrow_table(connections, action)
-    column = json.loads(action.body.to_pybytes().decode("utf-8")).get("column")
-    mean = pc.mean(arrow_table[column]).as_py()
-    return iter([pa.flight.Result(json.dumps({"result": mean}).encode("utf-8"))])
+    return compute_column_action(connections, action, "mean")
 
 def compute_min_action(connections, action):
-    arrow_table = get_arrow_table(connections, action)
-    column = json.loads(action.body.to_pybytes().decode("utf-8")).get("column")
-    mean = pc.min(arrow_table[column]).as_py()
-    return iter([pa.flight.Result(json.dumps({"result": mean}).encode("utf-8"))])
+    return compute_column_action(connections, action, "min")
 
 def compute_max_action(connections, action):
-    arrow_table = get_arrow_table(connections, action)
-    column = json.loads(action.body.to_pybytes().decode("utf-8")).get("column")
-    mean = pc.max(arrow_table[column]).as_py()
-    return iter([pa.flight.Result(json.dumps({"result": mean}).encode("utf-8"))])
+    return compute_column_action(connections, action, "max")
+
+def compute_column_action(connections, action, function):
+    """单列 sum / mean / min / max：优先由缓存文件的统计信息直接得到，否则在结果表上计算。"""
+    params = json.loads(action.body.to_pybytes().decode("utf-8"))
+    dataframe = json.loads(params.get("dataframe"))
+    column = params.get("column")
+    conn = connections[dataframe.get("connection_id")]
+    found, result = aggregate_from_stats(conn.dataframes[dataframe.get("id")], dataframe.get("actions"), column, function)
+    if not found:
+        arrow_table = get_result_table(conn, dataframe.get("id"), dataframe.get("actions"))
+        result = getattr(pc, function)(arrow_table[column]).as_py()
+    return iter([pa.flight.Result(json.dumps({"result": result}).encode("utf-8"))])
+
+# 只改变列或行范围、不改变取值的 actions，聚合结果可以由缓存的统计信息得到
+STATS_ACTIONS = ("select", "limit", "slice")
+
+def aggregate_from_stats(source, actions, column, function):
+    """
+    用缓存文件的 zone map 计算 sum / mean / min / max，不扫描数据。只适用于 action 链只包含 select / limit / slice 的情况：
+    完全落在行窗口内的批次直接使用统计信息，窗口边界上的批次只读取窗口内的行。
+    返回 (是否可用, 结果)，不可用时由调用方扫描数据计算。
+    """
+    if any(action_type not in STATS_ACTIONS for action_type, _ in actions or []):
+        return False, None
+    plan = LogicalPlan.from_actions(actions)
+    if plan.remaining_actions or (plan.columns is not None and column not in plan.columns):
+        return False, None
+    cache_path = source._cache_path() if isinstance(source, TableSource) else None
+    zone_map = load_zone_map(cache_path) if cache_path is not None else None
+    if zone_map is None:
+        return False, None
+
+    end = None if plan.length is None else plan.offset + plan.length
+    full, edges = [], []
+    for i in zone_map.batches_in_range(plan.offset, plan.length):
+        start, stop = int(zone_map.row_starts[i]), int(zone_map.row_starts[i] + zone_map.num_rows[i])
+        if start >= plan.offset and (end is None or stop <= end):
+            full.append(i)
+        else:
+            edges.append((max(start, plan.offset), stop if end is None else min(stop, end)))
+
+    if function == "mean":
+        functions = ("sum", "count")
+    elif function in ("min", "max"):
+        functions = (function, "nan_count")
+    else:
+        functions = (function,)
+    values = {}
+    for f in functions:
+        found, value = zone_map.aggregate(column, f, full)
+        if not found:
+            return False, None
+        values[f] = [value]
+    for lo, hi in edges:
+        edge = source.parser.scan_arrow_file(cache_path, [column], lo, hi - lo).read_all()[column]
+        if function in ("min", "max") and pa.types.is_floating(edge.type):
+            # 与 zone map 一致：min / max 只在非 NaN 值上计算，NaN 单独计数
+            is_nan = pc.fill_null(pc.is_nan(edge), False)
+            values["nan_count"].append(pc.sum(is_nan).as_py() or 0)
+            edge = pc.filter(edge, pc.invert(is_nan))
+        for f in functions:
+            if f != "nan_count":
+                values[f].append(getattr(pc, f)(edge).as_py())
+
+    def combine(f):
+        present = [value for value in values[f] if value is not None]
+        if not present:
+            return None
+        return {"sum": sum, "count": sum, "min": min, "max": max, "nan_count": sum}[f](present)
+
+    if function == "mean":
+        count = combine("count")
+        return True, combine("sum") / count if count else None
+    result = combine(function)
+    if function in ("min", "max") and result is None and combine("nan_count"):
+        # 与 pc.min / pc.max 一致：只有 NaN 时返回 inf / -inf，全为 null 时返回 None
+        return True, float("inf") if function == "min" else float("-inf")
+    return True, result
+
+# 近似聚合时可以在每个批次上独立执行的 actions；limit / slice / sort / sql 依赖全部数据，使用精确计算
+SAMPLE_ACTIONS = ("select", "filter", "map")
+# 内存中的表按该行数切分为抽样的批次
+SAMPLE_BATCH_ROWS = 65536
+# 至少抽取的批次数，批次太少时置信区间不可靠
+MIN_SAMPLE_BATCHES = 8
+
+def compute_approximate_action(connections, action):
+    """
+    sum / mean / quantile / count_distinct 的近似计算，返回估计值及置信区间（ApproximateResult）。
+    approx 为 False 或 action 链不支持近似时在全部数据上精确计算。
+    """
+    params = json.loads(action.body.to_pybytes().decode("utf-8"))
+    dataframe = json.loads(params.get("dataframe"))
+    conn = connections[dataframe.get("connection_id")]
+    column, function = params.get("column"), params.get("function")
+    if function not in APPROXIMATE_FUNCTIONS:
+        raise ValueError(f"不支持近似计算的函数: {function}，可选: {', '.join(APPROXIMATE_FUNCTIONS)}")
+    confidence = params.get("confidence") or DEFAULT_CONFIDENCE
+    q = params.get("q", 0.5)
+    result = None
+    if params.get("approx", True):
+        result = approximate_aggregate(conn.dataframes[dataframe.get("id")], dataframe.get("actions") or [], column,
+                                       function, params.get("sample_fraction"), confidence, q, params.get("seed"))
+    if result is None:
+        arrow_table = get_result_table(conn, dataframe.get("id"), dataframe.get("actions"))
+        result = exact_result(exact_aggregate(arrow_table[column], function, q), arrow_table.num_rows, confidence)
+    return iter([pa.flight.Result(json.dumps({"result": result._asdict()}).encode("utf-8"))])
+
+def approximate_aggregate(source, actions, column, function, sample_fraction=None, confidence=DEFAULT_CONFIDENCE,
+                          q=0.5, seed=None):
+    """
+    按以下顺序近似计算，都不适用时返回 None：
+    - sum / mean 能由 zone map 统计信息直接得到时返回精确值；
+    - count_distinct 在只 select 的 action 链上使用缓存中该列的 HyperLogLog；
+    - sum / mean / quantile 随机抽取 sample_fraction 比例（至少 MIN_SAMPLE_BATCHES 个）的批次，
+      在抽中的批次上执行 action 链后估计，filter 可以由 zone map 排除的批次不参与抽样。
+    """
+    if function in ("sum", "mean"):
+        found, value = aggregate_from_stats(source, actions, column, function)
+        if found:
+            return exact_result(value, 0, confidence)
+    if function == "count_distinct":
+        if any(action_type != "select" for action_type, _ in actions):
+            return None
+        cache_path = source._cache_path() if isinstance(source, TableSource) else None
+        zone_map = load_zone_map(cache_path) if cache_path is not None else None
+        if zone_map is None or column not in zone_map.sketches:
+            return None
+        return estimate_from_sketch(zone_map.sketches[column], confidence)
+    if any(action_type not in SAMPLE_ACTIONS for action_type, _ in actions):
+        return None
+    fraction = DEFAULT_SAMPLE_FRACTION if sample_fraction is None else sample_fraction
+
+    def estimate(population, get_batch):
+        m = min(len(population), max(MIN_SAMPLE_BATCHES, math.ceil(fraction * len(population))))
+        clusters = []
+        for i in sorted(random.Random(seed).sample(population, m)):
+            batches = list(stream_actions(iter([get_batch(i)]), actions))
+            clusters.append(pa.chunked_array([batch.column(column) for batch in batches])
+                            if batches else pa.chunked_array([], pa.null()))
+        return estimate_from_clusters(clusters, len(population), function, confidence, q)
+
+    cache_path = source._cache_path() if isinstance(source, TableSource) else None
+    if cache_path is not None and not is_parquet_file(cache_path):
+        with pa.memory_map(cache_path, "r") as mmap:
+            reader = pa.ipc.open_file(mmap)
+            population = list(range(reader.num_record_batches))
+            zone_map = load_zone_map(cache_path)
+            if zone_map is not None and zone_map.num_batches == reader.num_record_batches:
+                population = zone_map.candidate_batches(LogicalPlan.from_actions(actions).predicate)
+            return estimate(population, reader.get_batch)
+    batches = source.data.to_batches(max_chunksize=SAMPLE_BATCH_ROWS)
+    return estimate(list(range(len(batches))), batches.__getitem__)
+
+def compute_aggregate_action(connections, action):
+    """
+    一次扫描完成多个 (列, 函数) 聚合，可选 group_by。只读取涉及的列，结果以 Arrow IPC 流返回。
+    参数：aggregations=[[列, 函数], ...]（列为 "*" 时 count 统计行数），group_by=[列, ...]，ddof（方差自由度，默认 0）。
+    """
+    params = json.loads(action.body.to_pybytes().decode("utf-8"))
+    aggregations = normalize_aggregations(params.get("aggregations") or [])
+    group_by = params.get("group_by") or []
+    reader = get_action_stream(connections, params, aggregate_columns(aggregations, group_by))
+    table = aggregate_batches(reader, reader.schema, aggregations, group_by, ddof=params.get("ddof", 0))
+    return iter([pa.flight.Result(table_to_ipc(table))])
+
+def compute_describe_action(connections, action):
+    """所有数值列的 count / mean / std / min / max，一次扫描完成。"""
+    params = json.loads(action.body.to_pybytes().decode("utf-8"))
+    reader = get_action_stream(connections, params)
+    return iter([pa.flight.Result(table_to_ipc(describe_batches(reader, reader.schema)))])
+
+def table_to_ipc(table):
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
 
 def do_limit(arrow_table, row_num):
     return arrow_table.slice(0, row_num)
@@ -50,10 +232,7 @@ def do_select(arrow_table, columns):
     return arrow_table.select(columns)
 
 def do_filter(arrow_table, expression):
-    column_names = arrow_table.column_names
-    locals_dict = {col: arrow_table[col].to_pandas() for col in column_names}
-    mask = eval(expression, {"__builtins__": None}, locals_dict)
-    return arrow_table.filter(pa.array(mask))
+    return filter_table(arrow_table, expression)
 
 def do_sort(arrow_table, column, order):
     if order == "ascending":
@@ -61,13 +240,13 @@ def do_sort(arrow_table, column, order):
     return arrow_table.sort_by([(column, "descending")])
 
 def do_map(arrow_table, column, func, new_column_name):
-    column_data = arrow_table[column].to_pylist()
-    mapped_data = [func(value) for value in column_data]
-    return arrow_table.append_column(new_column_name, pa.array(mapped_data))
+    return map_table(arrow_table, column, func, new_column_name)
+
+def map_column_name(params):
+    return params.get("new_column_name") or f"{params.get('column')}_mapped"
 
 def do_sql(arrow_table, sql_str):
-    dataframe = arrow_table
-    return duckdb.sql(sql_str).arrow()
+    return sql_table(arrow_table, sql_str)
 
 def handle_prev_actions(arrow_table, prev_actions):
     for action in prev_actions:
@@ -81,7 +260,7 @@ def handle_prev_actions(arrow_table, prev_actions):
         elif action_type == "filter":
             arrow_table = do_filter(arrow_table, params.get("expression"))
         elif action_type == "map":
-            arrow_table = do_map(arrow_table, params.get("column"), params.get("func"), params.get("new_column_name", f"{column}_mapped"))
+            arrow_table = do_map(arrow_table, params.get("column"), params.get("func"), map_column_name(params))
         elif action_type == "sort":
             arrow_table = do_sort(arrow_table, params.get("column"), params.get("order", "ascending"))
         elif action_type == "sql":
@@ -91,11 +270,249 @@ def handle_prev_actions(arrow_table, prev_actions):
     return arrow_table
 
 
+def execute_plan(source, actions):
+    """
+    把 actions 转为逻辑计划执行：可下推的 select/filter/limit/slice 交给解析器按需读取，
+    其余 actions 在得到的表上继续执行。
+    """
+    if any(action_type == "sql" for action_type, _ in actions or []):
+        # sql 的输入和执行都是流式的，只物化 sql 的结果
+        return execute_plan_stream(source, list(actions)).read_all()
+    plan = LogicalPlan.from_actions(actions)
+    if plan.is_trivial:
+        arrow_table = source.data
+    else:
+        arrow_table = plan.execute(source).read_all()
+    return handle_prev_actions(arrow_table, plan.remaining_actions)
+
+def get_result_table(conn, dataframe_id, actions):
+    """
+    执行 action 链得到结果表，优先从连接的结果缓存中获取，避免同一 action 链被重复物化。
+    没有 action 时直接返回原始表（已是 mmap 零拷贝），不占用缓存。
+    """
+    source = conn.dataframes[dataframe_id]
+    if not actions:
+        return source.data
+    if conn.result_cache is None:
+        return execute_plan(source, actions)
+    cached_table = conn.result_cache.get(dataframe_id, actions, source.version)
+    if cached_table is not None:
+        return cached_table
+    arrow_table = execute_plan(source, actions)
+    conn.result_cache.put(dataframe_id, actions, arrow_table, source.version)
+    return arrow_table
+
+# 可以逐批执行的 actions，其余（sort / sql）需要完整表
+STREAMING_ACTIONS = ("select", "filter", "map", "limit", "slice")
+
+def stream_select(batches, columns):
+    for batch in batches:
+        yield batch.select(columns)
+
+def stream_filter(batches, expression):
+    try:
+        filter_expr, _ = compile_filter_expression(expression)
+    except ValueError:
+        # 无法编译的表达式逐批降级为 filter_table（pandas eval）
+        for batch in batches:
+            yield from filter_table(pa.Table.from_batches([batch]), expression).to_batches()
+        return
+    yield from filter_batches(batches, filter_expr)
+
+def stream_map(batches, column, func, new_column_name):
+    # 表达式只编译一次，逐批次向量化计算
+    expression = map_expression(column, func) if isinstance(func, str) else None
+    for batch in batches:
+        table = pa.Table.from_batches([batch])
+        if expression is not None:
+            table = project_table(table, expression, new_column_name)
+        else:
+            table = do_map(table, column, func, new_column_name)
+        yield from table.to_batches()
+
+def stream_window(batches, offset, length):
+    skip = offset or 0
+    remain = length
+    for batch in batches:
+        if remain is not None and remain <= 0:
+            break
+        if skip > 0:
+            skipped = min(skip, batch.num_rows)
+            batch = batch.slice(skipped)
+            skip -= skipped
+        if remain is not None:
+            batch = batch.slice(0, remain)
+            remain -= batch.num_rows
+        if batch.num_rows > 0:
+            yield batch
+
+def stream_actions(batches, actions):
+    """把可流式执行的 actions 串成生成器链，每次只处理一个 RecordBatch。"""
+    for action_type, params in actions:
+        if action_type == "select":
+            batches = stream_select(batches, params.get("columns"))
+        elif action_type == "filter":
+            batches = stream_filter(batches, params.get("expression"))
+        elif action_type == "map":
+            batches = stream_map(batches, params.get("column"), params.get("func"), map_column_name(params))
+        elif action_type == "limit":
+            batches = stream_window(batches, 0, params.get("rowNum"))
+        elif action_type == "slice":
+            batches = stream_window(batches, params.get("offset", 0), params.get("length"))
+        else:
+            raise ValueError(f"Unsupported streaming action type: {action_type}")
+    return batches
+
+def execute_plan_stream(source, actions) -> pa.RecordBatchReader:
+    """
+    流式执行 action 链：批次从解析器/Arrow 缓存经过 select/filter/map/limit/slice 逐批流出，
+    内存占用与批大小相关而不是与表大小相关。sql 由 DuckDB 流式执行，遇到 sort 时才退化为物化执行。
+    """
+    sql_index = next((i for i, (action_type, _) in enumerate(actions) if action_type == "sql"), None)
+    if sql_index is not None:
+        reader = execute_sql_stream(source, actions[:sql_index], actions[sql_index][1].get("sql_str"))
+        return stream_remaining_actions(reader, actions[sql_index + 1:])
+    plan = LogicalPlan.from_actions(actions)
+    reader = source.scan() if plan.is_trivial else plan.execute(source)
+    return stream_remaining_actions(reader, plan.remaining_actions)
+
+def execute_sql_stream(source, actions, sql_str) -> pa.RecordBatchReader:
+    """
+    在 action 链的结果上执行 sql：前序 actions 都能下推时，DuckDB 直接扫描 mmap 的缓存文件（前序 actions 作为视图），
+    否则先得到前序结果再交给 DuckDB；结果都按批次流式返回，不物化整张结果表。
+    """
+    relation = cache_relation(source, actions)
+    if relation is not None:
+        dataset, view = relation
+        return sql_stream(dataset, sql_str, view)
+    arrow_table = execute_plan(source, actions) if actions else source.data
+    return sql_stream(arrow_table, sql_str)
+
+def stream_remaining_actions(reader, remaining) -> pa.RecordBatchReader:
+    """在已下推部分的流式结果上继续执行剩余 actions。"""
+    split = next((i for i, (action_type, _) in enumerate(remaining) if action_type not in STREAMING_ACTIONS), len(remaining))
+    streaming_actions, blocking_actions = remaining[:split], remaining[split:]
+    batches = stream_actions(iter(reader), streaming_actions)
+
+    if blocking_actions:
+        schema = handle_prev_actions(reader.schema.empty_table(), streaming_actions).schema
+        arrow_table = pa.Table.from_batches(list(batches), schema=schema)
+        arrow_table = handle_prev_actions(arrow_table, blocking_actions)
+        return pa.RecordBatchReader.from_batches(arrow_table.schema, arrow_table.to_batches())
+
+    # map 等 action 的输出类型依赖数据，用第一批的 schema 作为整个流的 schema
+    first_batch = next(batches, None)
+    if first_batch is None:
+        schema = handle_prev_actions(reader.schema.empty_table(), streaming_actions).schema
+        return pa.RecordBatchReader.from_batches(schema, iter([]))
+    schema = first_batch.schema
+
+    def batch_generator():
+        yield first_batch
+        for batch in batches:
+            yield batch if batch.schema.equals(schema) else batch.cast(schema)
+
+    return pa.RecordBatchReader.from_batches(schema, batch_generator())
+
+def get_result_stream(conn, dataframe_id, actions) -> pa.RecordBatchReader:
+    """
+    流式获取 action 链的结果：结果缓存命中时直接从缓存输出，否则流式执行且不写入缓存，
+    避免为了缓存而物化整张表。
+    """
+    source = conn.dataframes[dataframe_id]
+    if actions and conn.result_cache is not None:
+        cached_table = conn.result_cache.get(dataframe_id, actions, source.version)
+        if cached_table is not None:
+            return pa.RecordBatchReader.from_batches(cached_table.schema, cached_table.to_batches())
+    return execute_plan_stream(source, actions or [])
+
+def is_pushdown_only(actions) -> bool:
+    """action 链只有 select / limit / slice，结果的行数和行顺序可以直接由来源的元数据确定。"""
+    plan = LogicalPlan.from_actions(actions or [])
+    return not plan.remaining_actions and plan.predicate is None
+
+def result_layout(conn, dataframe_id, actions):
+    """
+    不执行 action 链得到结果的 (schema, 行数, 字节数)，用于把结果拆分为多个 endpoint：
+    - 结果已在结果缓存中，或没有 action 且来源已物化时，直接取自结果表；
+    - action 链只有 select / limit / slice 且来源有缓存文件时，由缓存文件的元数据得到，字节数按文件大小估算。
+    其它情况返回 None：行数要执行之后才知道，而且分段重复执行 sort / sql 等不保证各次的行顺序一致。
+    """
+    source = conn.dataframes[dataframe_id]
+    if actions and conn.result_cache is not None:
+        cached_table = conn.result_cache.get(dataframe_id, actions, source.version)
+        if cached_table is not None:
+            return cached_table.schema, cached_table.num_rows, cached_table.nbytes
+    if not actions and source.is_materialized:
+        return source.data.schema, source.data.num_rows, source.data.nbytes
+    if not is_pushdown_only(actions):
+        return None
+    cache_path = source._cache_path() if isinstance(source, TableSource) else None
+    if cache_path is None:
+        return None
+    plan = LogicalPlan.from_actions(actions or [])
+    schema = arrow_file_schema(cache_path)
+    total_rows = arrow_file_num_rows(cache_path)
+    num_rows = max(total_rows - plan.offset, 0)
+    if plan.length is not None:
+        num_rows = min(num_rows, plan.length)
+    num_bytes = os.path.getsize(cache_path) * num_rows / max(total_rows, 1)
+    if plan.columns is not None:
+        num_bytes *= len(plan.columns) / max(len(schema), 1)
+        schema = pa.schema([schema.field(column) for column in plan.columns], metadata=schema.metadata)
+    return schema, num_rows, int(num_bytes)
+
+def get_range_stream(conn, dataframe_id, actions, offset, length) -> pa.RecordBatchReader:
+    """
+    流式获取结果中 [offset, offset + length) 范围的行，用于多 endpoint 并行下载。
+    结果已缓存时直接切片；action 链可以完全下推时追加 slice，由逻辑计划下推到解析器 / 缓存文件；
+    其它情况物化一次结果（存入结果缓存）后切片，避免每个 endpoint 各自重新执行 action 链。
+    """
+    source = conn.dataframes[dataframe_id]
+    if actions and conn.result_cache is not None:
+        cached_table = conn.result_cache.get(dataframe_id, actions, source.version)
+        if cached_table is not None:
+            table = cached_table.slice(offset, length)
+            return pa.RecordBatchReader.from_batches(table.schema, table.to_batches())
+    if is_pushdown_only(actions):
+        return execute_plan_stream(source,
+                                   list(actions or []) + [["slice", {"offset": offset, "length": length}]])
+    table = get_result_table(conn, dataframe_id, actions).slice(offset, length)
+    return pa.RecordBatchReader.from_batches(table.schema, table.to_batches())
+
+def rechunk_batches(batches, max_chunksize):
+    """把批次切分为不超过 max_chunksize 行。"""
+    for batch in batches:
+        if not max_chunksize or batch.num_rows <= max_chunksize:
+            yield batch
+            continue
+        for start in range(0, batch.num_rows, max_chunksize):
+            yield batch.slice(start, max_chunksize)
+
+def get_projected_stream(conn, dataframe_id, actions, columns=None) -> pa.RecordBatchReader:
+    """
+    流式获取结果中的部分列。结果已缓存时直接从缓存读取，否则在 action 链末尾追加 select，
+    由逻辑计划把列投影下推到解析器 / 缓存文件。
+    """
+    if not columns:
+        return get_result_stream(conn, dataframe_id, actions)
+    source = conn.dataframes[dataframe_id]
+    if actions and conn.result_cache is not None:
+        cached_table = conn.result_cache.get(dataframe_id, actions, source.version)
+        if cached_table is not None:
+            table = cached_table.select(columns)
+            return pa.RecordBatchReader.from_batches(table.schema, table.to_batches())
+    return execute_plan_stream(source, list(actions or []) + [["select", {"columns": columns}]])
+
+def get_action_stream(connections, params, columns=None) -> pa.RecordBatchReader:
+    dataframe = json.loads(params.get("dataframe"))
+    conn = connections[dataframe.get("connection_id")]
+    return get_projected_stream(conn, dataframe.get("id"), dataframe.get("actions"), columns)
+
 def get_arrow_table(connections, action):
     params = json.loads(action.body.to_pybytes().decode("utf-8"))
     dataframe_id = json.loads(params.get("dataframe")).get("id")
     actions = json.loads(params.get("dataframe")).get("actions")
     connection_id = json.loads(params.get("dataframe")).get("connection_id")
     conn = connections[connection_id]
-    arrow_table = conn.dataframes[dataframe_id].data
-    return handle_prev_actions(arrow_table, actions)
\ No newline at end of file
+    return get_result_table(conn, dataframe_id, actions)
\ No newline at end of file
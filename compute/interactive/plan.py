@@ -0,0 +1,171 @@
+import threading
+from typing import List, Optional
+
+import pyarrow as pa
+
+from utils.expression_utils import compile_filter_expression, filter_batch
+from utils.logger_utils import get_logger
+logger = get_logger(__name__)
+
+
+class TableSource:
+    """
+    服务端 dataframe 的数据来源：文件路径 + 解析器。
+    open 时不再解析文件，只有在需要完整表时才调用 parser.parse 物化；
+    其它情况下通过 scan 把列投影和行范围下推到解析器。
+    version 标识来源数据的版本，作为结果缓存键的一部分，文件变化后旧版本的结果不会被命中。
+    """
+
+    def __init__(self, id: str, file_path: Optional[str] = None, parser=None, data: Optional[pa.Table] = None,
+                 version=None):
+        self.id = id
+        self.file_path = file_path
+        self.parser = parser
+        self.version = version
+        self._data = data
+        self._lock = threading.Lock()
+
+    @property
+    def data(self) -> pa.Table:
+        if self._data is None:
+            with self._lock:
+                if self._data is None:
+                    self._data = self.parser.parse(self.file_path)
+        return self._data
+
+    @property
+    def is_materialized(self) -> bool:
+        return self._data is not None or self.parser is None
+
+    def _cache_path(self) -> Optional[str]:
+        if self.parser is None or self.file_path is None or not hasattr(self.parser, "lookup_arrow_cache"):
+            return None
+        try:
+            return self.parser.lookup_arrow_cache(self.file_path)
+        except OSError:
+            return None
+
+    def scan(self, columns: Optional[List[str]] = None, offset: int = 0,
+             length: Optional[int] = None, predicate=None) -> pa.RecordBatchReader:
+        """predicate 只是提示，解析器可以据此跳过行块，返回的行仍需调用方过滤。"""
+        if self.is_materialized:
+            # 已物化的表来自缓存文件时仍从缓存按批次读取，以便利用 zone map 跳过批次
+            cache_path = self._cache_path()
+            if cache_path is not None:
+                return self.parser.scan_arrow_file(cache_path, columns, offset, length, predicate)
+            table = self.data
+            if columns is not None:
+                table = table.select(columns)
+            table = table.slice(offset, length)
+            return pa.RecordBatchReader.from_batches(table.schema, table.to_batches())
+        if predicate is None:
+            return self.parser.scan(self.file_path, columns, offset, length)
+        return self.parser.scan(self.file_path, columns, offset, length, predicate=predicate)
+
+
+class LogicalPlan:
+    """
+    由 sdk.dataframe.DataFrame 记录的 actions 构造的逻辑执行计划。
+    从头开始把可以下推的 select / filter / limit / slice 合并为一次扫描：
+    - select 合并为列投影；
+    - 窗口（limit / slice）之前的 filter 合并为谓词，谓词引用的列一并读取；
+    - limit / slice 合并为作用在谓词结果上的行窗口，没有谓词时直接下推到解析器。
+    遇到第一个无法下推的 action（sort / map / sql 等）后，其余 actions 保持原样执行。
+    """
+
+    def __init__(self):
+        self.columns = None  # 最终输出的列，None 表示全部
+        self.predicate = None  # pc.Expression
+        self.predicate_columns = []
+        self.offset = 0
+        self.length = None
+        self.remaining_actions = []
+
+    @staticmethod
+    def from_actions(actions) -> "LogicalPlan":
+        plan = LogicalPlan()
+        actions = list(actions or [])
+        pushed = 0
+        for action_type, params in actions:
+            if action_type == "select":
+                plan.columns = list(params.get("columns"))
+            elif action_type == "filter":
+                if plan.has_window:
+                    break
+                try:
+                    filter_expr, referenced = compile_filter_expression(params.get("expression"))
+                except ValueError:
+                    break
+                if plan.columns is not None and not referenced.issubset(plan.columns):
+                    break
+                plan.predicate = filter_expr if plan.predicate is None else (plan.predicate & filter_expr)
+                plan.predicate_columns.extend(c for c in sorted(referenced) if c not in plan.predicate_columns)
+            elif action_type == "limit":
+                plan.apply_window(0, params.get("rowNum"))
+            elif action_type == "slice":
+                plan.apply_window(params.get("offset", 0) or 0, params.get("length"))
+            else:
+                break
+            pushed += 1
+        plan.remaining_actions = actions[pushed:]
+        return plan
+
+    @property
+    def has_window(self) -> bool:
+        return self.offset > 0 or self.length is not None
+
+    @property
+    def is_trivial(self) -> bool:
+        return self.columns is None and self.predicate is None and not self.has_window
+
+    def apply_window(self, offset: int, length: Optional[int]):
+        """在当前行窗口上再取 [offset, offset + length)。"""
+        if self.length is not None:
+            remain = max(0, self.length - offset)
+            length = remain if length is None else min(length, remain)
+        self.offset += offset
+        self.length = length
+
+    def scan_columns(self) -> Optional[List[str]]:
+        if self.columns is None:
+            return None
+        return self.columns + [c for c in self.predicate_columns if c not in self.columns]
+
+    def execute(self, source: TableSource) -> pa.RecordBatchReader:
+        """执行下推部分，返回流式结果；剩余 actions 由调用方处理。"""
+        if self.columns is None and self.length is None and not source.is_materialized:
+            # 没有列投影和行窗口时无论如何都要读取整个文件：先物化（写入缓存文件）再从缓存读取，
+            # 后续查询不再重复解析原始文件
+            source.data
+        if self.predicate is None:
+            reader = source.scan(self.scan_columns(), self.offset, self.length)
+        else:
+            reader = source.scan(self.scan_columns(), predicate=self.predicate)
+        schema = reader.schema
+        if self.columns is not None:
+            schema = pa.schema([schema.field(c) for c in self.columns], metadata=schema.metadata)
+
+        def batch_generator():
+            skip = self.offset if self.predicate is not None else 0
+            remain = self.length if self.predicate is not None else None
+            try:
+                for batch in reader:
+                    if self.predicate is not None:
+                        if remain is not None and remain <= 0:
+                            break
+                        batch = filter_batch(batch, self.predicate)
+                        if skip > 0:
+                            skipped = min(skip, batch.num_rows)
+                            batch = batch.slice(skipped)
+                            skip -= skipped
+                        if remain is not None:
+                            batch = batch.slice(0, remain)
+                            remain -= batch.num_rows
+                    if self.columns is not None:
+                        batch = batch.select(self.columns)
+                    if batch.num_rows > 0:
+                        yield batch
+            finally:
+                reader.close()
+
+        return pa.RecordBatchReader.from_batches(schema, batch_generator())
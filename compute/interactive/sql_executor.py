@@ -0,0 +1,107 @@
+from typing import Optional, Tuple
+
+import duckdb
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.fs as fs
+
+from core.config import FairdConfigManager
+from compute.interactive.plan import LogicalPlan, TableSource
+from parser.cache_manager import is_parquet_file
+
+# sql 中引用前序 actions 结果的表名，与原先 duckdb 替换扫描使用的变量名保持一致
+RELATION_NAME = "dataframe"
+_SOURCE_NAME = "__faird_source"
+DEFAULT_BATCH_ROWS = 131072
+
+
+def quote_identifier(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def quote_literal(value: str) -> str:
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def open_connection() -> duckdb.DuckDBPyConnection:
+    """每个请求独立的内存 DuckDB 连接，按 faird.conf 的 [sql] 设置线程数、内存上限和溢出目录。"""
+    con = duckdb.connect()
+    try:
+        config = FairdConfigManager.get_config()
+        threads, memory_limit, temp_directory = config.sql_threads, config.sql_memory_limit, config.sql_temp_directory
+    except Exception:
+        threads, memory_limit, temp_directory = 0, "", ""
+    if threads > 0:
+        con.execute(f"SET threads = {int(threads)}")
+    if memory_limit:
+        con.execute(f"SET memory_limit = {quote_literal(memory_limit)}")
+    if temp_directory:
+        con.execute(f"SET temp_directory = {quote_literal(temp_directory)}")
+    return con
+
+
+def batch_rows() -> int:
+    try:
+        return FairdConfigManager.get_config().sql_batch_rows
+    except Exception:
+        return DEFAULT_BATCH_ROWS
+
+
+def cache_relation(source, actions) -> Optional[Tuple[ds.Dataset, str]]:
+    """
+    前序 actions 都能下推（select / filter / limit / slice）且来源有缓存文件时，返回 (缓存文件的 Arrow dataset, 视图 SQL)：
+    dataset 以 mmap 方式读取缓存文件，filter 作为 dataset 的过滤条件，DuckDB 扫描时再下推自己的列投影和过滤；
+    select 和行窗口写在视图中。其它情况返回 None，由调用方先物化前序结果。
+    """
+    plan = LogicalPlan.from_actions(actions)
+    if plan.remaining_actions:
+        return None
+    cache_path = source._cache_path() if isinstance(source, TableSource) else None
+    if cache_path is None:
+        return None
+    dataset = ds.dataset(cache_path, format="parquet" if is_parquet_file(cache_path) else "ipc",
+                         filesystem=fs.LocalFileSystem(use_mmap=True))
+    if plan.predicate is not None:
+        dataset = dataset.filter(plan.predicate)
+    columns = ", ".join(quote_identifier(c) for c in plan.columns) if plan.columns is not None else "*"
+    view = f"SELECT {columns} FROM {_SOURCE_NAME}"
+    if plan.length is not None:
+        view += f" LIMIT {int(plan.length)}"
+    if plan.offset:
+        view += f" OFFSET {int(plan.offset)}"
+    return dataset, view
+
+
+def sql_stream(relation, sql_str: str, view: Optional[str] = None) -> pa.RecordBatchReader:
+    """
+    在独立的 DuckDB 连接上执行 sql，流式返回结果；连接在结果读完或读取方关闭时释放。
+    relation 为 Arrow dataset / Table / RecordBatchReader，注册为 dataframe 表；
+    指定 view 时 relation 注册为内部表，dataframe 是在其上定义的视图。
+    """
+    con = open_connection()
+    try:
+        if view is None:
+            con.register(RELATION_NAME, relation)
+        else:
+            con.register(_SOURCE_NAME, relation)
+            con.execute(f"CREATE VIEW {RELATION_NAME} AS {view}")
+        result = con.execute(sql_str)
+        # 新版本 duckdb 中 fetch_record_batch 更名为 to_arrow_reader
+        to_reader = getattr(result, "to_arrow_reader", None) or result.fetch_record_batch
+        reader = to_reader(batch_rows())
+    except Exception:
+        con.close()
+        raise
+
+    def batch_generator():
+        try:
+            yield from reader
+        finally:
+            con.close()
+
+    return pa.RecordBatchReader.from_batches(reader.schema, batch_generator())
+
+
+def sql_table(arrow_table: pa.Table, sql_str: str) -> pa.Table:
+    """在物化的表上执行 sql（前序 actions 中有 sort 等无法流式执行的操作时使用）。"""
+    return sql_stream(arrow_table, sql_str).read_all()
@@ -91,6 +91,89 @@ class FairdConfig:
     def neo4j_password(self):
         return self.get('neo4j_password')
 
+    @property
+    def result_cache_max_bytes(self):
+        return int(self.get('cache.result.max_bytes', 1024 * 1024 * 1024))
+
+    @property
+    def result_cache_scope(self):
+        return self.get('cache.result.scope', 'connection')
+
+    @property
+    def arrow_cache_root(self):
+        return os.path.expanduser(self.get('cache.arrow.root', '~/.cache/faird'))
+
+    @property
+    def arrow_cache_max_bytes(self):
+        return int(self.get('cache.arrow.max_bytes', 20 * 1024 * 1024 * 1024))
+
+    @property
+    def arrow_cache_sketches(self):
+        """false：不计算；true：所有列；其它值为逗号分隔的列名，只为这些列计算。"""
+        value = str(self.get('cache.arrow.sketches', 'false')).strip()
+        if value.lower() in ('true', 'false', ''):
+            return value.lower() == 'true'
+        return [column.strip() for column in value.split(',') if column.strip()]
+
+    @property
+    def flight_max_endpoints(self):
+        return int(self.get('flight.endpoints.max', 4))
+
+    @property
+    def flight_endpoint_min_bytes(self):
+        return int(self.get('flight.endpoints.min_bytes', 64 * 1024 * 1024))
+
+    @property
+    def batch_workers(self):
+        return int(self.get('batch.workers', 8))
+
+    @property
+    def blob_workers(self):
+        return int(self.get('blob.workers', 16))
+
+    @property
+    def blob_batch_max_bytes(self):
+        return int(self.get('blob.batch_max_bytes', 64 * 1024 * 1024))
+
+    @property
+    def blob_max_file_bytes(self):
+        return int(self.get('blob.max_file_bytes', 256 * 1024 * 1024))
+
+    @property
+    def sql_threads(self):
+        return int(self.get('sql.threads', 0))
+
+    @property
+    def sql_memory_limit(self):
+        return self.get('sql.memory_limit', '')
+
+    @property
+    def sql_temp_directory(self):
+        return self.get('sql.temp_directory', '')
+
+    @property
+    def sql_batch_rows(self):
+        return int(self.get('sql.batch_rows', 131072))
+
+    @property
+    def map_udf_modules(self):
+        return [module.strip() for module in self.get('map.udf_modules', '').split(',') if module.strip()]
+
+    def cache_format(self, kind):
+        return self.get(f'cache.format.{kind}', 'ipc')
+
+    @property
+    def nc_parse_workers(self):
+        return int(self.get('parser.nc.workers', 1))
+
+    @property
+    def csv_block_size(self):
+        return int(self.get('parser.csv.block_size', 4 * 1024 * 1024))
+
+    @property
+    def csv_parse_threads(self):
+        return int(self.get('parser.csv.threads', 0))
+
 class FairdConfigManager:
     _config = None
 
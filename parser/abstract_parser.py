@@ -1,11 +1,31 @@
+import os
+import threading
 from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import List, Optional
 import pyarrow as pa
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
+
+from core.config import FairdConfigManager
+from parser.cache_manager import (get_cache_manager, read_arrow_file, arrow_file_num_rows, open_cache_writer,
+                                  cache_suffix, is_parquet_file, parquet_row_groups, DEFAULT_CACHE_FORMAT)
+from parser.zone_map import load_zone_map
+
+# count 结果的进程内缓存：(解析器, 版本, 选项, 绝对路径, 大小, mtime) -> 行数
+_COUNT_MEMO = OrderedDict()
+_COUNT_MEMO_SIZE = 4096
+_count_memo_lock = threading.Lock()
 
 class BaseParser(ABC):
     """
     Abstract base class defining the interface for all parsers.
     """
 
+    # .arrow 缓存所在的子目录；解析结果的格式发生变化时递增 CACHE_VERSION 使旧缓存失效
+    CACHE_KIND = "default"
+    CACHE_VERSION = 1
+
     @abstractmethod
     def parse(self, file_path: str) -> pa.Table:
         """
@@ -54,4 +74,173 @@ class BaseParser(ABC):
         Returns:
             int: Arrow Table 的总行数。
         """
-        pass
\ No newline at end of file
+        pass
+
+    def cache_options(self) -> dict:
+        """影响解析结果的选项，参与缓存键的计算。"""
+        return {}
+
+    def cache_format(self) -> str:
+        """缓存文件格式，取自 faird.conf 的 cache.format.<CACHE_KIND>，未加载配置时为不压缩的 Arrow IPC。"""
+        try:
+            return FairdConfigManager.get_config().cache_format(self.CACHE_KIND)
+        except Exception:
+            return DEFAULT_CACHE_FORMAT
+
+    def _cache_key_options(self, cache_format: str) -> dict:
+        options = self.cache_options()
+        # 默认格式不参与缓存键，已有的 .arrow 缓存保持有效
+        if cache_format != DEFAULT_CACHE_FORMAT:
+            options = dict(options, cache_format=cache_format)
+        return options
+
+    def lookup_arrow_cache(self, file_path: str) -> Optional[str]:
+        """返回 file_path 对应的有效缓存路径，源文件修改过或没有缓存时返回 None。"""
+        cache_format = self.cache_format()
+        return get_cache_manager().lookup(file_path, self.CACHE_KIND, type(self).__name__, self.CACHE_VERSION,
+                                          self._cache_key_options(cache_format), cache_suffix(cache_format))
+
+    def write_arrow_cache(self, file_path: str, write_func) -> str:
+        """
+        调用 write_func(临时路径) 写缓存，完成后原子地替换为正式缓存文件，返回缓存路径。
+        write_func 应通过 open_cache_writer 打开写入器，以使用配置的缓存格式。
+        """
+        cache_format = self.cache_format()
+        return get_cache_manager().write(file_path, self.CACHE_KIND, type(self).__name__, self.CACHE_VERSION,
+                                         write_func, self._cache_key_options(cache_format), cache_suffix(cache_format))
+
+    def open_cache_writer(self, path: str, schema: pa.Schema):
+        """按配置的缓存格式打开缓存写入器。"""
+        return open_cache_writer(path, schema, self.cache_format())
+
+    @staticmethod
+    def read_arrow_file(arrow_file_path: str) -> pa.Table:
+        return read_arrow_file(arrow_file_path)
+
+    def cached_count(self, file_path: str, count_func) -> int:
+        """
+        count 的公共缓存逻辑：源文件未修改时直接返回上次的结果；已有 .arrow 缓存时从文件尾读取行数；
+        否则调用 count_func(file_path) 用各格式的元数据计算。
+        """
+        stat = os.stat(file_path)
+        key = (type(self).__name__, self.CACHE_VERSION, str(sorted(self._cache_key_options(self.cache_format()).items())),
+               os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+        with _count_memo_lock:
+            if key in _COUNT_MEMO:
+                _COUNT_MEMO.move_to_end(key)
+                return _COUNT_MEMO[key]
+        arrow_file_path = self.lookup_arrow_cache(file_path)
+        count = arrow_file_num_rows(arrow_file_path) if arrow_file_path is not None else int(count_func(file_path))
+        with _count_memo_lock:
+            _COUNT_MEMO[key] = count
+            while len(_COUNT_MEMO) > _COUNT_MEMO_SIZE:
+                _COUNT_MEMO.popitem(last=False)
+        return count
+
+    def scan(self, file_path: str, columns: Optional[List[str]] = None, offset: int = 0,
+             length: Optional[int] = None, predicate=None) -> pa.RecordBatchReader:
+        """
+        按需读取文件：只返回 columns 指定的列，以及 [offset, offset + length) 范围内的行。
+        默认实现先完整 parse 再裁剪，子类可覆盖以把投影和行范围下推到文件读取中。
+
+        Args:
+            file_path (str): 输入文件路径。
+            columns (Optional[List[str]]): 需要的列，None 表示全部列。
+            offset (int): 起始行。
+            length (Optional[int]): 行数，None 表示读到末尾。
+            predicate (Optional[pc.Expression]): 过滤条件提示，可以据此跳过一定不满足条件的行块，
+                但不保证返回的每一行都满足，调用方仍需逐行过滤。
+        Returns:
+            pa.RecordBatchReader: 按批次流式返回的结果。
+        """
+        table = self.parse(file_path)
+        if columns is not None:
+            table = table.select(columns)
+        table = table.slice(offset, length)
+        return pa.RecordBatchReader.from_batches(table.schema, table.to_batches())
+
+    @staticmethod
+    def scan_arrow_file(arrow_file_path: str, columns: Optional[List[str]] = None, offset: int = 0,
+                        length: Optional[int] = None, predicate=None) -> pa.RecordBatchReader:
+        """
+        从缓存文件中 mmap 读取指定列和行范围，跳过范围之外的 RecordBatch；
+        有 .zonemap 时直接定位到行范围所在的批次，并跳过一定不满足 predicate 的批次；
+        parquet 缓存按行组统计信息跳过行组。
+        """
+        if is_parquet_file(arrow_file_path):
+            return BaseParser.scan_parquet_file(arrow_file_path, columns, offset, length, predicate)
+        source = pa.memory_map(arrow_file_path, "r")
+        reader = ipc.open_file(source)
+        schema = reader.schema if columns is None else pa.schema(
+            [reader.schema.field(c) for c in columns], metadata=reader.schema.metadata)
+        zone_map = load_zone_map(arrow_file_path)
+        if zone_map is not None and zone_map.num_batches == reader.num_record_batches:
+            return BaseParser._scan_with_zone_map(source, reader, zone_map, schema, columns, offset, length, predicate)
+
+        def batch_generator():
+            try:
+                row_start = 0
+                end = None if length is None else offset + length
+                for i in range(reader.num_record_batches):
+                    if end is not None and row_start >= end:
+                        break
+                    batch = reader.get_batch(i)
+                    rows = batch.num_rows
+                    if row_start + rows <= offset:
+                        row_start += rows
+                        continue
+                    lo = max(0, offset - row_start)
+                    hi = rows if end is None else min(rows, end - row_start)
+                    if columns is not None:
+                        batch = batch.select(columns)
+                    yield batch.slice(lo, hi - lo)
+                    row_start += rows
+            finally:
+                source.close()
+
+        return pa.RecordBatchReader.from_batches(schema, batch_generator())
+
+    @staticmethod
+    def _scan_with_zone_map(source, reader, zone_map, schema, columns, offset, length, predicate):
+        batches = zone_map.candidate_batches(predicate, zone_map.batches_in_range(offset, length))
+        end = None if length is None else offset + length
+
+        def batch_generator():
+            try:
+                for i in batches:
+                    row_start, rows = int(zone_map.row_starts[i]), int(zone_map.num_rows[i])
+                    lo = max(0, offset - row_start)
+                    hi = rows if end is None else min(rows, end - row_start)
+                    batch = reader.get_batch(i)
+                    if columns is not None:
+                        batch = batch.select(columns)
+                    yield batch.slice(lo, hi - lo)
+            finally:
+                source.close()
+
+        return pa.RecordBatchReader.from_batches(schema, batch_generator())
+
+    @staticmethod
+    def scan_parquet_file(parquet_file_path: str, columns: Optional[List[str]] = None, offset: int = 0,
+                          length: Optional[int] = None, predicate=None) -> pa.RecordBatchReader:
+        parquet_file = pq.ParquetFile(parquet_file_path, memory_map=True)
+        full_schema = parquet_file.schema_arrow
+        schema = full_schema if columns is None else pa.schema(
+            [full_schema.field(c) for c in columns], metadata=full_schema.metadata)
+        end = None if length is None else offset + length
+        groups = [(i, row_start, rows) for i, row_start, rows in parquet_row_groups(parquet_file, parquet_file_path, predicate)
+                  if row_start + rows > offset and (end is None or row_start < end)]
+
+        def batch_generator():
+            try:
+                for i, row_start, rows in groups:
+                    table = parquet_file.read_row_group(i, columns=columns)
+                    lo = max(0, offset - row_start)
+                    hi = rows if end is None else min(rows, end - row_start)
+                    for batch in table.slice(lo, hi - lo).to_batches():
+                        # parquet 读出的批次不带 schema 元数据，与 IPC 缓存保持一致
+                        yield batch.replace_schema_metadata(schema.metadata)
+            finally:
+                parquet_file.close()
+
+        return pa.RecordBatchReader.from_batches(schema, batch_generator())
@@ -0,0 +1,335 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows 下没有 fcntl，只保证进程内的互斥
+    fcntl = None
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.fs as fs
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
+
+from core.config import FairdConfigManager
+from parser.zone_map import ZoneMapWriter, load_zone_map, zone_map_path
+from utils.logger_utils import get_logger
+logger = get_logger(__name__)
+
+DEFAULT_CACHE_ROOT = os.path.expanduser("~/.cache/faird")
+DEFAULT_CACHE_MAX_BYTES = 20 * 1024 * 1024 * 1024
+
+# 缓存文件格式：
+# - ipc：不压缩的 Arrow IPC，mmap 零拷贝读取；
+# - ipc_lz4 / ipc_zstd：压缩的 Arrow IPC，读取时需要解压；
+# - parquet：zstd 压缩并带行组统计信息，下推的 filter 可以跳过不可能满足条件的行组。
+CACHE_FORMATS = ("ipc", "ipc_lz4", "ipc_zstd", "parquet")
+DEFAULT_CACHE_FORMAT = "ipc"
+PARQUET_SUFFIX = ".parquet"
+# 缓存命中时只在内存中记录访问时间，最多每隔该秒数写回一次 index.json
+ACCESS_FLUSH_INTERVAL = 60
+
+
+class ArrowCacheManager:
+    """
+    解析器的 .arrow 缓存管理：
+    - 以 (绝对路径, 文件大小, mtime, 解析器版本, 解析选项) 的哈希作为缓存键，不同目录下的同名文件不会冲突，
+      源文件被修改后自动失效并删除旧缓存；
+    - 在缓存根目录下维护 index.json 记录每个缓存文件的来源、大小和最近访问时间；
+      修改索引时持有文件锁并重新读取最新内容，多个进程不会互相覆盖；
+      缓存命中只在内存中记录访问时间，每隔 ACCESS_FLUSH_INTERVAL 秒或写入 / 淘汰前合并写回；
+    - 先写入临时文件再 rename，并发解析或进程中断都不会留下不完整的缓存；
+    - 缓存总大小超过上限时按最近访问时间淘汰。
+    """
+
+    INDEX_FILE_NAME = "index.json"
+
+    def __init__(self, root: str = DEFAULT_CACHE_ROOT, max_bytes: int = DEFAULT_CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.base_dir = os.path.join(root, "dataframe")
+        self.index_path = os.path.join(self.base_dir, self.INDEX_FILE_NAME)
+        self._lock = threading.RLock()
+        self._index = None
+        self._index_mtime = None
+        self._pending_access = {}
+        self._last_flush = time.monotonic()
+
+    @staticmethod
+    def make_key(file_path: str, parser_name: str, parser_version, options: Optional[dict] = None) -> str:
+        abs_path = os.path.abspath(file_path)
+        stat = os.stat(abs_path)
+        raw = json.dumps([abs_path, stat.st_size, stat.st_mtime_ns, parser_name, parser_version, options or {}],
+                         sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def cache_dir(self, kind: str) -> str:
+        path = os.path.join(self.base_dir, kind)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def cache_path(self, kind: str, key: str, suffix: str = ".arrow") -> str:
+        return os.path.join(self.cache_dir(kind), key + suffix)
+
+    def lookup(self, file_path: str, kind: str, parser_name: str, parser_version,
+               options: Optional[dict] = None, suffix: str = ".arrow") -> Optional[str]:
+        """返回有效缓存文件的路径并更新其访问时间，没有缓存时返回 None。"""
+        key = self.make_key(file_path, parser_name, parser_version, options)
+        path = self.cache_path(kind, key, suffix)
+        if not os.path.exists(path):
+            return None
+        now = time.time()
+        with self._lock:
+            if key not in self._load_index():
+                with self._index_transaction() as index:
+                    index.setdefault(key, {"source": os.path.abspath(file_path), "kind": kind, "path": path,
+                                           "size": os.path.getsize(path), "last_access": now})
+                return path
+            self._pending_access[key] = now
+            if time.monotonic() - self._last_flush >= ACCESS_FLUSH_INTERVAL:
+                self.flush_access_times()
+        return path
+
+    def flush_access_times(self):
+        """把内存中记录的访问时间写回 index.json。"""
+        with self._index_transaction():
+            pass
+
+    def write(self, file_path: str, kind: str, parser_name: str, parser_version,
+              write_func: Callable[[str], None], options: Optional[dict] = None, suffix: str = ".arrow") -> str:
+        """
+        调用 write_func(临时文件路径) 生成缓存，完成后原子地 rename 为正式缓存文件并登记到索引。
+        同一源文件的旧缓存（源文件已修改或解析器版本变化）会被删除。
+        """
+        key = self.make_key(file_path, parser_name, parser_version, options)
+        path = self.cache_path(kind, key, suffix)
+        tmp_path = f"{path}.tmp-{uuid.uuid4().hex}"
+        try:
+            write_func(tmp_path)
+            os.replace(tmp_path, path)
+            # 写入器生成的 zone map 随缓存文件一起替换，旧的 zone map 不能留给新文件
+            if os.path.exists(zone_map_path(tmp_path)):
+                os.replace(zone_map_path(tmp_path), zone_map_path(path))
+            elif os.path.exists(zone_map_path(path)):
+                os.remove(zone_map_path(path))
+        except BaseException:
+            for leftover in (tmp_path, zone_map_path(tmp_path)):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+            raise
+        source = os.path.abspath(file_path)
+        with self._index_transaction() as index:
+            for stale_key in [k for k, e in index.items()
+                              if e.get("source") == source and e.get("kind") == kind and k != key]:
+                self._remove_entry(index, stale_key)
+            size = os.path.getsize(path)
+            if os.path.exists(zone_map_path(path)):
+                size += os.path.getsize(zone_map_path(path))
+            index[key] = {"source": source, "kind": kind, "path": path, "size": size, "last_access": time.time()}
+            self._evict(index, keep=key)
+        logger.info(f"缓存已写入: {path}（来源 {source}）")
+        return path
+
+    def get_or_create(self, file_path: str, kind: str, parser_name: str, parser_version,
+                      write_func: Callable[[str], None], options: Optional[dict] = None, suffix: str = ".arrow") -> str:
+        path = self.lookup(file_path, kind, parser_name, parser_version, options, suffix)
+        if path is not None:
+            return path
+        return self.write(file_path, kind, parser_name, parser_version, write_func, options, suffix)
+
+    def total_bytes(self) -> int:
+        with self._lock:
+            return sum(entry.get("size", 0) for entry in self._load_index().values())
+
+    def clear(self):
+        with self._index_transaction() as index:
+            for key in list(index.keys()):
+                self._remove_entry(index, key)
+
+    @contextmanager
+    def _index_transaction(self):
+        """
+        修改索引：持有线程锁和 index.json.lock 文件锁，重新读取磁盘上最新的索引并合并内存中记录的访问时间，
+        内容有变化时原子地写回。不能嵌套调用。
+        """
+        with self._lock:
+            os.makedirs(self.base_dir, exist_ok=True)
+            with open(self.index_path + ".lock", "a") as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+                try:
+                    self._index = None
+                    index = self._load_index()
+                    original = json.dumps(index, sort_keys=True)
+                    for key, last_access in self._pending_access.items():
+                        if key in index:
+                            index[key]["last_access"] = max(index[key].get("last_access", 0), last_access)
+                    self._pending_access.clear()
+                    self._last_flush = time.monotonic()
+                    yield index
+                    if json.dumps(index, sort_keys=True) != original:
+                        self._save_index()
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _evict(self, index: dict, keep: Optional[str] = None):
+        total = sum(entry.get("size", 0) for entry in index.values())
+        if total <= self.max_bytes:
+            return
+        for key, entry in sorted(index.items(), key=lambda item: item[1].get("last_access", 0)):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            total -= entry.get("size", 0)
+            logger.info(f"缓存超出上限 {self.max_bytes} 字节，淘汰: {entry.get('path')}")
+            self._remove_entry(index, key)
+
+    def _remove_entry(self, index: dict, key: str):
+        # Linux 下删除正在被 mmap 的文件是安全的，已打开的表在释放前仍然可用
+        entry = index.pop(key, None)
+        if entry is None:
+            return
+        for path in (entry["path"], zone_map_path(entry["path"])):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"删除缓存文件失败 {path}: {e}")
+
+    def _load_index(self) -> dict:
+        # 其它进程（多个 server worker）更新过索引时重新加载
+        mtime = os.path.getmtime(self.index_path) if os.path.exists(self.index_path) else None
+        if self._index is None or mtime != self._index_mtime:
+            self._index = {}
+            self._index_mtime = mtime
+            if os.path.exists(self.index_path):
+                try:
+                    with open(self.index_path, "r", encoding="utf-8") as f:
+                        self._index = json.load(f)
+                except (OSError, ValueError) as e:
+                    logger.warning(f"缓存索引损坏，将重建: {e}")
+            # 清理索引中已不存在的缓存文件
+            for key in [k for k, e in self._index.items() if not os.path.exists(e.get("path", ""))]:
+                del self._index[key]
+        return self._index
+
+    def _save_index(self):
+        os.makedirs(self.base_dir, exist_ok=True)
+        tmp_path = f"{self.index_path}.tmp-{uuid.uuid4().hex}"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._index, f)
+        os.replace(tmp_path, self.index_path)
+        self._index_mtime = os.path.getmtime(self.index_path)
+
+
+def cache_suffix(cache_format: str) -> str:
+    return PARQUET_SUFFIX if cache_format == "parquet" else ".arrow"
+
+
+def is_parquet_file(path: str) -> bool:
+    return path.endswith(PARQUET_SUFFIX)
+
+
+def open_cache_writer(path: str, schema: pa.Schema, cache_format: str = DEFAULT_CACHE_FORMAT):
+    """
+    按缓存格式打开写入器，返回值支持 with 语句以及 write_batch / write_table。
+    parquet 每次 write_batch 写为一个或多个行组，行组与解析器输出的批次对齐；
+    IPC 格式同时在旁边生成记录每个批次 min / max / null 的 .zonemap 文件，
+    cache.arrow.sketches 开启时其中还包含各列（或指定列）的 HyperLogLog。
+    """
+    if cache_format not in CACHE_FORMATS:
+        raise ValueError(f"不支持的缓存格式: {cache_format}，可选 {CACHE_FORMATS}")
+    if cache_format == "parquet":
+        return pq.ParquetWriter(path, schema, compression="zstd", write_statistics=True)
+    compression = {"ipc_lz4": "lz4", "ipc_zstd": "zstd"}.get(cache_format)
+    writer = ipc.new_file(path, schema, options=ipc.IpcWriteOptions(compression=compression))
+    try:
+        sketches = FairdConfigManager.get_config().arrow_cache_sketches
+    except Exception:
+        sketches = False
+    return ZoneMapWriter(writer, path, schema, sketches)
+
+
+def arrow_file_num_rows(arrow_file_path: str) -> int:
+    """
+    只读取元数据得到缓存文件的总行数，不读取、不解压数据：
+    parquet 读取文件尾部的元数据；IPC 优先使用 .zonemap 中记录的各批次行数，
+    没有时由 Arrow dataset 只读取各批次的消息头计数。
+    """
+    if is_parquet_file(arrow_file_path):
+        return pq.ParquetFile(arrow_file_path).metadata.num_rows
+    zone_map = load_zone_map(arrow_file_path)
+    if zone_map is not None:
+        return int(zone_map.num_rows.sum())
+    return ds.dataset(arrow_file_path, format="ipc", filesystem=fs.LocalFileSystem(use_mmap=True)).count_rows()
+
+
+def arrow_file_schema(arrow_file_path: str) -> pa.Schema:
+    """只读取元数据得到缓存文件的 schema。"""
+    if is_parquet_file(arrow_file_path):
+        return pq.read_schema(arrow_file_path)
+    with pa.memory_map(arrow_file_path, "r") as source:
+        return ipc.open_file(source).schema
+
+
+def read_arrow_file(arrow_file_path: str) -> pa.Table:
+    """以 memory map 方式读取缓存文件；不压缩的 IPC 为零拷贝，压缩 IPC 和 parquet 需要解压到内存。"""
+    if is_parquet_file(arrow_file_path):
+        return pq.read_table(arrow_file_path, memory_map=True)
+    with pa.memory_map(arrow_file_path, "r") as source:
+        return ipc.open_file(source).read_all()
+
+
+def parquet_row_groups(parquet_file: pq.ParquetFile, path: str, predicate=None):
+    """
+    返回 [(行组编号, 起始行, 行数)]。有谓词时用行组的 min/max/null 统计排除一定不满足谓词的行组，
+    被排除的行组仍计入行号，保证 offset 的语义不变。
+    """
+    metadata = parquet_file.metadata
+    candidates = None
+    if predicate is not None:
+        fragment = ds.ParquetFileFormat().make_fragment(path, filesystem=fs.LocalFileSystem())
+        try:
+            candidates = {rg.id for piece in fragment.split_by_row_group(predicate, schema=parquet_file.schema_arrow)
+                          for rg in piece.row_groups}
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError, TypeError) as e:
+            logger.warning(f"无法用行组统计信息评估谓词，读取全部行组: {e}")
+    groups = []
+    row_start = 0
+    for i in range(metadata.num_row_groups):
+        rows = metadata.row_group(i).num_rows
+        if candidates is None or i in candidates:
+            groups.append((i, row_start, rows))
+        row_start += rows
+    return groups
+
+
+_cache_manager = None
+_cache_manager_lock = threading.Lock()
+
+
+def get_cache_manager() -> ArrowCacheManager:
+    """
+    返回全局缓存管理器。缓存根目录和大小上限取自 faird.conf 的 cache.arrow.root / cache.arrow.max_bytes，
+    未加载配置时（如单独使用 parser）使用 ~/.cache/faird。
+    """
+    global _cache_manager
+    try:
+        config = FairdConfigManager.get_config()
+        root, max_bytes = config.arrow_cache_root, config.arrow_cache_max_bytes
+    except Exception:
+        root, max_bytes = DEFAULT_CACHE_ROOT, DEFAULT_CACHE_MAX_BYTES
+    with _cache_manager_lock:
+        if _cache_manager is None or _cache_manager.root != root or _cache_manager.max_bytes != max_bytes:
+            _cache_manager = ArrowCacheManager(root, max_bytes)
+        return _cache_manager
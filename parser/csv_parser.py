@@ -1,36 +1,270 @@
 import pyarrow as pa
 import pyarrow.csv as csv
 import pyarrow.ipc as ipc
+import io
 import os
+import re
+import numpy as np
+from typing import List, Optional
 
+from core.config import FairdConfigManager
 from parser.abstract_parser import BaseParser
+from parser.cache_manager import open_cache_writer, DEFAULT_CACHE_FORMAT
 from utils.logger_utils import get_logger
 logger = get_logger(__name__)
 
+SAMPLE_ROWS = 10
+# 采样时每次读取的块大小，一般第一个块即可得到足够的行
+SAMPLE_BLOCK_BYTES = 256 * 1024
+COUNT_CHUNK_BYTES = 16 * 1024 * 1024
+DEFAULT_BLOCK_SIZE = 4 * 1024 * 1024
+_CONVERSION_ERROR = re.compile(r"column #(\d+).*invalid value '(.*)'", re.S)
+_QUOTE, _LF, _CR = ord('"'), ord("\n"), ord("\r")
+
+
+def get_read_options(block_size: Optional[int] = None, threads: Optional[int] = None) -> csv.ReadOptions:
+    """
+    根据 parser.csv.block_size / parser.csv.threads 配置生成 ReadOptions，未加载配置时使用默认值。
+    threads 为 1 时单线程解析，其它值使用 Arrow 全局线程池；线程池是进程内全局的，
+    其大小只在服务启动时按 parser.csv.threads 设置一次，不在每次解析时修改。
+    """
+    try:
+        config = FairdConfigManager.get_config()
+        block_size = block_size or config.csv_block_size
+        threads = config.csv_parse_threads if threads is None else threads
+    except Exception:
+        block_size = block_size or DEFAULT_BLOCK_SIZE
+        threads = 0 if threads is None else threads
+    return csv.ReadOptions(block_size=block_size, use_threads=threads != 1)
+
+
+def _is_string_type(data_type: pa.DataType) -> bool:
+    return pa.types.is_string(data_type) or pa.types.is_large_string(data_type) or pa.types.is_binary(data_type)
+
+
+def merge_csv_type(current: pa.DataType, value_type: pa.DataType) -> pa.DataType:
+    """按 read_csv 的推断规则合并类型：空列取新类型，整数与浮点合并为 float64，其余不一致的情况退化为 string。"""
+    if pa.types.is_null(current) or current == value_type:
+        return value_type
+    if pa.types.is_null(value_type):
+        return current
+    if (pa.types.is_integer(current) or pa.types.is_floating(current)) and \
+            (pa.types.is_integer(value_type) or pa.types.is_floating(value_type)):
+        return pa.float64()
+    return pa.string()
+
+
+def widen_csv_type(current: pa.DataType, value: str) -> Optional[pa.DataType]:
+    """
+    open_csv 只用第一个块推断类型，后续块出现不兼容的值时按 read_csv 的推断规则放宽类型。无法再放宽时返回 None。
+    """
+    if _is_string_type(current):
+        return None
+    quoted = '"' + value.replace('"', '""') + '"'
+    value_type = csv.read_csv(io.BytesIO(("v\n" + quoted + "\n").encode("utf-8"))).schema.field(0).type
+    return merge_csv_type(current, value_type)
+
+
+def _infer_csv_type(values: pa.Array) -> pa.DataType:
+    """用 read_csv 推断一列字符串值的类型。"""
+    buffer = io.BytesIO()
+    csv.write_csv(pa.table({"v": values}), buffer)
+    return csv.read_csv(io.BytesIO(buffer.getvalue())).schema.field(0).type
+
+
+def discover_csv_types(file_path: str, schema: pa.Schema,
+                       read_options: Optional[csv.ReadOptions] = None) -> dict:
+    """
+    流式扫描一遍 CSV，把 schema 中的列按字符串读取，从首个块推断出的 schema 出发逐块放宽类型，
+    返回可以转换整个文件的 {列名: 类型}。能转换为当前类型的块直接跳过，只有不兼容的块才重新推断类型。
+    """
+    read_options = read_options or get_read_options()
+    column_types = {field.name: field.type for field in schema}
+    reader = csv.open_csv(file_path, read_options=read_options, convert_options=csv.ConvertOptions(
+        column_types={name: pa.string() for name in column_types}, include_columns=list(column_types),
+        strings_can_be_null=True))
+    for batch in reader:
+        for name, column in zip(batch.schema.names, batch.columns):
+            current = column_types[name]
+            if _is_string_type(current) or column.null_count == len(column):
+                continue
+            if not pa.types.is_null(current):
+                try:
+                    column.cast(current)
+                    continue
+                except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+                    pass
+            column_types[name] = merge_csv_type(current, _infer_csv_type(column))
+    return column_types
+
+
+def convert_csv_to_cache(file_path: str, cache_path: str, read_options: Optional[csv.ReadOptions] = None,
+                         cache_format: str = DEFAULT_CACHE_FORMAT) -> pa.Schema:
+    """
+    流式把 CSV 转换为缓存文件：open_csv 逐块解析，每个块解析完即写入，内存占用与块大小相关而不是与文件大小相关。
+    后续块类型与推断结果不一致时，扫描一遍文件确定所有列的类型后只重新转换一次，
+    而不是每放宽一列就从头转换。
+    """
+    read_options = read_options or get_read_options()
+    column_types = {}
+    discovered = False
+    while True:
+        reader = csv.open_csv(file_path, read_options=read_options,
+                              convert_options=csv.ConvertOptions(column_types=column_types))
+        try:
+            with open_cache_writer(cache_path, reader.schema, cache_format) as writer:
+                for batch in reader:
+                    writer.write_batch(batch)
+            return reader.schema
+        except pa.ArrowInvalid as e:
+            match = _CONVERSION_ERROR.search(str(e))
+            if match is None:
+                raise
+            if not discovered:
+                discovered = True
+                logger.warning(f"CSV 后续块与推断的类型不一致，扫描全文件确定列类型后重新转换: {file_path}")
+                column_types = discover_csv_types(file_path, reader.schema, read_options)
+                continue
+            # 扫描得到的类型仍不能转换时（推断规则与转换规则的细微差异），逐列放宽
+            field = reader.schema.field(int(match.group(1)))
+            new_type = widen_csv_type(field.type, match.group(2))
+            if new_type is None or new_type == field.type:
+                raise
+            logger.warning(f"CSV 列 {field.name} 的类型由 {field.type} 放宽为 {new_type}，重新转换: {file_path}")
+            column_types[field.name] = new_type
+
+
+def count_csv_rows(file_path: str, chunk_bytes: int = COUNT_CHUNK_BYTES) -> int:
+    """
+    不解析字段，按块扫描字节统计 CSV 数据行数，结果与 pyarrow.csv.read_csv 的默认选项一致：
+    - 行尾为 \n、\r\n 或单独的 \r；
+    - 引号内的换行不算行尾（"" 转义出现两次引号，不改变奇偶）；
+    - 空行（包括 \r\n 之前只有 \r 的行）不计；
+    - 最后一行没有换行符时也计入；
+    - 减去表头一行。
+    """
+    rows = 0
+    quote_parity = 0   # 之前各块中引号个数的奇偶
+    line_start = 0     # 当前行在文件中的起始偏移
+    prev_byte = -1     # 上一块的最后一个字节
+    offset = 0
+    with open(file_path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_bytes)
+            if not chunk:
+                break
+            data = np.frombuffer(chunk, dtype=np.uint8)
+            # 块末尾的 \r 是否单独作为行尾取决于下一块的第一个字节
+            next_byte = f.peek(1)[:1] if data[-1] == _CR else b""
+            following = np.empty_like(data)
+            following[:-1] = data[1:]
+            following[-1] = next_byte[0] if next_byte else 0
+            # uint8 累加溢出按 256 取模，不影响奇偶
+            in_quote = (np.cumsum(data == _QUOTE, dtype=np.uint8) + quote_parity) & 1
+            terminators = ((data == _LF) | ((data == _CR) & (following != _LF))) & (in_quote == 0)
+            newlines = np.flatnonzero(terminators)
+            if newlines.size:
+                starts = np.empty_like(newlines)
+                starts[0] = line_start - offset
+                starts[1:] = newlines[:-1] + 1
+                lengths = newlines - starts
+                before = np.where(newlines > 0, data[np.maximum(newlines - 1, 0)], prev_byte)
+                empty = (lengths == 0) | ((lengths == 1) & (before == _CR))
+                rows += int(newlines.size - np.count_nonzero(empty))
+                line_start = offset + int(newlines[-1]) + 1
+            quote_parity = int(in_quote[-1])
+            prev_byte = int(data[-1])
+            offset += len(chunk)
+    # 文件末尾的 \r 已作为行尾，剩余的非空内容是没有换行符的最后一行
+    if offset > line_start:
+        rows += 1
+    return max(rows - 1, 0)
+
 
 class CSVParser(BaseParser):
     """
     CSV file parser implementing the BaseParser interface.
     """
 
-    def sample(self, file_path:str) -> pa.Table:
+    CACHE_KIND = "csv"
+    # 2: 流式逐块写入
+    CACHE_VERSION = 2
+
+    def sample(self, file_path: str, rows: int = SAMPLE_ROWS, reservoir: bool = False,
+               seed: Optional[int] = None) -> pa.Table:
+        """
+        采样 CSV 文件。
+        默认用 open_csv 流式读取，读够 rows 行即停止，通常只需读取并转换第一个块，耗时与文件大小无关；
+        reservoir=True 时对整个文件做蓄水池抽样，返回按原始顺序排列的 rows 行，代价是需要扫描整个文件。
+        """
         try:
-            logger.info(f"即将读取 CSV 文件: {file_path}")
-            table = csv.read_csv(
-                file_path,
-                read_options=csv.ReadOptions(block_size=1024 * 1024),  # 设置块大小,
-                convert_options=csv.ConvertOptions(),
-                parse_options=csv.ParseOptions()
-            ).slice(0, 10) # 使用 slice 限制行数
-            logger.info(f"成功读取 CSV 文件: {file_path}")
+            logger.info(f"即将采样 CSV 文件: {file_path}（reservoir={reservoir}）")
+            if reservoir:
+                table = self._reservoir_sample(file_path, rows, seed)
+            else:
+                table = self._head_sample(file_path, rows)
+            logger.info(f"成功采样 CSV 文件: {file_path}")
             return table
         except Exception as e:
             logger.error(f"读取 CSV 文件时出错: {e}")
             raise
 
+    @staticmethod
+    def _head_sample(file_path: str, rows: int) -> pa.Table:
+        reader = csv.open_csv(file_path, read_options=csv.ReadOptions(block_size=SAMPLE_BLOCK_BYTES))
+        batches = []
+        remain = rows
+        for batch in reader:
+            batches.append(batch.slice(0, remain))
+            remain -= batches[-1].num_rows
+            if remain <= 0:
+                break
+        return pa.Table.from_batches(batches, schema=reader.schema)
+
+    def _reservoir_sample(self, file_path: str, rows: int, seed: Optional[int]) -> pa.Table:
+        """
+        给每一行分配一个 [0, 1) 的随机键，保留键最小的 rows 行，等价于蓄水池抽样；
+        逐批处理，内存中只保留当前批和 rows 行的候选。
+        """
+        arrow_file_path = self.lookup_arrow_cache(file_path)
+        if arrow_file_path is not None:
+            return self._reservoir_from_reader(self.scan_arrow_file(arrow_file_path), rows, seed)
+        read_options = csv.ReadOptions(block_size=1024 * 1024)
+        reader = csv.open_csv(file_path, read_options=read_options)
+        try:
+            return self._reservoir_from_reader(reader, rows, seed)
+        except pa.ArrowInvalid as e:
+            # open_csv 只用首个块推断类型，后续块类型不一致时扫描确定列类型后重新流式抽样
+            logger.warning(f"流式采样 CSV 文件时类型不一致，确定列类型后重新采样: {e}")
+            column_types = discover_csv_types(file_path, reader.schema, read_options)
+            reader = csv.open_csv(file_path, read_options=read_options,
+                                  convert_options=csv.ConvertOptions(column_types=column_types))
+            return self._reservoir_from_reader(reader, rows, seed)
+
+    @staticmethod
+    def _reservoir_from_reader(reader: pa.RecordBatchReader, rows: int, seed: Optional[int]) -> pa.Table:
+        rng = np.random.default_rng(seed)
+        keys = np.empty(0)
+        positions = np.empty(0, dtype=np.int64)
+        kept = []
+        row_start = 0
+        for batch in reader:
+            batch_keys = rng.random(batch.num_rows)
+            keys = np.concatenate([keys, batch_keys])
+            positions = np.concatenate([positions, np.arange(row_start, row_start + batch.num_rows)])
+            kept.append(batch)
+            row_start += batch.num_rows
+            if keys.size > rows:
+                order = np.argpartition(keys, rows)[:rows]
+                table = pa.Table.from_batches(kept, schema=reader.schema)
+                kept = table.take(pa.array(order)).combine_chunks().to_batches()
+                keys, positions = keys[order], positions[order]
+        table = pa.Table.from_batches(kept, schema=reader.schema)
+        return table.take(pa.array(np.argsort(positions)))
+
     def parse(self, file_path: str) -> pa.Table:
         """
-        Save the CSV file as a .arrow file and load it into memory as a pyarrow Table using zero-copy.
+        Convert the CSV file to a .arrow file block by block and load it as a pyarrow Table using zero-copy.
 
         Args:
             file_path (str): Path to the input CSV file.
@@ -38,36 +272,73 @@ class CSVParser(BaseParser):
             pa.Table: A pyarrow Table object.
         """
 
-        # Ensure the cache directory exists
-        DEFAULT_ARROW_CACHE_PATH = os.path.expanduser("~/.cache/faird/dataframe/csv/")
-        os.makedirs(os.path.dirname(DEFAULT_ARROW_CACHE_PATH), exist_ok=True)
+        arrow_file_path = self.lookup_arrow_cache(file_path)
+        if arrow_file_path is not None:
+            logger.info(f"检测到缓存文件，直接从 {arrow_file_path} 读取 Arrow Table。")
+            return self.read_arrow_file(arrow_file_path)
 
-        # Extract the file name and append the .arrow suffix
-        arrow_file_name = os.path.basename(file_path).rsplit(".", 1)[0] + ".arrow"
-        arrow_file_path = os.path.join(DEFAULT_ARROW_CACHE_PATH, arrow_file_name)
+        def write_func(path):
+            logger.info(f"即将流式转换 CSV 文件: {file_path}")
+            convert_csv_to_cache(file_path, path, cache_format=self.cache_format())
+            logger.info(f"成功转换 CSV 文件: {file_path}")
 
-        # Read the CSV file into a pyarrow Table
         try:
-            logger.info(f"即将读取 CSV 文件: {file_path}")
-            table = csv.read_csv(file_path)
-            logger.info(f"成功读取 CSV 文件: {file_path}")
+            arrow_file_path = self.write_arrow_cache(file_path, write_func)
         except Exception as e:
-            logger.info(f"读取 CSV 文件时出错: {e}")
+            logger.info(f"转换 CSV 文件为 .arrow 文件时出错: {e}")
             raise
 
         try:
-            with ipc.new_file(arrow_file_path, table.schema) as writer:
-                writer.write_table(table)
+            return self.read_arrow_file(arrow_file_path)
         except Exception as e:
-            logger.info(f"保存 .arrow 文件时出错: {e}")
+            logger.info(f"加载 .arrow 文件时出错: {e}")
             raise
 
+    def scan(self, file_path: str, columns: Optional[List[str]] = None, offset: int = 0,
+             length: Optional[int] = None, predicate=None) -> pa.RecordBatchReader:
+        """
+        按需读取 CSV 文件：指定 length 时只转换 columns 指定的列，流式读取，读够 offset + length 行即停止。
+        不指定 length 时无论如何都要解析整个文件，直接转换为缓存文件后从缓存读取，后续查询不再重复解析；
+        predicate 用于跳过缓存中一定不满足条件的行组。
+        """
+        arrow_file_path = self.lookup_arrow_cache(file_path)
+        if arrow_file_path is None and length is None:
+            self.parse(file_path)
+            arrow_file_path = self.lookup_arrow_cache(file_path)
+        if arrow_file_path is not None:
+            logger.info(f"检测到缓存文件，从 {arrow_file_path} 按需读取。")
+            return self.scan_arrow_file(arrow_file_path, columns, offset, length, predicate)
+        logger.info(f"流式读取 CSV 文件: {file_path}，列: {columns}，行范围: offset={offset}, length={length}")
+        read_options = csv.ReadOptions(block_size=1024 * 1024)
+        include_columns = list(columns) if columns is not None else []
+        reader = csv.open_csv(file_path, read_options=read_options,
+                              convert_options=csv.ConvertOptions(include_columns=include_columns))
         try:
-            with pa.memory_map(arrow_file_path, "r") as source:
-                return ipc.open_file(source).read_all()
-        except Exception as e:
-            logger.info(f"加载 .arrow 文件时出错: {e}")
-            raise
+            table = self._read_window(reader, offset, length)
+        except pa.ArrowInvalid as e:
+            # open_csv 只用首个块推断类型，后续块类型不一致时扫描确定列类型后重新流式读取
+            logger.warning(f"流式读取 CSV 文件时类型不一致，确定列类型后重新读取: {e}")
+            column_types = discover_csv_types(file_path, reader.schema, read_options)
+            reader = csv.open_csv(file_path, read_options=read_options, convert_options=csv.ConvertOptions(
+                column_types=column_types, include_columns=include_columns))
+            table = self._read_window(reader, offset, length)
+        return pa.RecordBatchReader.from_batches(table.schema, table.to_batches())
+
+    @staticmethod
+    def _read_window(reader: pa.RecordBatchReader, offset: int, length: int) -> pa.Table:
+        batches = []
+        row_start = 0
+        end = offset + length
+        for batch in reader:
+            if row_start >= end:
+                break
+            rows = batch.num_rows
+            if row_start + rows > offset:
+                lo = max(0, offset - row_start)
+                hi = min(rows, end - row_start)
+                batches.append(batch.slice(lo, hi - lo))
+            row_start += rows
+        return pa.Table.from_batches(batches, schema=reader.schema)
 
     def write(self, table: pa.Table, output_path: str):
         """
@@ -83,9 +354,11 @@ class CSVParser(BaseParser):
         raise NotImplementedError("CSVParser.write() 尚未实现：当前不支持写回 CSV 文件")
 
     def count(self, file_path: str) -> int:
+        """
+        统计 CSV 数据行数：已有 .arrow 缓存时读取缓存文件尾的元数据，否则按块扫描换行符，不做类型转换。
+        """
         try:
-            table = csv.read_csv(file_path)
-            return table.num_rows
+            return self.cached_count(file_path, count_csv_rows)
         except Exception as e:
             logger.error(f"统计 CSV 文件行数时出错: {e}")
             raise
\ No newline at end of file
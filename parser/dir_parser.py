@@ -5,6 +5,7 @@ import pyarrow.ipc as ipc
 import os
 import uuid
 from parser.abstract_parser import BaseParser
+from parser.cache_manager import get_cache_manager
 from services.datasource.services import *
 from core.config import FairdConfigManager
 from utils.logger_utils import get_logger
@@ -54,8 +55,7 @@ class DirParser(BaseParser):
 
     def parse_dir(self, file_path: str, dataset_name: str) -> pa.Table:
         # Ensure the cache directory exists
-        DEFAULT_ARROW_CACHE_PATH = os.path.expanduser("~/.cache/faird/dataframe/dir/")
-        os.makedirs(os.path.dirname(DEFAULT_ARROW_CACHE_PATH), exist_ok=True)
+        DEFAULT_ARROW_CACHE_PATH = get_cache_manager().cache_dir("dir")
 
         arrow_file_name = str(uuid.uuid4()) + ".arrow"
         arrow_file_path = os.path.join(DEFAULT_ARROW_CACHE_PATH, arrow_file_name)
@@ -1,13 +1,18 @@
 import os
+import shutil
+import multiprocessing
+from collections import Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import pyarrow as pa
 import pyarrow.ipc as ipc
 import xarray as xr
-import dask
 import netCDF4
 import ast
 import cftime
+from typing import List, Optional
 from parser.abstract_parser import BaseParser
+from core.config import FairdConfigManager
 from utils.logger_utils import get_logger
 logger = get_logger(__name__)
 
@@ -24,165 +29,329 @@ def is_large_variable(shape, dtype=np.float64, threshold_mb=50):
     size_mb = np.prod(shape) * dtype_size / 1024 / 1024
     return size_mb > threshold_mb
 
+def get_fill_value(attrs):
+    for k in attrs:
+        if k.lower() in ['_fillvalue', 'missing_value']:
+            return attrs[k]
+    return None
+
+def to_arrow_column(arr_flat, dtype, max_len):
+    """
+    将变量在一个分块内拉平后的数据转为 Arrow 列，不足 max_len 的部分用 NaN 补齐。
+    """
+    # cftime.datetime 类型兼容：转为自 1970-01-01 的天数
+    if arr_flat is not None and arr_flat.size > 0 and isinstance(arr_flat[0], cftime.datetime):
+        arr_flat = np.array([(x - cftime.DatetimeGregorian(1970, 1, 1)).days for x in arr_flat], dtype=np.float64)
+        return pa.array(arr_flat)
+    if arr_flat is None:
+        padded = np.full(max_len, np.nan, dtype=dtype)
+        return pa.array(padded)
+    if len(arr_flat) < max_len:
+        padded = np.full(max_len, np.nan, dtype=dtype)
+        padded[:len(arr_flat)] = arr_flat.astype(dtype)
+        return pa.array(padded)
+    return pa.array(arr_flat.astype(dtype))
+
+def get_parse_workers() -> int:
+    """parser.nc.workers 配置的并行进程数，0 表示按 CPU 核数；未加载配置时为单进程。"""
+    try:
+        workers = FairdConfigManager.get_config().nc_parse_workers
+    except Exception:
+        workers = 1
+    return workers if workers > 0 else (os.cpu_count() or 1)
+
+def align_to_native_chunk(auto_rows: int, native_rows: Optional[int]) -> int:
+    """把按内存估算的主轴切片长度对齐为原生 HDF5 分块长度的整数倍，保证每个原生分块只解压一次。"""
+    if not native_rows:
+        return auto_rows
+    return max(native_rows, auto_rows // native_rows * native_rows)
+
+def plan_windows(shapes, main_axes, native_rows):
+    """
+    计算每个变量每块读取的主轴长度、主轴之外的元素数和总块数。
+    主轴和 shape 相同的变量使用同一个切片长度（对齐到它们原生分块长度的最小公倍数），
+    保证这些变量在同一行上对应同一个坐标。最小公倍数超过按内存估算的切片长度时不再强求，
+    改为对齐到其中最大的原生分块，其余变量跨越分块边界的部分由 ChunkCache 保证只解压一次。
+    """
+    groups = {}
+    for i, shape in enumerate(shapes):
+        groups.setdefault((main_axes[i], tuple(shape)), []).append(i)
+    max_chunks = [0] * len(shapes)
+    for members in groups.values():
+        natives = [native_rows[i] for i in members if native_rows[i]]
+        target = get_auto_chunk_size(shapes[members[0]], dtype=np.float64, target_mem_mb=10)
+        native = int(np.lcm.reduce(natives)) if natives else None
+        if native is not None and native > target:
+            native = max(natives)
+        window = align_to_native_chunk(target, native)
+        for i in members:
+            max_chunks[i] = window
+    other_dims = [int(np.prod(shape[1:])) if len(shape) > 1 else 1 for shape in shapes]
+    main_lens = [shape[0] for shape in shapes]
+    total_chunks = max([int(np.ceil(main_lens[i] / max_chunks[i])) for i in range(len(shapes))]) if shapes else 0
+    return max_chunks, other_dims, total_chunks
+
+def plan_chunk_decodes(main_len: int, window: int, native_rows: Optional[int], other_chunks: int = 1):
+    """按 window 切片读取时，返回 (原生分块数, 需要解压的次数)；切片跨越分块边界时同一分块会被解压多次。"""
+    if not native_rows or main_len <= 0:
+        return 0, 0
+    unique = -(-main_len // native_rows) * other_chunks
+    decodes = 0
+    for start in range(0, main_len, window):
+        end = min(start + window, main_len)
+        decodes += ((end - 1) // native_rows - start // native_rows + 1) * other_chunks
+    return unique, decodes
+
+class ChunkCache:
+    """
+    已解压分块的 LRU 缓存：按原生分块（没有分块的变量按 layout 中的切片长度）读取主轴上的整块数据，
+    多次读取同一分块内的不同行范围时只解压一次，并统计每个分块被解压的次数。
+    """
+
+    def __init__(self, nc, layout: dict, max_bytes: int = 256 * 1024 * 1024):
+        self.nc = nc
+        self.layout = layout
+        self.max_bytes = max_bytes
+        self.decode_counts = Counter()  # (变量名, 分块序号) -> 解压次数
+        self._blocks = OrderedDict()
+        self._total_bytes = 0
+
+    def block_rows(self, i: int) -> int:
+        return self.layout["native_chunks"][i] or self.layout["max_chunks"][i]
+
+    def _block(self, i: int, block_idx: int) -> np.ndarray:
+        v = self.layout["var_names"][i]
+        key = (v, block_idx)
+        block = self._blocks.get(key)
+        if block is not None:
+            self._blocks.move_to_end(key)
+            return block
+        rows = self.block_rows(i)
+        block = np.asarray(self.nc.variables[v][block_idx * rows:min((block_idx + 1) * rows, self.layout["main_lens"][i])])
+        self.decode_counts[key] += 1
+        self._blocks[key] = block
+        self._total_bytes += block.nbytes
+        while self._total_bytes > self.max_bytes and len(self._blocks) > 1:
+            _, evicted = self._blocks.popitem(last=False)
+            self._total_bytes -= evicted.nbytes
+        return block
+
+    def read(self, i: int, row_lo: int, row_hi: int) -> np.ndarray:
+        """读取第 i 个变量主轴上 [row_lo, row_hi) 的数据。"""
+        rows = self.block_rows(i)
+        parts = []
+        for block_idx in range(row_lo // rows, (row_hi - 1) // rows + 1):
+            block = self._block(i, block_idx)
+            base = block_idx * rows
+            parts.append(block[max(row_lo, base) - base:min(row_hi, base + rows) - base])
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+def open_raw_dataset(file_path):
+    """以与 xarray decode_cf=False 一致的方式打开 netCDF4 文件：不做缺测值掩码、scale/offset 和字符转换。"""
+    nc = netCDF4.Dataset(file_path)
+    nc.set_auto_maskandscale(False)
+    nc.set_auto_chartostring(False)
+    return nc
+
+def write_chunk_segment(file_path, layout, chunk_idx, segment_path):
+    """
+    进程池 worker：用独立的 netCDF4 句柄读取第 chunk_idx 块的全部变量，写为一个 Arrow IPC 分段文件。
+    与串行 parse 的读取方式一致（open_raw_dataset + ChunkCache），不做缺测值掩码和 scale/offset 变换。
+    返回 (分段文件路径, 每个 (变量, 分块) 的解压次数)，由主进程汇总。
+    """
+    var_names = layout["var_names"]
+    arrays = [None] * len(var_names)
+    lens = [0] * len(var_names)
+    with open_raw_dataset(file_path) as nc:
+        chunk_cache = ChunkCache(nc, layout)
+        for i, v in enumerate(var_names):
+            start, end = NCParser._chunk_bounds(layout, i, chunk_idx)
+            if start >= end:
+                arr_flat = np.array([], dtype=layout["dtypes"][i])
+            else:
+                arr_flat = chunk_cache.read(i, start, end).flatten()
+            arrays[i] = arr_flat
+            lens[i] = len(arr_flat)
+    max_len = max(lens) if lens else 0
+    for i, arr_flat in enumerate(arrays):
+        arrays[i] = to_arrow_column(arr_flat, np.dtype(layout["dtypes"][i]), max_len)
+    table = pa.table(arrays, names=var_names)
+    with ipc.new_file(segment_path, table.schema) as writer:
+        writer.write_table(table)
+    return segment_path, dict(chunk_cache.decode_counts)
+
 class NCParser(BaseParser):
+    CACHE_KIND = "nc"
+    # 2: 切片长度按原生 HDF5 分块对齐；3: 主轴和 shape 相同的变量共用同一切片长度；
+    # 4: 原生分块的最小公倍数超过按内存估算的切片长度时对齐到最大的原生分块
+    CACHE_VERSION = 4
+
+    def __init__(self, workers: Optional[int] = None):
+        # 首次解析时的并行进程数，None 表示取 faird.conf 中的 parser.nc.workers
+        self.workers = workers
+        # 最近一次 scan 中每个 (变量, 分块) 被解压的次数
+        self.last_decode_counts = {}
+
+    def _read_layout(self, ds, file_path: str) -> dict:
+        """
+        只读取头信息，得到变量、shape、分块方式和带 metadata 的 schema。
+        parse 和 scan 共用同一套分块规则，保证两者产生的行完全一致。
+        """
+        var_names = [v for v in ds.variables if ds[v].ndim > 0]
+        shapes = [tuple(ds[v].shape) for v in var_names]
+        dtypes = [str(ds[v].dtype) for v in var_names]
+        var_attrs = {v: dict(ds[v].attrs) for v in var_names}
+        fill_values = {v: get_fill_value(var_attrs[v]) for v in var_names}
+        global_attrs = dict(ds.attrs)
+        main_axes = [ds[v].dims[0] if ds[v].ndim > 0 else None for v in var_names]
+        main_lens = [ds[v].shape[0] if ds[v].ndim > 0 else 1 for v in var_names]
+        var_dims = {v: ds[v].dims for v in var_names}
+        # 提取压缩参数
+        var_compress = {}
+        native_chunks = []
+        with netCDF4.Dataset(file_path) as nc:
+            file_format = getattr(nc, 'file_format', 'unknown')
+            for v in var_names:
+                var = nc.variables[v]
+                compress_info = {}
+                filters = var.filters() or {}
+                for attr in ['zlib', 'complevel', 'shuffle']:
+                    if attr in filters:
+                        compress_info[attr] = filters[attr]
+                chunking = var.chunking()
+                if isinstance(chunking, list):
+                    compress_info['chunksizes'] = chunking
+                var_compress[v] = compress_info
+                native_chunks.append(chunking if isinstance(chunking, list) else None)
+
+        schema = pa.schema([pa.field(v, pa.from_numpy_dtype(ds[v].dtype)) for v in var_names])
+        meta = {
+            "shapes": str(shapes),
+            "dtypes": str(dtypes),
+            "var_names": str(var_names),
+            "var_attrs": str(var_attrs),
+            "fill_values": str(fill_values),
+            "global_attrs": str(global_attrs),
+            "orig_lengths": str(main_lens),
+            "var_dims": str(var_dims),
+            "file_type": file_format,
+            "var_compress": str(var_compress)
+        }
+        schema = schema.with_metadata({k: str(v).encode() for k, v in meta.items()})
+
+        native_rows = [chunking[0] if chunking else None for chunking in native_chunks]
+        max_chunks, other_dims, total_chunks = plan_windows(shapes, main_axes, native_rows)
+        for i, v in enumerate(var_names):
+            if native_chunks[i]:
+                other_chunks = int(np.prod([-(-n // c) for n, c in zip(shapes[i][1:], native_chunks[i][1:])]))
+                unique, decodes = plan_chunk_decodes(main_lens[i], max_chunks[i], native_rows[i], other_chunks)
+                logger.debug(f"变量 {v} 原生分块 {native_chunks[i]}，切片 {max_chunks[i]} 行，分块数 {unique}，解压次数 {decodes}")
+        return {
+            "var_names": var_names,
+            "shapes": shapes,
+            "dtypes": dtypes,
+            "main_axes": main_axes,
+            "main_lens": main_lens,
+            "other_dims": other_dims,
+            "max_chunks": max_chunks,
+            "native_chunks": native_rows,
+            "total_chunks": total_chunks,
+            "var_compress": var_compress,
+            "schema": schema
+        }
+
+    @staticmethod
+    def _chunk_bounds(layout: dict, i: int, chunk_idx: int):
+        """第 i 个变量在第 chunk_idx 块中的主轴范围 [start, end)。"""
+        start = chunk_idx * layout["max_chunks"][i]
+        end = min(start + layout["max_chunks"][i], layout["main_lens"][i])
+        return start, end
+
+    def _chunk_rows(self, layout: dict, chunk_idx: int) -> int:
+        """第 chunk_idx 块在 Arrow Table 中的行数，即各变量本块拉平后长度的最大值。"""
+        rows = 0
+        for i in range(len(layout["var_names"])):
+            start, end = self._chunk_bounds(layout, i, chunk_idx)
+            rows = max(rows, max(0, end - start) * layout["other_dims"][i])
+        return rows
+
+    def _read_rows(self, chunk_cache: ChunkCache, layout: dict, i: int, chunk_idx: int, lo: int, hi: int):
+        """
+        读取第 i 个变量在第 chunk_idx 块内、拉平后 [lo, hi) 范围的元素，只读取覆盖该范围的主轴切片。
+        超出变量本块长度的部分不返回，由 to_arrow_column 补齐。
+        """
+        start, end = self._chunk_bounds(layout, i, chunk_idx)
+        other_dim = layout["other_dims"][i]
+        hi = min(hi, max(0, end - start) * other_dim)
+        if lo >= hi:
+            return np.array([], dtype=layout["dtypes"][i])
+        row_lo = start + lo // other_dim
+        row_hi = start + (hi + other_dim - 1) // other_dim
+        arr_flat = chunk_cache.read(i, row_lo, row_hi).flatten()
+        skip = lo - (row_lo - start) * other_dim
+        return arr_flat[skip:skip + (hi - lo)]
+
     def parse(self, file_path: str) -> pa.Table:
         """
-        用 xarray+dask 流式分块读取超大 NetCDF 文件，避免 OOM。
-        并提取 dtype、压缩参数等元信息。
+        流式分块读取超大 NetCDF 文件，避免 OOM：xarray 读取布局以及 dtype、压缩参数等元信息，
+        数据按切片通过 ChunkCache 读取，每个原生分块只解压一次。
         兼容 _FillValue 和 missing_value 两种缺测值属性。
         保留原始缺测值（如 -9.96921e+36），不自动转为 np.nan。
         """
-        DEFAULT_ARROW_CACHE_PATH = os.path.expanduser("~/.cache/faird/dataframe/csv/")
-        # DEFAULT_ARROW_CACHE_PATH = os.path.join("D:/faird_cache/dataframe/nc/")
-        os.makedirs(DEFAULT_ARROW_CACHE_PATH, exist_ok=True)
-        arrow_file_name = os.path.basename(file_path).rsplit(".", 1)[0] + ".arrow"
-        arrow_file_path = os.path.join(DEFAULT_ARROW_CACHE_PATH, arrow_file_name)
-
         file_size = os.path.getsize(file_path)
         logger.info(f"NetCDF 文件大小: {file_size} bytes")
 
         try:
-            if os.path.exists(arrow_file_path):
+            arrow_file_path = self.lookup_arrow_cache(file_path)
+            if arrow_file_path is not None:
                 logger.info(f"检测到缓存文件，直接从 {arrow_file_path} 读取 Arrow Table。")
-                with pa.memory_map(arrow_file_path, "r") as source:
-                    return ipc.open_file(source).read_all()
+                return self.read_arrow_file(arrow_file_path)
         except Exception as e:
             logger.error(f"读取缓存 .arrow 文件失败: {e}")
 
         try:
-            logger.info(f"开始用 xarray+dask 读取 NetCDF 文件: {file_path}")
+            logger.info(f"开始读取 NetCDF 文件: {file_path}")
             ds = xr.open_dataset(file_path, chunks={}, decode_cf=False)
-            var_names = [v for v in ds.variables if ds[v].ndim > 0]
-            shapes = [tuple(ds[v].shape) for v in var_names]
-            dtypes = [str(ds[v].dtype) for v in var_names]
-            var_attrs = {v: dict(ds[v].attrs) for v in var_names}
-            def get_fill_value(attrs):
-                for k in attrs:
-                    if k.lower() in ['_fillvalue', 'missing_value']:
-                        return attrs[k]
-                return None
-            fill_values = {v: get_fill_value(var_attrs[v]) for v in var_names}
-            global_attrs = dict(ds.attrs)
-            main_axes = [ds[v].dims[0] if ds[v].ndim > 0 else None for v in var_names]
-            main_lens = [ds[v].shape[0] if ds[v].ndim > 0 else 1 for v in var_names]
-            var_dims = {v: ds[v].dims for v in var_names}
-            # 提取压缩参数
-            var_compress = {}
-            with netCDF4.Dataset(file_path) as nc:
-                file_format = getattr(nc, 'file_format', 'unknown')
-                for v in var_names:
-                    var = nc.variables[v]
-                    compress_info = {}
-                    for attr in ['zlib', 'complevel', 'shuffle', 'chunksizes']:
-                        if hasattr(var, attr):
-                            compress_info[attr] = getattr(var, attr)
-                    var_compress[v] = compress_info
+            layout = self._read_layout(ds, file_path)
+            var_names = layout["var_names"]
+            shapes = layout["shapes"]
 
             logger.info(f"变量列表: {var_names}")
             logger.info(f"变量 shapes: {shapes}")
-            logger.info(f"变量 dtypes: {dtypes}")
+            logger.info(f"变量 dtypes: {layout['dtypes']}")
 
-            schema = pa.schema([pa.field(v, pa.from_numpy_dtype(ds[v].dtype)) for v in var_names])
-            meta = {
-                "shapes": str(shapes),
-                "dtypes": str(dtypes),
-                "var_names": str(var_names),
-                "var_attrs": str(var_attrs),
-                "fill_values": str(fill_values),
-                "global_attrs": str(global_attrs),
-                "orig_lengths": str(main_lens),
-                "var_dims": str(var_dims),
-                "file_type": file_format,
-                "var_compress": str(var_compress)
-            }
-            schema = schema.with_metadata({k: str(v).encode() for k, v in meta.items()})
+            total_chunks = layout["total_chunks"]
+            logger.info(f"总分块数: {total_chunks}")
 
-            large_vars = []
-            small_vars = []
-            for i, shape in enumerate(shapes):
-                if is_large_variable(shape, dtype=np.float64, threshold_mb=50):
-                    large_vars.append((i, var_names[i]))
-                else:
-                    small_vars.append((i, var_names[i]))
+            workers = min(self.workers or get_parse_workers(), total_chunks)
 
-            max_chunks = []
-            for i, shape in enumerate(shapes):
-                chunk = get_auto_chunk_size(shape, dtype=np.float64, target_mem_mb=10)
-                max_chunks.append(chunk)
-            total_chunks = max([int(np.ceil(main_lens[i] / max_chunks[i])) for i in range(len(var_names))])
+            def write_func(path):
+                if workers > 1:
+                    self._write_parallel(file_path, layout, path, workers)
+                else:
+                    write_serial(path)
 
-            logger.info(f"总分块数: {total_chunks}")
+            def write_serial(path):
+                # 与 scan 一样通过 ChunkCache 读取：切片跨越原生分块边界时，同一分块也只解压一次
+                nc = open_raw_dataset(file_path)
+                chunk_cache = ChunkCache(nc, layout)
+                try:
+                    with self.open_cache_writer(path, layout["schema"]) as writer:
+                        for chunk_idx in range(total_chunks):
+                            logger.info(f"处理第 {chunk_idx+1}/{total_chunks} 块")
+                            rows = self._chunk_rows(layout, chunk_idx)
+                            chunk_arrays = []
+                            for i in range(len(var_names)):
+                                arr_flat = self._read_rows(chunk_cache, layout, i, chunk_idx, 0, rows)
+                                chunk_arrays.append(to_arrow_column(arr_flat, np.dtype(layout["dtypes"][i]), rows))
+                            writer.write_table(pa.table(chunk_arrays, names=var_names))
+                finally:
+                    nc.close()
+                    self.last_decode_counts = dict(chunk_cache.decode_counts)
+                    decoded = sum(chunk_cache.decode_counts.values())
+                    logger.info(f"分块解压统计: {len(chunk_cache.decode_counts)} 个分块，共解压 {decoded} 次")
 
-            with ipc.new_file(arrow_file_path, schema) as writer:
-                for chunk_idx in range(total_chunks):
-                    chunk_arrays = [None] * len(var_names)
-                    chunk_lens = [0] * len(var_names)
-                    logger.info(f"处理第 {chunk_idx+1}/{total_chunks} 块")
-                    # 大变量串行
-                    for i, v in large_vars:
-                        safe_chunk_size = max_chunks[i]
-                        main_dim = main_axes[i]
-                        main_len = main_lens[i]
-                        start = chunk_idx * safe_chunk_size
-                        end = min(start + safe_chunk_size, main_len)
-                        logger.debug(f"大变量 {v} 分块: start={start}, end={end}, shape={ds[v].shape}")
-                        if start >= end:
-                            arr_flat = np.array([], dtype=ds[v].dtype)
-                        else:
-                            darr = ds[v].isel({main_dim: slice(start, end)}).data
-                            arr = darr.compute() if hasattr(darr, "compute") else np.array(darr)
-                            arr_flat = np.array(arr).flatten()
-                        chunk_arrays[i] = arr_flat
-                        chunk_lens[i] = len(arr_flat)
-                    # 小变量并行
-                    batch_idxs = [i for i, _ in small_vars]
-                    dask_chunks = []
-                    safe_chunk_sizes = []
-                    for i, v in small_vars:
-                        safe_chunk_size = max_chunks[i]
-                        main_dim = main_axes[i]
-                        main_len = main_lens[i]
-                        start = chunk_idx * safe_chunk_size
-                        end = min(start + safe_chunk_size, main_len)
-                        logger.debug(f"小变量 {v} 分块: start={start}, end={end}, shape={ds[v].shape}")
-                        if start >= end:
-                            dask_chunks.append(np.array([], dtype=ds[v].dtype))
-                        else:
-                            dask_chunks.append(ds[v].isel({main_dim: slice(start, end)}).data)
-                        safe_chunk_sizes.append(safe_chunk_size)
-                    computed_chunks = []
-                    if dask_chunks:
-                        try:
-                            computed_chunks = dask.compute(*dask_chunks, scheduler="threads")
-                        except Exception as e:
-                            logger.warning(f"小变量并行失败，自动降级为串行: {e}")
-                            computed_chunks = []
-                            for chunk in dask_chunks:
-                                computed_chunks.append(chunk.compute() if hasattr(chunk, "compute") else chunk)
-                        for idx, arr in zip(batch_idxs, computed_chunks):
-                            arr_flat = np.array(arr).flatten()
-                            chunk_arrays[idx] = arr_flat
-                            chunk_lens[idx] = len(arr_flat)
-                    # 统一补齐到本次最大长度
-                    max_len_this_chunk = max(chunk_lens) if chunk_lens else 0
-                    for i, arr_flat in enumerate(chunk_arrays):
-                        dtype = ds[var_names[i]].dtype
-                        # cftime.datetime 类型兼容：转为自 1970-01-01 的天数
-                        if arr_flat is not None and arr_flat.size > 0 and isinstance(arr_flat[0], cftime.datetime):
-                            arr_flat = np.array([(x - cftime.DatetimeGregorian(1970, 1, 1)).days for x in arr_flat], dtype=np.float64)
-                            chunk_arrays[i] = pa.array(arr_flat)
-                            continue
-                        if arr_flat is None:
-                            padded = np.full(max_len_this_chunk, np.nan, dtype=dtype)
-                            chunk_arrays[i] = pa.array(padded)
-                        elif len(arr_flat) < max_len_this_chunk:
-                            padded = np.full(max_len_this_chunk, np.nan, dtype=dtype)
-                            padded[:len(arr_flat)] = arr_flat.astype(dtype)
-                            chunk_arrays[i] = pa.array(padded)
-                        else:
-                            chunk_arrays[i] = pa.array(arr_flat.astype(dtype))
-                    table = pa.table(chunk_arrays, names=var_names)
-                    writer.write_table(table)
+            arrow_file_path = self.write_arrow_cache(file_path, write_func)
             ds.close()
             logger.info(f"Arrow Table 已写入缓存文件: {arrow_file_path}")
         except Exception as e:
@@ -191,12 +360,118 @@ class NCParser(BaseParser):
 
         try:
             logger.info(f"从 .arrow 文件 {arrow_file_path} 读取 Arrow Table。")
-            with pa.memory_map(arrow_file_path, "r") as source:
-                return ipc.open_file(source).read_all()
+            return self.read_arrow_file(arrow_file_path)
         except Exception as e:
             logger.error(f"读取 .arrow 文件失败: {e}")
             raise
 
+    def _write_parallel(self, file_path: str, layout: dict, arrow_file_path: str, workers: int):
+        """
+        并行解析：每个分块交给进程池中的 worker 独立读取并写为 IPC 分段文件，
+        主进程按分块顺序把分段拼接进缓存文件，行的顺序与串行解析完全一致。
+        同时在途的分块数限制为 2 * workers，磁盘上的临时分段不会堆积。
+        各 worker 的分块解压次数汇总到 last_decode_counts，跨越两块的原生分块会在两个 worker 中各解压一次。
+        """
+        total_chunks = layout["total_chunks"]
+        decode_counts = Counter()
+        segment_dir = arrow_file_path + ".segments"
+        os.makedirs(segment_dir, exist_ok=True)
+        # 多线程的 server 进程中 fork 不安全（HDF5 句柄和锁会被复制），使用 spawn 启动 worker
+        context = multiprocessing.get_context("spawn")
+        logger.info(f"使用 {workers} 个进程并行解析 NetCDF 文件: {file_path}，总分块数: {total_chunks}")
+        try:
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor, \
+                    self.open_cache_writer(arrow_file_path, layout["schema"]) as writer:
+                futures = {}
+                next_submit = 0
+                for chunk_idx in range(total_chunks):
+                    while next_submit < total_chunks and next_submit < chunk_idx + 2 * workers:
+                        segment_path = os.path.join(segment_dir, f"{next_submit}.arrow")
+                        futures[next_submit] = executor.submit(write_chunk_segment, file_path, layout,
+                                                               next_submit, segment_path)
+                        next_submit += 1
+                    segment_path, counts = futures.pop(chunk_idx).result()
+                    decode_counts.update(counts)
+                    logger.info(f"拼接第 {chunk_idx+1}/{total_chunks} 块")
+                    with pa.memory_map(segment_path, "r") as source:
+                        reader = ipc.open_file(source)
+                        for i in range(reader.num_record_batches):
+                            writer.write_batch(reader.get_batch(i))
+                    os.remove(segment_path)
+        finally:
+            shutil.rmtree(segment_dir, ignore_errors=True)
+            self.last_decode_counts = dict(decode_counts)
+            logger.info(f"分块解压统计: {len(decode_counts)} 个分块，共解压 {sum(decode_counts.values())} 次")
+
+    def _count_from_header(self, file_path: str) -> int:
+        """只用 netCDF4 读取文件头中的维度和分块信息，按与 parse 相同的分块规则计算行数。"""
+        with netCDF4.Dataset(file_path) as nc:
+            variables = [var for var in nc.variables.values() if var.ndim > 0]
+            var_names = [var.name for var in variables]
+            shapes = [tuple(var.shape) for var in variables]
+            main_axes = [var.dimensions[0] for var in variables]
+            native_rows = []
+            for var in variables:
+                chunking = var.chunking()
+                native_rows.append(chunking[0] if isinstance(chunking, list) else None)
+        if not shapes:
+            return 0
+        max_chunks, other_dims, total_chunks = plan_windows(shapes, main_axes, native_rows)
+        layout = {"var_names": var_names, "max_chunks": max_chunks,
+                  "main_lens": [shape[0] for shape in shapes], "other_dims": other_dims}
+        return sum(self._chunk_rows(layout, chunk_idx) for chunk_idx in range(total_chunks))
+
+    def scan(self, file_path: str, columns: Optional[List[str]] = None, offset: int = 0,
+             length: Optional[int] = None, predicate=None) -> pa.RecordBatchReader:
+        """
+        按需读取 NetCDF 文件：只读取选中的变量，只读取与 [offset, offset + length) 行范围相交的分块。
+        行的划分与 parse 完全一致（由 _read_layout 根据 shape 计算），已有缓存时直接读取缓存，predicate 用于跳过缓存中一定不满足条件的行组。
+        """
+        arrow_file_path = self.lookup_arrow_cache(file_path)
+        if arrow_file_path is not None:
+            logger.info(f"检测到缓存文件，从 {arrow_file_path} 按需读取。")
+            return self.scan_arrow_file(arrow_file_path, columns, offset, length, predicate)
+
+        with xr.open_dataset(file_path, decode_cf=False) as ds:
+            layout = self._read_layout(ds, file_path)
+        var_names = layout["var_names"]
+        selected = var_names if columns is None else list(columns)
+        unknown = [c for c in selected if c not in var_names]
+        if unknown:
+            raise ValueError(f"NetCDF 文件中不存在变量: {unknown}")
+        schema = pa.schema([layout["schema"].field(c) for c in selected], metadata=layout["schema"].metadata)
+        end = None if length is None else offset + length
+        logger.info(f"按需读取 NetCDF 文件: {file_path}，变量: {selected}，行范围: offset={offset}, length={length}")
+
+        def batch_generator():
+            nc = open_raw_dataset(file_path)
+            chunk_cache = ChunkCache(nc, layout)
+            try:
+                row_start = 0
+                for chunk_idx in range(layout["total_chunks"]):
+                    if end is not None and row_start >= end:
+                        break
+                    rows = self._chunk_rows(layout, chunk_idx)
+                    if row_start + rows <= offset:
+                        row_start += rows
+                        continue
+                    lo = max(0, offset - row_start)
+                    hi = rows if end is None else min(rows, end - row_start)
+                    arrays = []
+                    for v in selected:
+                        i = var_names.index(v)
+                        arr_flat = self._read_rows(chunk_cache, layout, i, chunk_idx, lo, hi)
+                        arrays.append(to_arrow_column(arr_flat, np.dtype(layout["dtypes"][i]), hi - lo))
+                    yield pa.record_batch(arrays, schema=schema)
+                    row_start += rows
+            finally:
+                nc.close()
+                self.last_decode_counts = dict(chunk_cache.decode_counts)
+                decoded = sum(chunk_cache.decode_counts.values())
+                logger.info(f"分块解压统计: {len(chunk_cache.decode_counts)} 个分块，共解压 {decoded} 次")
+
+        return pa.RecordBatchReader.from_batches(schema, batch_generator())
+
     def write(self, table: pa.Table, output_path: str):
         """
         将 Arrow Table 写回 NetCDF 文件。大文件非常慢。
@@ -502,21 +777,13 @@ class NCParser(BaseParser):
     
     def count(self, file_path: str) -> int:
         """
-        返回解析后 Arrow Table 的总行数（即主变量 shape 的元素数最大值）。
-        新增：记录 Arrow Table 总行数，parse方法生成的Arrow Table总行数 = shape中最高维变量的所有元素数量（即所有主变量shape的乘积）！
-        原理：parse方法通常会将所有主变量（shape大于1的变量）拉平成一维，每一行对应原始nc文件中所有主变量的一个元素（即所有维度的组合），而不是只按第一个维度分块。
-        arrow_table_rows = max(np.prod(shape) for shape in shapes)
+        返回解析后 Arrow Table 的总行数。
+        parse 按块把各变量拉平，每块的行数为该块内各变量拉平后长度的最大值，总行数为各块行数之和；
+        变量主轴切片一致时等于主变量 shape 的元素数最大值。
+        已有 .arrow 缓存时从文件尾读取，否则只读取文件头中的维度和分块信息。
         """
         try:
-            ds = xr.open_dataset(file_path, decode_cf=False)
-            var_names = [v for v in ds.variables if ds[v].ndim > 0]
-            shapes = [tuple(ds[v].shape) for v in var_names]
-            if not shapes:
-                return 0
-            # Arrow Table 行数 = 所有主变量 shape 的元素总数的最大值
-            total_rows = max(np.prod(shape) for shape in shapes)
-            ds.close()
-            return int(total_rows)
+            return self.cached_count(file_path, self._count_from_header)
         except Exception as e:
             logger.error(f"统计 NetCDF 文件 Arrow Table 行数失败: {e}")
             raise
\ No newline at end of file
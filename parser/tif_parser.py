@@ -1,156 +1,275 @@
 import os
+from collections import OrderedDict
 import numpy as np
 import pyarrow as pa
 import pyarrow.ipc as ipc
 import tifffile
+from typing import List, Optional
 from parser.abstract_parser import BaseParser
 from utils.logger_utils import get_logger
 logger = get_logger(__name__)
 
+def is_band_first(shape) -> bool:
+    """(B, H, W) 排列"""
+    return shape[0] in [1, 3, 4] and shape[0] < shape[1] and shape[0] < shape[2]
+
+def is_band_last(shape) -> bool:
+    """(H, W, B) 排列"""
+    return shape[2] in [1, 3, 4] and shape[2] < shape[0] and shape[2] < shape[1]
+
+def band_layout(shape):
+    """
+    根据 TIFF 数据的 shape 计算拆分出的各列，只依赖 shape，不需要读取像素。
+    返回 [(列名, numpy 下标, 原始 shape, 像素数)]，拆分规则与 parse 一致：
+    2D 单页；3D 为 (B, H, W)/(H, W, B) 多波段或 (pages, H, W) 多页；4D 为多页多波段；其它直接拉平。
+    """
+    shape = tuple(shape)
+    if len(shape) == 3 and not is_band_first(shape) and not is_band_last(shape):
+        pages = [((p,), shape[1:]) for p in range(shape[0])]
+    elif len(shape) == 4:
+        pages = [((p,), shape[1:]) for p in range(shape[0])]
+    else:
+        pages = [((), shape)]
+
+    specs = []
+    for idx, (page_index, img_shape) in enumerate(pages):
+        if len(img_shape) == 2:
+            specs.append((f'page{idx+1}_band1', page_index, img_shape, int(np.prod(img_shape))))
+        elif len(img_shape) == 3 and is_band_first(img_shape):
+            for b in range(img_shape[0]):
+                specs.append((f'page{idx+1}_band{b+1}', page_index + (b,), (1, img_shape[1], img_shape[2]),
+                              img_shape[1] * img_shape[2]))
+        elif len(img_shape) == 3 and is_band_last(img_shape):
+            for b in range(img_shape[2]):
+                specs.append((f'page{idx+1}_band{b+1}', page_index + (slice(None), slice(None), b),
+                              (img_shape[0], img_shape[1], 1), img_shape[0] * img_shape[1]))
+        else:
+            specs.append((f'page{idx+1}_flatten', page_index, img_shape, int(np.prod(img_shape))))
+    return specs
+
+def build_schema(specs, dtype) -> pa.Schema:
+    meta = {
+        "shapes": str([band_shape for _, _, band_shape, _ in specs]),
+        "dtypes": str([str(dtype) for _ in specs]),
+        "orig_lengths": str([size for _, _, _, size in specs]),
+        "band_names": str([name for name, _, _, _ in specs])
+    }
+    typ = pa.from_numpy_dtype(dtype)
+    return pa.schema([pa.field(name, typ) for name, _, _, _ in specs]).with_metadata(
+        {k: str(v).encode() for k, v in meta.items()}
+    )
+
+def pad_band(arr, length, dtype):
+    """不足 length 的部分浮点型补 NaN，其它类型补 0。"""
+    if len(arr) >= length:
+        return arr
+    if np.issubdtype(dtype, np.floating):
+        padded = np.full(length, np.nan, dtype=dtype)
+    else:
+        padded = np.zeros(length, dtype=dtype)
+    padded[:len(arr)] = arr
+    return padded
+
+# parse / scan 每个 RecordBatch 的目标字节数
+BATCH_BYTES = 64 * 1024 * 1024
+
+class TiffWindowReader:
+    """
+    按窗口读取 TIFF 像素：根据页的 strip/tile 偏移，只读取并解码与窗口相交的分段，内存占用与窗口大小相关而不是与文件大小相关。
+    支持 series 为若干同形状页的堆叠、每页为 (H, W)、(S, H, W) 平面分离或 (H, W, S) 像素交错的常见布局；
+    其它布局 supported 为 False，由调用方回退为整体读取。
+    已解码的分段按字节预算做 LRU 缓存，像素交错的多个波段共享同一次解码。
+    """
+
+    def __init__(self, tif: tifffile.TiffFile, cache_bytes: int = BATCH_BYTES):
+        series = tif.series[0]
+        self.tif = tif
+        self.shape = tuple(series.shape)
+        self.dtype = series.dtype
+        self.pages = list(series.pages)
+        self.keyframe = self.pages[0].keyframe
+        self.page_shape = tuple(self.keyframe.shape)
+        self.S, depth, self.H, self.W, self.CS = self.keyframe.shaped
+        if self.keyframe.is_tiled:
+            self.seg_rows, self.seg_cols = self.keyframe.tilelength, self.keyframe.tilewidth
+        else:
+            self.seg_rows, self.seg_cols = min(self.keyframe.rowsperstrip or self.H, self.H), self.W
+        self.segs_across = -(-self.W // self.seg_cols)
+        self.segs_per_plane = -(-self.H // self.seg_rows) * self.segs_across
+        self.has_page_axis = self.shape == (len(self.pages),) + self.page_shape
+        self.supported = (
+            depth == 1
+            and (self.has_page_axis or self.shape == self.page_shape)
+            and self.page_shape in ((self.H, self.W), (self.S, self.H, self.W), (self.H, self.W, self.CS))
+            and all(page is not None and tuple(page.shape) == self.page_shape
+                    and len(page.dataoffsets) == self.S * self.segs_per_plane for page in self.pages)
+        )
+        self.cache_bytes = cache_bytes
+        self._segments = OrderedDict()
+        self._cached_bytes = 0
+        self.decode_count = 0
+
+    def column(self, index):
+        """
+        把 band_layout 给出的 numpy 下标转换为 (页号, 平面, 样本)，平面为 None 表示按平面顺序拉平整页，
+        样本为 None 表示取全部交错样本。无法按窗口读取时返回 None。
+        """
+        if not self.supported:
+            return None
+        index = tuple(index)
+        page_no, rest = (index[0], index[1:]) if self.has_page_axis else (0, index)
+        if rest == ():
+            return page_no, (0 if self.S == 1 else None), None
+        if len(self.page_shape) == 3 and self.S > 1 and len(rest) == 1 and isinstance(rest[0], int):
+            return page_no, rest[0], None
+        if (len(self.page_shape) == 3 and self.CS > 1 and len(rest) == 3 and isinstance(rest[2], int)
+                and rest[0] == slice(None) and rest[1] == slice(None)):
+            return page_no, 0, rest[2]
+        return None
+
+    def read(self, column, lo: int, hi: int) -> np.ndarray:
+        """读取列拉平后 [lo, hi) 范围的像素。"""
+        page_no, plane, sample = column
+        unit = self.W * (self.CS if sample is None else 1)
+        if lo >= hi:
+            return np.empty(0, dtype=self.dtype)
+        u0, u1 = lo // unit, -(-hi // unit)
+        if plane is None:
+            pieces = [(s, max(u0, s * self.H) - s * self.H, min(u1, (s + 1) * self.H) - s * self.H)
+                      for s in range(u0 // self.H, (u1 - 1) // self.H + 1)]
+        else:
+            pieces = [(plane, u0, u1)]
+        parts = []
+        for s, r0, r1 in pieces:
+            rows = self._read_rows(page_no, s, r0, r1)
+            if sample is not None:
+                rows = rows[:, :, sample]
+            parts.append(rows.reshape(-1))
+        flat = parts[0] if len(parts) == 1 else np.concatenate(parts)
+        skip = lo - u0 * unit
+        return flat[skip:skip + (hi - lo)]
+
+    def _read_rows(self, page_no: int, s: int, r0: int, r1: int) -> np.ndarray:
+        """读取第 page_no 页第 s 个平面的 [r0, r1) 行，返回 (行数, W, CS)。"""
+        out = np.zeros((r1 - r0, self.W, self.CS), dtype=self.dtype)
+        for ty in range(r0 // self.seg_rows, (r1 - 1) // self.seg_rows + 1):
+            for tx in range(self.segs_across):
+                seg_index = s * self.segs_per_plane + ty * self.segs_across + tx
+                data, position = self._segment(page_no, seg_index)
+                if data is None:
+                    continue
+                y0, x0 = position[2], position[3]
+                y_lo, y_hi = max(r0, y0), min(r1, y0 + data.shape[1], self.H)
+                x_hi = min(x0 + data.shape[2], self.W)
+                out[y_lo - r0:y_hi - r0, x0:x_hi, :] = data[0, y_lo - y0:y_hi - y0, :x_hi - x0, :]
+        return out
+
+    def _segment(self, page_no: int, seg_index: int):
+        key = (page_no, seg_index)
+        cached = self._segments.get(key)
+        if cached is not None:
+            self._segments.move_to_end(key)
+            return cached
+        page = self.pages[page_no]
+        offset, bytecount = page.dataoffsets[seg_index], page.databytecounts[seg_index]
+        if offset == 0 or bytecount == 0:
+            return None, None
+        fh = self.tif.filehandle
+        with fh.lock:
+            fh.seek(offset)
+            raw = fh.read(bytecount)
+        data, position, _ = self.keyframe.decode(raw, seg_index, jpegtables=self.keyframe.jpegtables)
+        self.decode_count += 1
+        self._segments[key] = (data, position)
+        self._cached_bytes += data.nbytes
+        while self._cached_bytes > self.cache_bytes and len(self._segments) > 1:
+            _, (evicted, _) = self._segments.popitem(last=False)
+            self._cached_bytes -= evicted.nbytes
+        return data, position
+
+def window_batches(reader: TiffWindowReader, columns, schema, offset: int, end: int):
+    """按 BATCH_BYTES 切分 [offset, end) 行，逐批读取选中的波段，不足的部分按 pad_band 规则补齐。"""
+    window = max(1, BATCH_BYTES // (np.dtype(reader.dtype).itemsize * max(1, len(columns))))
+    for start in range(offset, end, window):
+        stop = min(start + window, end)
+        arrays = []
+        for (size, column), field in zip(columns, schema):
+            arr = reader.read(column, min(start, size), min(stop, size))
+            arrays.append(pa.array(pad_band(arr, stop - start, reader.dtype), type=field.type))
+        yield pa.record_batch(arrays, schema=schema)
+
 class TIFParser(BaseParser):
+    CACHE_KIND = "tif"
+
     def parse(self, file_path: str) -> pa.Table:
         """
         读取 TIFF 文件为 Arrow Table，保留原始 dtype、shape、波段信息。
         支持多页、多波段。先写入.arrow缓存，再读取返回。
         """
         try:
-            DEFAULT_ARROW_CACHE_PATH = os.path.expanduser("~/.cache/faird/dataframe/tif/")
-            # DEFAULT_ARROW_CACHE_PATH = os.path.join("D:/faird_cache/dataframe/tif/")
-            os.makedirs(DEFAULT_ARROW_CACHE_PATH, exist_ok=True)
-            arrow_file_name = os.path.basename(file_path).rsplit(".", 1)[0] + ".arrow"
-            arrow_file_path = os.path.join(DEFAULT_ARROW_CACHE_PATH, arrow_file_name)
-            if os.path.exists(arrow_file_path):
+            arrow_file_path = self.lookup_arrow_cache(file_path)
+            if arrow_file_path is not None:
                 logger.info(f"检测到缓存文件，直接从 {arrow_file_path} 读取 Arrow Table。")
                 try:
-                    with pa.memory_map(arrow_file_path, "r") as source:
-                        return ipc.open_file(source).read_all()
+                    return self.read_arrow_file(arrow_file_path)
                 except Exception as e:
                     logger.warning(f"读取缓存 .arrow 文件失败，将重新解析TIFF: {e}")
 
             logger.info(f"开始解析 TIFF 文件: {file_path}")
+            with tifffile.TiffFile(file_path) as tif:
+                reader, columns = self._open_window_reader(tif)
+                if reader is not None:
+                    specs = band_layout(reader.shape)
+                    schema = build_schema(specs, reader.dtype)
+                    max_len = max(size for _, _, _, size in specs)
+                    logger.info(f"按窗口解析 TIFF 文件，shape: {reader.shape}, dtype: {reader.dtype}，列数: {len(specs)}，每列长度: {max_len}")
+
+                    def write_windows(path):
+                        with self.open_cache_writer(path, schema) as writer:
+                            for batch in window_batches(reader, columns, schema, 0, max_len):
+                                writer.write_batch(batch)
+
+                    arrow_file_path = self.write_arrow_cache(file_path, write_windows)
+                    logger.info(f"TIFF 解析完成，共解码 {reader.decode_count} 个分段")
+                    return self.read_arrow_file(arrow_file_path)
+
+            logger.info("TIFF 布局不支持按窗口读取，改为整体读取")
             try:
                 images = tifffile.imread(file_path)
             except Exception as e:
                 logger.error(f"TIFF 文件读取失败: {e}")
                 raise
             logger.info(f"TIFF 文件 shape: {images.shape}, dtype: {images.dtype}")
-            # 支持多页
-            if images.ndim == 2:
-                images = [images]
-            elif images.ndim == 3:
-                # (pages, H, W) 或 (H, W, bands)
-                if images.shape[0] in [1, 3, 4] and images.shape[0] < images.shape[1] and images.shape[0] < images.shape[2]:
-                    images = [images]
-                elif images.shape[2] in [1, 3, 4] and images.shape[2] < images.shape[0] and images.shape[2] < images.shape[1]:
-                    images = [images]
-                else:
-                    # 多页
-                    images = [img for img in images]
-            elif images.ndim == 4:
-                # (pages, bands, H, W) 或 (pages, H, W, bands)
-                images = [img for img in images]
-            else:
-                images = [images]
-
-            pa_arrays_raw = []
-            band_names = []
-            orig_lengths = []
-            pa_types = []
-            shapes = []
-            dtypes = []
-
-            for idx, img in enumerate(images):
-                try:
-                    dtype = img.dtype
-                    shape = img.shape
-                    if img.ndim == 2:
-                        arr = img.flatten()
-                        pa_arrays_raw.append(pa.array(arr, type=pa.from_numpy_dtype(dtype)))
-                        pa_types.append(pa.from_numpy_dtype(dtype))
-                        band_names.append(f'page{idx+1}_band1')
-                        orig_lengths.append(arr.size)
-                        shapes.append(shape)
-                        dtypes.append(str(dtype))
-                    elif img.ndim == 3:
-                        # (B, H, W)
-                        if img.shape[0] in [1, 3, 4] and img.shape[0] < img.shape[1] and img.shape[0] < img.shape[2]:
-                            for b in range(img.shape[0]):
-                                arr = img[b, :, :].flatten()
-                                pa_arrays_raw.append(pa.array(arr, type=pa.from_numpy_dtype(dtype)))
-                                pa_types.append(pa.from_numpy_dtype(dtype))
-                                band_names.append(f'page{idx+1}_band{b+1}')
-                                orig_lengths.append(arr.size)
-                                shapes.append((1, img.shape[1], img.shape[2]))
-                                dtypes.append(str(dtype))
-                        # (H, W, B)
-                        elif img.shape[2] in [1, 3, 4] and img.shape[2] < img.shape[0] and img.shape[2] < img.shape[1]:
-                            for b in range(img.shape[2]):
-                                arr = img[:, :, b].flatten()
-                                pa_arrays_raw.append(pa.array(arr, type=pa.from_numpy_dtype(dtype)))
-                                pa_types.append(pa.from_numpy_dtype(dtype))
-                                band_names.append(f'page{idx+1}_band{b+1}')
-                                orig_lengths.append(arr.size)
-                                shapes.append((img.shape[0], img.shape[1], 1))
-                                dtypes.append(str(dtype))
-                        else:
-                            arr = img.flatten()
-                            pa_arrays_raw.append(pa.array(arr, type=pa.from_numpy_dtype(dtype)))
-                            pa_types.append(pa.from_numpy_dtype(dtype))
-                            band_names.append(f'page{idx+1}_flatten')
-                            orig_lengths.append(arr.size)
-                            shapes.append(shape)
-                            dtypes.append(str(dtype))
-                    else:
-                        arr = img.flatten()
-                        pa_arrays_raw.append(pa.array(arr, type=pa.from_numpy_dtype(dtype)))
-                        pa_types.append(pa.from_numpy_dtype(dtype))
-                        band_names.append(f'page{idx+1}_flatten')
-                        orig_lengths.append(arr.size)
-                        shapes.append(shape)
-                        dtypes.append(str(dtype))
-                except Exception as e:
-                    logger.error(f"处理第{idx+1}页/波段时异常: {e}")
-                    raise
 
+            specs = band_layout(images.shape)
             try:
-                max_len = max(len(arr) for arr in pa_arrays_raw)
+                max_len = max(size for _, _, _, size in specs)
             except Exception as e:
                 logger.error(f"计算最大长度异常: {e}")
                 raise
 
             pa_arrays = []
-            for arr, typ in zip(pa_arrays_raw, pa_types):
+            typ = pa.from_numpy_dtype(images.dtype)
+            for name, index, _, _ in specs:
                 try:
-                    if len(arr) < max_len:
-                        if pa.types.is_floating(typ):
-                            padded = np.full(max_len, np.nan, dtype=typ.to_pandas_dtype())
-                        else:
-                            padded = np.zeros(max_len, dtype=typ.to_pandas_dtype())
-                        padded[:len(arr)] = arr.to_numpy()
-                        pa_arrays.append(pa.array(padded, type=typ))
-                    else:
-                        pa_arrays.append(arr)
+                    arr = images[index].flatten()
+                    pa_arrays.append(pa.array(pad_band(arr, max_len, images.dtype), type=typ))
                 except Exception as e:
-                    logger.error(f"补齐列时异常: {e}")
+                    logger.error(f"处理 {name} 时异常: {e}")
                     raise
 
-            meta = {
-                "shapes": str(shapes),
-                "dtypes": str(dtypes),
-                "orig_lengths": str(orig_lengths),
-                "band_names": str(band_names)
-            }
             try:
-                schema = pa.schema([pa.field(n, t) for n, t in zip(band_names, pa_types)]).with_metadata(
-                    {k: str(v).encode() for k, v in meta.items()}
-                )
+                schema = build_schema(specs, images.dtype)
                 table = pa.table(pa_arrays, schema=schema)
-                logger.info(f"TIFF 解析完成，列数: {len(table.column_names)}，每列长度: {max_len}，写入缓存 {arrow_file_path}")
-                with ipc.new_file(arrow_file_path, schema) as writer:
-                    writer.write_table(table)
+                logger.info(f"TIFF 解析完成，列数: {len(table.column_names)}，每列长度: {max_len}，写入缓存")
+
+                def write_func(path):
+                    with self.open_cache_writer(path, schema) as writer:
+                        writer.write_table(table)
+
+                arrow_file_path = self.write_arrow_cache(file_path, write_func)
                 # 再从.arrow读取返回
-                with pa.memory_map(arrow_file_path, "r") as source:
-                    return ipc.open_file(source).read_all()
+                return self.read_arrow_file(arrow_file_path)
             except Exception as e:
                 logger.error(f"写入或读取 Arrow 缓存异常: {e}")
                 raise
@@ -158,6 +277,77 @@ class TIFParser(BaseParser):
             logger.error(f"TIFF 解析失败: {e}")
             raise
 
+    @staticmethod
+    def _open_window_reader(tif: tifffile.TiffFile):
+        """返回 (TiffWindowReader, [(像素数, 列描述)])，布局不支持按窗口读取时返回 (None, None)。"""
+        if len(tif.series) == 0:
+            raise ValueError("TIFF 文件无有效页")
+        try:
+            reader = TiffWindowReader(tif)
+        except Exception as e:
+            logger.warning(f"无法按分段读取 TIFF 文件: {e}")
+            return None, None
+        columns = [(size, reader.column(index)) for _, index, _, size in band_layout(reader.shape)]
+        if any(column is None for _, column in columns):
+            return None, None
+        return reader, columns
+
+    @staticmethod
+    def _count_from_tags(file_path: str) -> int:
+        with tifffile.TiffFile(file_path) as tif:
+            if len(tif.series) == 0:
+                raise ValueError("TIFF 文件无有效页")
+            shape = tif.series[0].shape
+        return max(size for _, _, _, size in band_layout(shape))
+
+    def scan(self, file_path: str, columns: Optional[List[str]] = None, offset: int = 0,
+             length: Optional[int] = None, predicate=None) -> pa.RecordBatchReader:
+        """
+        按需读取 TIFF 文件：列（页/波段）划分由文件头中的 shape 得到，只解码与选中波段和行范围相交的 strip/tile。
+        已有缓存时直接读取缓存，predicate 用于跳过缓存中一定不满足条件的行组。
+        """
+        arrow_file_path = self.lookup_arrow_cache(file_path)
+        if arrow_file_path is not None:
+            logger.info(f"检测到缓存文件，从 {arrow_file_path} 按需读取。")
+            return self.scan_arrow_file(arrow_file_path, columns, offset, length, predicate)
+
+        with tifffile.TiffFile(file_path) as tif:
+            if len(tif.series) == 0:
+                raise ValueError("TIFF 文件无有效页")
+            shape = tif.series[0].shape
+            dtype = tif.series[0].dtype
+        specs = band_layout(shape)
+        full_schema = build_schema(specs, dtype)
+        names = [name for name, _, _, _ in specs]
+        selected = names if columns is None else list(columns)
+        unknown = [c for c in selected if c not in names]
+        if unknown:
+            raise ValueError(f"TIFF 文件中不存在波段: {unknown}")
+        schema = pa.schema([full_schema.field(c) for c in selected], metadata=full_schema.metadata)
+        max_len = max(size for _, _, _, size in specs)
+        end = max_len if length is None else min(max_len, offset + length)
+        logger.info(f"按需读取 TIFF 文件: {file_path}，波段: {selected}，行范围: offset={offset}, length={length}")
+
+        def batch_generator():
+            if offset >= end:
+                return
+            with tifffile.TiffFile(file_path) as tif:
+                reader, all_columns = self._open_window_reader(tif)
+                if reader is not None:
+                    selected_columns = [all_columns[names.index(c)] for c in selected]
+                    yield from window_batches(reader, selected_columns, schema, offset, end)
+                    logger.info(f"按窗口读取 TIFF 完成，共解码 {reader.decode_count} 个分段")
+                    return
+            images = tifffile.imread(file_path)
+            arrays = []
+            for c in selected:
+                _, index, _, _ = specs[names.index(c)]
+                arr = images[index].reshape(-1)[offset:end]
+                arrays.append(pa.array(pad_band(arr, end - offset, images.dtype), type=schema.field(c).type))
+            yield pa.record_batch(arrays, schema=schema)
+
+        return pa.RecordBatchReader.from_batches(schema, batch_generator())
+
     def write(self, table: pa.Table, output_path: str):
         """
         将 Arrow Table 写入 TIFF 文件。
@@ -351,26 +541,10 @@ class TIFParser(BaseParser):
     def count(self, file_path: str) -> int:
         """
         返回解析后 Arrow Table 的总行数（即所有页/波段像素数的最大值）。
+        只读取文件头中的页 shape（IFD 标签），不解码像素。
         """
         try:
-            images = tifffile.imread(file_path)
-            # 统一成列表
-            if images.ndim == 2:
-                images = [images]
-            elif images.ndim == 3:
-                if images.shape[0] in [1, 3, 4] and images.shape[0] < images.shape[1] and images.shape[0] < images.shape[2]:
-                    images = [images]
-                elif images.shape[2] in [1, 3, 4] and images.shape[2] < images.shape[0] and images.shape[2] < images.shape[1]:
-                    images = [images]
-                else:
-                    images = [img for img in images]
-            elif images.ndim == 4:
-                images = [img for img in images]
-            else:
-                images = [images]
-            # 统计每个波段/页的像素数
-            max_len = max(img.size for img in images)
-            return int(max_len)
+            return self.cached_count(file_path, self._count_from_tags)
         except Exception as e:
             logger.error(f"统计 TIFF 文件 Arrow Table 行数失败: {e}")
             raise
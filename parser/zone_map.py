@@ -0,0 +1,305 @@
+import itertools
+import os
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.fs as fs
+import pyarrow.ipc as ipc
+
+from utils.logger_utils import get_logger
+from utils.sketch_utils import HyperLogLog, hashable
+logger = get_logger(__name__)
+
+ZONE_MAP_SUFFIX = ".zonemap"
+_ROWS_FIELD = "__num_rows__"
+# 整个文件各列的 HyperLogLog 寄存器保存在 zone map 的 schema metadata 中，键为 hll:<列名>
+_SKETCH_PREFIX = "hll:"
+# zone map 格式版本：早期版本把 null 计为 NaN，统计信息不可靠，读取时当作没有 zone map
+_VERSION_KEY = b"zonemap:version"
+_FORMAT_VERSION = b"2"
+# 每个批次最多枚举的 (列, 状态) 组合数，超过时该批次不做剪枝
+MAX_GUARANTEE_COMBINATIONS = 64
+
+
+def zone_map_path(cache_path: str) -> str:
+    return cache_path + ZONE_MAP_SUFFIX
+
+
+def _has_sum(value_type: pa.DataType) -> bool:
+    return pa.types.is_integer(value_type) or pa.types.is_floating(value_type)
+
+
+def _sum_type(value_type: pa.DataType) -> pa.DataType:
+    return pc.sum(pa.array([], value_type)).type
+
+
+def _column_stats(column: pa.Array):
+    """
+    返回 (min, max, null_count, nan_count, sum)，类型不支持 min_max 时 min / max 为 None，非数值列 sum 为 None。
+    sum 与 pc.sum 的语义一致（含 NaN 时为 NaN），min / max 不含 NaN。
+    """
+    nulls = column.null_count
+    nans = 0
+    total = pc.sum(column).as_py() if _has_sum(column.type) else None
+    if pa.types.is_floating(column.type):
+        # 只统计非 null 值中的 NaN：to_numpy 会把 null 也转为 NaN
+        nans = pc.sum(pc.fill_null(pc.is_nan(column), False)).as_py() or 0
+        if nans:
+            column = pc.if_else(pc.is_nan(column), None, column)
+    if nulls + nans >= len(column):
+        return None, None, nulls, nans, total
+    try:
+        min_max = pc.min_max(column)
+    except (pa.ArrowNotImplementedError, pa.ArrowInvalid):
+        return None, None, nulls, nans, total
+    return min_max["min"].as_py(), min_max["max"].as_py(), nulls, nans, total
+
+
+class ZoneMapWriter:
+    """
+    包装 Arrow IPC 写入器：每写入一个 RecordBatch 就记录各列的 min / max / null 数 / NaN 数，
+    关闭时把统计信息写入缓存文件旁的 .zonemap 文件（本身也是 Arrow IPC，每行对应一个批次）。
+    sketches 为 True 时还为每列累计整个文件的 HyperLogLog，用于近似的 count_distinct；也可以是列名列表，只为这些列计算。
+    写入过程中出现异常时不生成 .zonemap。
+    """
+
+    def __init__(self, writer, cache_path: str, schema: pa.Schema, sketches=False):
+        self._writer = writer
+        self._path = zone_map_path(cache_path)
+        self._schema = schema
+        self._rows = []
+        self._stats = {field.name: [] for field in schema}
+        if not isinstance(sketches, bool):
+            sketches = set(sketches)
+        self._sketches = {field.name: HyperLogLog() for field in schema
+                          if (sketches is True or (sketches and field.name in sketches)) and hashable(field.type)}
+
+    def write_batch(self, batch: pa.RecordBatch):
+        self._writer.write_batch(batch)
+        self._rows.append(batch.num_rows)
+        for name, column in zip(batch.schema.names, batch.columns):
+            self._stats[name].append(_column_stats(column))
+            if name in self._sketches:
+                try:
+                    self._sketches[name].add(column)
+                except Exception as e:
+                    logger.warning(f"列 {name} 无法计算 HyperLogLog，跳过: {e}")
+                    del self._sketches[name]
+
+    def write_table(self, table: pa.Table):
+        # 与 IPC 写入器一样按 chunk 写为批次，保证统计信息与文件中的批次一一对应
+        for batch in table.to_batches():
+            self.write_batch(batch)
+
+    def write(self, table_or_batch):
+        if isinstance(table_or_batch, pa.RecordBatch):
+            self.write_batch(table_or_batch)
+        else:
+            self.write_table(table_or_batch)
+
+    def close(self):
+        self._writer.close()
+        self._write_zone_map()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self._writer.close()
+            return False
+        self.close()
+        return False
+
+    def _write_zone_map(self):
+        arrays = [pa.array(self._rows, type=pa.int64())]
+        fields = [pa.field(_ROWS_FIELD, pa.int64())]
+        for field in self._schema:
+            stats = self._stats[field.name]
+            try:
+                mins = pa.array([s[0] for s in stats], type=field.type)
+                maxs = pa.array([s[1] for s in stats], type=field.type)
+            except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+                mins = maxs = pa.nulls(len(stats), type=field.type)
+            children = [mins, maxs, pa.array([s[2] for s in stats], type=pa.int64()),
+                        pa.array([s[3] for s in stats], type=pa.int64())]
+            names = ["min", "max", "null_count", "nan_count"]
+            if _has_sum(field.type):
+                children.append(pa.array([s[4] for s in stats], type=_sum_type(field.type)))
+                names.append("sum")
+            struct = pa.StructArray.from_arrays(children, names=names)
+            arrays.append(struct)
+            fields.append(pa.field(field.name, struct.type))
+        metadata = {f"{_SKETCH_PREFIX}{name}": sketch.to_bytes() for name, sketch in self._sketches.items()}
+        metadata[_VERSION_KEY] = _FORMAT_VERSION
+        table = pa.Table.from_arrays(arrays, schema=pa.schema(fields, metadata=metadata))
+        with ipc.new_file(self._path, table.schema) as writer:
+            writer.write_table(table)
+
+
+class ZoneMap:
+    """
+    缓存文件的批次级索引：
+    - 由各批次行数得到每个批次的起始行，slice / limit 直接定位到起始批次；
+    - 把每个批次的 min / max / null / NaN 转为 Arrow 的 guarantee 表达式，交给 Arrow 的表达式化简
+      判断 filter 在该批次上是否可能为真，跳过一定不满足条件的批次；
+    - 保存各列整个文件的 HyperLogLog（sketches），用于近似的 count_distinct。
+    """
+
+    def __init__(self, table: pa.Table):
+        self.num_rows = table.column(_ROWS_FIELD).to_numpy()
+        self.row_starts = np.concatenate([[0], np.cumsum(self.num_rows)[:-1]]).astype(np.int64)
+        self._stats = {}
+        self._types = {}
+        self._sums = {}
+        for field in table.schema:
+            if field.name == _ROWS_FIELD:
+                continue
+            column = table.column(field.name).combine_chunks()
+            self._stats[field.name] = [column.field(name).to_pylist() for name in ("min", "max", "null_count", "nan_count")]
+            self._types[field.name] = field.type.field("min").type
+            # 早期生成的 zone map 没有 sum
+            if field.type.get_field_index("sum") >= 0:
+                self._sums[field.name] = column.field("sum").to_pylist()
+        self.sketches = {}
+        for key, value in (table.schema.metadata or {}).items():
+            if key == _VERSION_KEY:
+                continue
+            key = key.decode("utf-8")
+            if key.startswith(_SKETCH_PREFIX):
+                self.sketches[key[len(_SKETCH_PREFIX):]] = HyperLogLog.from_bytes(value)
+
+    @property
+    def num_batches(self) -> int:
+        return len(self.num_rows)
+
+    def batches_in_range(self, offset: int = 0, length: Optional[int] = None) -> List[int]:
+        """与行范围 [offset, offset + length) 相交的批次编号。"""
+        ends = self.row_starts + self.num_rows
+        first = int(np.searchsorted(ends, offset, side="right"))
+        if length is None:
+            last = self.num_batches
+        else:
+            last = int(np.searchsorted(self.row_starts, offset + length, side="left"))
+        return [i for i in range(first, last) if self.num_rows[i] > 0]
+
+    def candidate_batches(self, predicate, batches: Optional[List[int]] = None) -> List[int]:
+        """返回 predicate 可能为真的批次编号；无法判断的批次一律保留。"""
+        batches = list(range(self.num_batches)) if batches is None else list(batches)
+        if predicate is None or not batches:
+            return batches
+        text = str(predicate)
+        # 只为谓词中出现的列构造 guarantee；多构造或少构造都不影响正确性，只影响剪枝效果
+        columns = [name for name in self._stats if name in text]
+        if not columns:
+            return batches
+        schema = pa.schema([pa.field(name, value_type) for name, value_type in self._types.items()])
+        paths, guarantees, unconstrained = [], [], []
+        for i in batches:
+            states = [self._column_states(name, i) for name in columns]
+            if int(np.prod([len(s) for s in states])) > MAX_GUARANTEE_COMBINATIONS:
+                unconstrained.append(i)
+                continue
+            for j, combination in enumerate(itertools.product(*states)):
+                paths.append(f"/zonemap/{i}/{j}")
+                guarantees.append(self._conjunction(combination))
+        if not paths:
+            return batches
+        try:
+            dataset = ds.FileSystemDataset.from_paths(paths, schema=schema, format=ds.IpcFileFormat(),
+                                                      filesystem=fs.LocalFileSystem(), partitions=guarantees)
+            matched = {int(fragment.path.split("/")[2]) for fragment in dataset.get_fragments(filter=predicate)}
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError, pa.ArrowTypeError, TypeError) as e:
+            logger.warning(f"无法用 zone map 评估谓词，读取全部批次: {e}")
+            return batches
+        return [i for i in batches if i in matched or i in unconstrained]
+
+    def aggregate(self, name: str, function: str, batches: List[int]):
+        """
+        只用统计信息计算若干完整批次上某列的 count（非 null 个数）/ nan_count / sum / min / max。
+        count / sum 与 pyarrow.compute 对应函数一致；min / max 跳过没有有效值（全为 null 或 NaN）的批次，
+        所有批次都没有有效值时返回 None，由调用方结合 nan_count 处理只有 NaN 的情况。
+        返回 (是否可用, 结果)；列没有所需的统计信息时返回 (False, None)。
+        """
+        if name not in self._stats:
+            return False, None
+        mins, maxs, nulls, nans = self._stats[name]
+        counts = [int(self.num_rows[i]) - nulls[i] for i in batches]
+        if function == "count":
+            return True, sum(counts)
+        if function == "nan_count":
+            return True, sum(nans[i] for i in batches)
+        if function == "sum":
+            sums = self._sums.get(name)
+            if sums is None or any(sums[i] is None for i, count in zip(batches, counts) if count):
+                return False, None
+            values = [sums[i] for i, count in zip(batches, counts) if count]
+            return True, sum(values) if values else None
+        values = mins if function == "min" else maxs
+        present = [i for i, count in zip(batches, counts) if count - nans[i] > 0]
+        if any(values[i] is None for i in present):
+            return False, None
+        if not present:
+            return True, None
+        return True, (min if function == "min" else max)(values[i] for i in present)
+
+    def _column_states(self, name: str, i: int):
+        """批次 i 中该列取值的几种可能：落在 [min, max] 内、为 null、为 NaN。"""
+        mins, maxs, nulls, nans = self._stats[name]
+        field = pc.field(name)
+        states = []
+        if mins[i] is not None:
+            value_type = self._types[name]
+            states.append((field >= pa.scalar(mins[i], value_type)) & (field <= pa.scalar(maxs[i], value_type)))
+        if nulls[i]:
+            states.append(field.is_null())
+        if nans[i]:
+            states.append(field == pa.scalar(float("nan"), self._types[name]))
+        # 没有统计信息（空批次或类型不支持 min / max）时不约束该列
+        return states or [pc.scalar(True)]
+
+    @staticmethod
+    def _conjunction(expressions):
+        result = expressions[0]
+        for expression in expressions[1:]:
+            result = result & expression
+        return result
+
+
+_zone_maps = OrderedDict()
+_zone_maps_lock = threading.Lock()
+_ZONE_MAP_CACHE_SIZE = 256
+
+
+def load_zone_map(cache_path: str) -> Optional[ZoneMap]:
+    """读取缓存文件对应的 .zonemap，没有时返回 None。结果按文件 mtime 缓存在进程内。"""
+    path = zone_map_path(cache_path)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    key = (path, mtime)
+    with _zone_maps_lock:
+        if key in _zone_maps:
+            _zone_maps.move_to_end(key)
+            return _zone_maps[key]
+    try:
+        with pa.memory_map(path, "r") as source:
+            table = ipc.open_file(source).read_all()
+        if (table.schema.metadata or {}).get(_VERSION_KEY) != _FORMAT_VERSION:
+            logger.info(f"zone map 版本过旧，忽略: {path}")
+            return None
+        zone_map = ZoneMap(table)
+    except (OSError, pa.ArrowInvalid, KeyError) as e:
+        logger.warning(f"读取 zone map 失败 {path}: {e}")
+        return None
+    with _zone_maps_lock:
+        _zone_maps[key] = zone_map
+        while len(_zone_maps) > _ZONE_MAP_CACHE_SIZE:
+            _zone_maps.popitem(last=False)
+    return zone_map
@@ -1,4 +1,6 @@
 from sdk.dacp_client import DacpClient, Principal
 from sdk.dataframe import DataFrame
+from sdk.async_client import AsyncDacpClient, AsyncDataFrame
+from utils.aggregate_utils import ApproximateResult
 
-__all__ = ["DacpClient", "Principal", "DataFrame"]
\ No newline at end of file
+__all__ = ["DacpClient", "Principal", "DataFrame", "AsyncDacpClient", "AsyncDataFrame", "ApproximateResult"]
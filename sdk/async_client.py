@@ -0,0 +1,252 @@
+from __future__ import annotations
+
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional
+
+import pandas
+import pyarrow as pa
+
+from sdk.dacp_client import DacpClient, Principal
+from sdk.dataframe import DataFrame
+from utils.aggregate_utils import ApproximateResult
+
+# 默认并发数，应不超过 DacpClient 连接池的最大连接数（20），否则多出的调用会排队等待连接
+DEFAULT_MAX_CONCURRENCY = 16
+
+
+class AsyncDacpClient:
+    """
+    DacpClient 的 asyncio 版本。Flight 调用在客户端自己的线程池中执行，不阻塞事件循环；
+    同时进行的调用数不超过 max_concurrency，可以直接用 asyncio.gather 并发请求大量 dataframe：
+
+        client = await AsyncDacpClient.connect(url, Principal.ANONYMOUS)
+        counts = await asyncio.gather(*(client.count(name) for name in names))
+    """
+
+    def __init__(self, client: DacpClient, max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                 executor: Optional[ThreadPoolExecutor] = None):
+        self.client = client
+        self.max_concurrency = max(1, max_concurrency)
+        self._owns_executor = executor is None
+        self._executor = executor or ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="dacp-async")
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    @staticmethod
+    async def connect(url: str, principal: Optional[Principal] = None,
+                      max_concurrency: int = DEFAULT_MAX_CONCURRENCY) -> Optional[AsyncDacpClient]:
+        executor = ThreadPoolExecutor(max_workers=max(1, max_concurrency), thread_name_prefix="dacp-async")
+        client = await asyncio.get_running_loop().run_in_executor(executor, DacpClient.connect, url, principal)
+        if client is None:
+            executor.shutdown(wait=False)
+            return None
+        async_client = AsyncDacpClient(client, max_concurrency, executor)
+        async_client._owns_executor = True
+        return async_client
+
+    async def run(self, func: Callable, *args, **kwargs):
+        """在客户端线程池中执行同步调用，受 max_concurrency 限制。"""
+        async with self._semaphore:
+            return await asyncio.get_running_loop().run_in_executor(
+                self._executor, functools.partial(func, *args, **kwargs))
+
+    async def iterate(self, make_iterator: Callable[[], Iterator]) -> AsyncIterator:
+        """把同步迭代器转换为异步迭代器，每次取下一个元素都在线程池中执行；提前退出时关闭同步迭代器以释放连接。"""
+        iterator = iter(await self.run(make_iterator))
+        done = object()
+        try:
+            while True:
+                item = await self.run(next, iterator, done)
+                if item is done:
+                    return
+                yield item
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                await self.run(close)
+
+    async def list_datasets(self) -> List[str]:
+        return await self.run(self.client.list_datasets)
+
+    async def get_dataset(self, dataset_name: str):
+        return await self.run(self.client.get_dataset, dataset_name)
+
+    async def list_dataframes(self, dataset_name: str) -> List[str]:
+        return await self.run(self.client.list_dataframes, dataset_name)
+
+    def list_dataframes_stream(self, dataset_name: str, max_chunksize: Optional[int] = 50000) -> AsyncIterator:
+        return self.iterate(lambda: self.client.list_dataframes_stream(dataset_name, max_chunksize))
+
+    async def list_user_auth_dataframes(self, username: str) -> List[str]:
+        return await self.run(self.client.list_user_auth_dataframes, username)
+
+    async def check_permission(self, dataset_name: str, username: str) -> bool:
+        return await self.run(self.client.check_permission, dataset_name, username)
+
+    async def sample(self, dataframe_name: str, reservoir: bool = False):
+        return await self.run(self.client.sample, dataframe_name, reservoir)
+
+    async def count(self, dataframe_name: str):
+        return await self.run(self.client.count, dataframe_name)
+
+    def sample_many(self, dataframe_names: List[str], reservoir: bool = False) -> AsyncIterator[dict]:
+        return self.iterate(lambda: self.client.sample_many(dataframe_names, reservoir))
+
+    def count_many(self, dataframe_names: List[str]) -> AsyncIterator[dict]:
+        return self.iterate(lambda: self.client.count_many(dataframe_names))
+
+    async def open_many(self, dataframe_names: List[str]) -> Dict[str, AsyncDataFrame]:
+        dataframes = await self.run(self.client.open_many, dataframe_names)
+        return {name: AsyncDataFrame(df, self) for name, df in dataframes.items()}
+
+    async def open(self, dataframe_name: str) -> AsyncDataFrame:
+        return AsyncDataFrame(await self.run(self.client.open, dataframe_name), self)
+
+    async def close_dataframe(self, dataframe_name: str):
+        return await self.run(self.client.close_dataframe, dataframe_name)
+
+    def get_dataframe_stream(self, dataframe_name: str, max_chunksize: Optional[int] = 1024 * 1024 * 5,
+                             offset: int = 0) -> AsyncIterator[bytes]:
+        return self.iterate(lambda: self.client.get_dataframe_stream(dataframe_name, max_chunksize, offset))
+
+    async def download_dataframe(self, dataframe_name: str, dest_path: str, **kwargs) -> str:
+        return await self.run(self.client.download_dataframe, dataframe_name, dest_path, **kwargs)
+
+    async def disconnect(self):
+        """断开连接并关闭线程池。"""
+        try:
+            await self.run(self.client.disconnect)
+        finally:
+            if self._owns_executor:
+                self._executor.shutdown(wait=False)
+
+    async def __aenter__(self) -> AsyncDacpClient:
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.disconnect()
+
+
+class AsyncDataFrame:
+    """
+    sdk.dataframe.DataFrame 的 asyncio 版本。limit / filter 等惰性操作只记录 action，直接返回新的 AsyncDataFrame；
+    需要访问服务端的操作都是协程，流式读取使用 async for。
+    """
+
+    def __init__(self, dataframe: DataFrame, client: AsyncDacpClient):
+        self.dataframe = dataframe
+        self.client = client
+
+    def _wrap(self, dataframe: DataFrame) -> AsyncDataFrame:
+        return AsyncDataFrame(dataframe, self.client)
+
+    @property
+    def id(self) -> str:
+        return self.dataframe.id
+
+    @property
+    def data(self) -> Optional[pa.Table]:
+        return self.dataframe.data
+
+    def limit(self, rowNum: int) -> AsyncDataFrame:
+        return self._wrap(self.dataframe.limit(rowNum))
+
+    def slice(self, offset: int = 0, length: Optional[int] = None) -> AsyncDataFrame:
+        return self._wrap(self.dataframe.slice(offset, length))
+
+    def select(self, *columns) -> AsyncDataFrame:
+        return self._wrap(self.dataframe.select(*columns))
+
+    def filter(self, expression: str) -> AsyncDataFrame:
+        return self._wrap(self.dataframe.filter(expression))
+
+    def sort(self, column: str, order: str = "ascending") -> AsyncDataFrame:
+        return self._wrap(self.dataframe.sort(column, order))
+
+    def sql(self, sql_str: str) -> AsyncDataFrame:
+        return self._wrap(self.dataframe.sql(sql_str))
+
+    def map(self, column: str, func: Any, new_column_name: Optional[str] = None) -> AsyncDataFrame:
+        return self._wrap(self.dataframe.map(column, func, new_column_name))
+
+    def with_column(self, name: str, expression: str) -> AsyncDataFrame:
+        return self._wrap(self.dataframe.with_column(name, expression))
+
+    async def schema(self) -> pa.Schema:
+        return await self.client.run(getattr, self.dataframe, "schema")
+
+    async def num_rows(self) -> int:
+        return await self.client.run(getattr, self.dataframe, "num_rows")
+
+    async def shape(self):
+        return await self.client.run(getattr, self.dataframe, "shape")
+
+    async def column_names(self) -> List[str]:
+        return await self.client.run(getattr, self.dataframe, "column_names")
+
+    async def total_bytes(self) -> int:
+        return await self.client.run(getattr, self.dataframe, "total_bytes")
+
+    async def collect(self) -> AsyncDataFrame:
+        await self.client.run(self.dataframe.collect)
+        return self
+
+    async def collect_blob(self) -> AsyncDataFrame:
+        await self.client.run(self.dataframe.collect_blob)
+        return self
+
+    async def read_blob(self, index: int) -> pa.Buffer:
+        return await self.client.run(self.dataframe.read_blob, index)
+
+    def blob_buffers(self, index: int) -> AsyncIterator[pa.Buffer]:
+        return self.client.iterate(lambda: self.dataframe.blob_buffers(index))
+
+    def get_stream(self, max_chunksize: Optional[int] = 1000) -> AsyncIterator[pa.RecordBatch]:
+        return self.client.iterate(lambda: self.dataframe.get_stream(max_chunksize))
+
+    def __aiter__(self) -> AsyncIterator[pa.RecordBatch]:
+        return self.get_stream()
+
+    async def sum(self, column: str, **kwargs):
+        return await self.client.run(self.dataframe.sum, column, **kwargs)
+
+    async def mean(self, column: str, **kwargs):
+        return await self.client.run(self.dataframe.mean, column, **kwargs)
+
+    async def min(self, column: str):
+        return await self.client.run(self.dataframe.min, column)
+
+    async def max(self, column: str):
+        return await self.client.run(self.dataframe.max, column)
+
+    async def quantile(self, column: str, q: float = 0.5, **kwargs):
+        return await self.client.run(self.dataframe.quantile, column, q, **kwargs)
+
+    async def count_distinct(self, column: str, **kwargs):
+        return await self.client.run(self.dataframe.count_distinct, column, **kwargs)
+
+    async def approximate(self, column: str, function: str, **kwargs) -> ApproximateResult:
+        return await self.client.run(self.dataframe.approximate, column, function, **kwargs)
+
+    async def aggregate(self, aggregations, group_by: Optional[List[str]] = None, ddof: int = 0) -> pa.Table:
+        return await self.client.run(self.dataframe.aggregate, aggregations, group_by, ddof)
+
+    async def describe(self) -> pandas.DataFrame:
+        return await self.client.run(self.dataframe.describe)
+
+    async def to_pandas(self, **kwargs) -> pandas.DataFrame:
+        return await self.client.run(self.dataframe.to_pandas, **kwargs)
+
+    async def to_pydict(self) -> Dict[str, List[Any]]:
+        return await self.client.run(self.dataframe.to_pydict)
+
+    async def to_string(self, head_rows: int = 5, tail_rows: int = 5, first_cols: int = 3, last_cols: int = 3,
+                        display_all: bool = False) -> str:
+        return await self.client.run(self.dataframe.to_string, head_rows, tail_rows, first_cols, last_cols, display_all)
+
+    async def write(self, output_path: str, file_path: Optional[str] = None, format: str = None):
+        return await self.client.run(self.dataframe.write, output_path, file_path, format)
+
+    async def close(self):
+        await self.client.close_dataframe(self.dataframe.id)
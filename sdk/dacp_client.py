@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 from enum import Enum
-from typing import Optional, List
+from typing import Dict, Iterator, Optional, List
 from urllib.parse import urlparse
 import pyarrow as pa
 import pyarrow.flight
@@ -145,10 +145,15 @@ class DacpClient:
                 res_str = res.body.to_pybytes().decode('utf-8')
                 return res_str.lower() == 'true'
 
-    def sample(self, dataframe_name: str):
+    def sample(self, dataframe_name: str, reservoir: bool = False):
+        """
+        预览数据。默认返回文件开头的若干行；reservoir=True 时（目前仅 CSV）在整个文件中随机抽样，
+        结果更有代表性但需要扫描整个文件。
+        """
         ticket = {
             'dataframe_name': dataframe_name,
-            'connection_id': self.__connection_id
+            'connection_id': self.__connection_id,
+            'reservoir': reservoir
         }
         with ConnectionManager.get_connection() as conn:
             results = conn.do_action(pa.flight.Action("sample", json.dumps(ticket).encode('utf-8')))
@@ -165,6 +170,39 @@ class DacpClient:
             for res in results:
                 return res.body.to_pybytes().decode('utf-8')
 
+    def sample_many(self, dataframe_names: List[str], reservoir: bool = False) -> Iterator[dict]:
+        """
+        一次请求预览多个 dataframe，服务端并发执行，按完成顺序逐个返回
+        {"dataframe_name": ..., "result": {...}}（失败时为 "error"）。result 与 sample 的内容相同，已包含 total_count。
+        """
+        return self._many("sample_many", dataframe_names, reservoir=reservoir)
+
+    def count_many(self, dataframe_names: List[str]) -> Iterator[dict]:
+        """一次请求统计多个 dataframe 的行数，按完成顺序逐个返回 {"dataframe_name": ..., "result": {"total_count": ...}}。"""
+        return self._many("count_many", dataframe_names)
+
+    def open_many(self, dataframe_names: List[str]) -> Dict[str, DataFrame]:
+        """一次请求打开多个 dataframe，返回 名称 -> DataFrame；打开失败的记录错误日志，不出现在结果中。"""
+        from sdk.dataframe import DataFrame
+        dataframes = {}
+        for item in self._many("open_many", dataframe_names):
+            if "error" in item:
+                logger.error(f"打开 {item['dataframe_name']} 失败: {item['error']}")
+                continue
+            dataframes[item["dataframe_name"]] = DataFrame(id=item["dataframe_name"], connection_id=self.__connection_id)
+        return dataframes
+
+    def _many(self, action_type: str, dataframe_names: List[str], **kwargs) -> Iterator[dict]:
+        ticket = {
+            'dataframe_names': list(dataframe_names),
+            'connection_id': self.__connection_id,
+            **kwargs
+        }
+        with ConnectionManager.get_connection() as conn:
+            results = conn.do_action(pa.flight.Action(action_type, json.dumps(ticket).encode('utf-8')))
+            for res in results:
+                yield json.loads(res.body.to_pybytes().decode('utf-8'))
+
     def open(self, dataframe_name: str):
         from sdk.dataframe import DataFrame
         ticket = {
@@ -175,10 +213,34 @@ class DacpClient:
             results = conn.do_action(pa.flight.Action("open", json.dumps(ticket).encode('utf-8')))
             return DataFrame(id=dataframe_name, connection_id=self.__connection_id)
 
-    def get_dataframe_stream(self, dataframe_name: str, max_chunksize: Optional[int] = 1024 * 1024 * 5):
+    def close_dataframe(self, dataframe_name: str):
+        """释放服务端为该 dataframe 持有的表，所有连接都释放后服务端才回收内存。"""
+        ticket = {
+            'dataframe_name': dataframe_name,
+            'connection_id': self.__connection_id
+        }
+        with ConnectionManager.get_connection() as conn:
+            results = conn.do_action(pa.flight.Action("close_dataframe", json.dumps(ticket).encode('utf-8')))
+            for _ in results:
+                pass
+
+    def disconnect(self):
+        """断开连接，释放服务端为该连接持有的全部表和结果缓存。"""
+        ticket = {
+            'connection_id': self.__connection_id
+        }
+        with ConnectionManager.get_connection() as conn:
+            results = conn.do_action(pa.flight.Action("disconnect", json.dumps(ticket).encode('utf-8')))
+            for _ in results:
+                pass
+        self.__connection_id = None
+
+    def get_dataframe_stream(self, dataframe_name: str, max_chunksize: Optional[int] = 1024 * 1024 * 5, offset: int = 0):
+        """按块返回原始文件内容；offset 指定时从该字节偏移开始，用于续传。"""
         ticket = {
             'dataframe_name': dataframe_name,
             'max_chunksize': max_chunksize,
+            'offset': offset,
             'connection_id': self.__connection_id
         }
         with ConnectionManager.get_connection() as conn:
@@ -187,7 +249,36 @@ class DacpClient:
                 chunk_bytes = chunk.body.to_pybytes()
                 print(f"Successfully fetch {len(chunk_bytes)} Bytes")
                 yield chunk_bytes
-                
+
+    def download_dataframe(self, dataframe_name: str, dest_path: str, parallelism: int = 4,
+                           segment_bytes: int = 64 * 1024 * 1024, max_chunksize: int = 4 * 1024 * 1024,
+                           retries: int = 3) -> str:
+        """
+        把原始文件下载到 dest_path：按字节范围分段并行下载，每块校验 CRC32。
+        下载中断后用相同参数再次调用，会从 dest_path.part.json 记录的已校验偏移继续。
+        """
+        from sdk.file_download import RangeDownloader
+        ticket = {
+            'dataframe_name': dataframe_name,
+            'connection_id': self.__connection_id
+        }
+        with ConnectionManager.get_connection() as conn:
+            results = conn.do_action(pa.flight.Action("stat_dataframe_file", json.dumps(ticket).encode('utf-8')))
+            stat = json.loads(next(iter(results)).body.to_pybytes().decode('utf-8'))
+
+        def fetch_range(offset: int, length: int):
+            range_ticket = dict(ticket, type="file_range", offset=offset, length=length,
+                                version=stat["version"], max_chunksize=max_chunksize)
+            with ConnectionManager.get_connection() as conn:
+                reader = conn.do_get(pa.flight.Ticket(json.dumps(range_ticket).encode('utf-8')))
+                for chunk in reader:
+                    batch = chunk.data
+                    # as_buffer 直接引用接收到的数据，避免转换为 bytes 的额外拷贝
+                    yield batch.column(0)[0].as_py(), batch.column(1)[0].as_buffer(), batch.column(2)[0].as_py()
+
+        return RangeDownloader(fetch_range, stat["size"], stat["version"], dest_path, parallelism=parallelism,
+                               segment_bytes=segment_bytes, retries=retries).run()
+
 class AuthType(Enum):
     OAUTH = "oauth"
     CONTROLD = "controld"
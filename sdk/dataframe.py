@@ -1,5 +1,8 @@
 import json
-from typing import List, Optional, Dict, Any
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List, Optional, Dict, Any
 
 import duckdb
 import pandas
@@ -9,8 +12,74 @@ import pyarrow.compute as pc
 from core.models.dataframe import DataFrame
 from sdk.dacp_client import ConnectionManager
 from utils.format_utils import format_arrow_table
+from utils.expression_utils import filter_table, map_table
+from utils.aggregate_utils import (aggregate_batches, describe_batches, normalize_aggregations, ApproximateResult,
+                                   DEFAULT_CONFIDENCE, exact_aggregate, exact_result)
 import os
 
+# 并行下载时每个 endpoint 预取的最大批次数，限制尚未被消费的数据占用的内存
+ENDPOINT_PREFETCH_BATCHES = 8
+_END_OF_STREAM = object()
+
+
+def get_flight_info(dataframe, max_chunksize: Optional[int] = None) -> pa.flight.FlightInfo:
+    # stream: 用于下载结果，服务端不会为了统计行数预先执行 action 链
+    command = {"dataframe": json.dumps(dataframe, default=vars), "max_chunksize": max_chunksize, "stream": True}
+    descriptor = pa.flight.FlightDescriptor.for_command(json.dumps(command))
+    with ConnectionManager.get_connection() as conn:
+        return conn.get_flight_info(descriptor)
+
+
+def stream_endpoints(endpoints):
+    """
+    按顺序返回各 endpoint 的 RecordBatch。多个 endpoint 时每个 endpoint 占用连接池中的一个连接并行下载，
+    每个 endpoint 最多预取 ENDPOINT_PREFETCH_BATCHES 个批次，消费方按 endpoint 顺序读取。
+    """
+    if len(endpoints) == 1:
+        with ConnectionManager.get_connection() as conn:
+            for chunk in conn.do_get(endpoints[0].ticket):
+                yield chunk.data
+        return
+
+    stop = threading.Event()
+    queues = [queue.Queue(maxsize=ENDPOINT_PREFETCH_BATCHES) for _ in endpoints]
+
+    def put(q, item):
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def fetch(endpoint, q):
+        try:
+            with ConnectionManager.get_connection() as conn:
+                for chunk in conn.do_get(endpoint.ticket):
+                    if not put(q, chunk.data):
+                        return
+            put(q, _END_OF_STREAM)
+        except BaseException as e:
+            put(q, e)
+
+    executor = ThreadPoolExecutor(max_workers=len(endpoints))
+    try:
+        for endpoint, q in zip(endpoints, queues):
+            executor.submit(fetch, endpoint, q)
+        for q in queues:
+            while True:
+                item = q.get()
+                if item is _END_OF_STREAM:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+    finally:
+        # 消费方提前结束或出错时通知下载线程退出
+        stop.set()
+        executor.shutdown(wait=False)
+
 
 class DataFrame(DataFrame):
 
@@ -42,19 +111,8 @@ class DataFrame(DataFrame):
             #row_data = {col: self.data[col][index].as_py() for col in self.data.column_names}
 
                 if "blob" in row_data and row_data["blob"] == b'':
-                    ticket = {
-                        "dataframe": json.dumps(self, default=vars),
-                        "row_index": index,
-                        "column_name": "blob"
-                    }
-                    with ConnectionManager.get_connection() as conn:
-                        reader = conn.do_get(pa.flight.Ticket(json.dumps(ticket).encode('utf-8')))
-                    # 返回流式读取生成器
-                    def blob_stream():
-                        for batch in reader:
-                            for blob in batch.data.column(0):  # 遍历每个分块
-                                yield blob.as_py()
-                    row_data["blob"] = blob_stream()
+                    # 返回流式读取生成器，需要避免拷贝时改用 blob_buffers / read_blob
+                    row_data["blob"] = (buffer.to_pybytes() for buffer in self.blob_buffers(index))
                 return row_data
         elif isinstance(index, str):  # 列选择
             if self.data is None:
@@ -147,12 +205,15 @@ class DataFrame(DataFrame):
 
     def collect(self) -> DataFrame:
         if self.data is None:
-            ticket = {
-                "dataframe": json.dumps(self, default=vars)
-            }
-            with ConnectionManager.get_connection() as conn:
-                reader = conn.do_get(pa.flight.Ticket(json.dumps(ticket).encode('utf-8')))
-            self.data = reader.read_all()
+            # 大结果由服务端拆分为多个 endpoint，并行下载后按顺序拼接
+            flight_info = get_flight_info(self)
+            if len(flight_info.endpoints) == 1:
+                # 单个 endpoint 时 FlightInfo 中可能没有 schema，从 do_get 返回的流中读取
+                with ConnectionManager.get_connection() as conn:
+                    self.data = conn.do_get(flight_info.endpoints[0].ticket).read_all()
+            else:
+                batches = list(stream_endpoints(flight_info.endpoints))
+                self.data = pa.Table.from_batches(batches) if batches else flight_info.schema.empty_table()
             self.actions = []
         return self
 
@@ -168,16 +229,39 @@ class DataFrame(DataFrame):
             self.actions = []
         return self
 
+    def blob_buffers(self, index: int) -> Iterator[pa.Buffer]:
+        """
+        按块流式返回第 index 行 blob 的内容。每块是引用接收数据的 pa.Buffer，不拷贝为 bytes；
+        可以用 memoryview(buffer) 或 np.frombuffer(buffer, ...) 直接访问。
+        """
+        if self.data is not None:
+            blob = self.data["blob"][index]
+            if blob.is_valid:
+                yield blob.as_buffer()
+            return
+        ticket = {
+            "dataframe": json.dumps(self, default=vars),
+            "row_index": index,
+            "column_name": "blob"
+        }
+        with ConnectionManager.get_connection() as conn:
+            reader = conn.do_get(pa.flight.Ticket(json.dumps(ticket).encode('utf-8')))
+            for chunk in reader:
+                for blob in chunk.data.column(0):  # 遍历每个分块
+                    if blob.is_valid:
+                        yield blob.as_buffer()
+
+    def read_blob(self, index: int) -> pa.Buffer:
+        """读取第 index 行 blob 的完整内容。只有一块时直接返回该块（零拷贝），多块时拼接一次。"""
+        buffers = list(self.blob_buffers(index))
+        if len(buffers) == 1:
+            return buffers[0]
+        return pa.py_buffer(b"".join(buffers))
+
     def get_stream(self, max_chunksize: Optional[int] = 1000):
         if self.data is None:
-            ticket = {
-                "dataframe": json.dumps(self, default=vars),
-                "max_chunksize": max_chunksize
-            }
-            with ConnectionManager.get_connection() as conn:
-                reader = conn.do_get(pa.flight.Ticket(json.dumps(ticket).encode('utf-8')))
-            for batch in reader:
-                yield batch.data
+            flight_info = get_flight_info(self, max_chunksize)
+            yield from stream_endpoints(flight_info.endpoints)
             self.actions = []
         else:
             for batch in self.data.to_batches(max_chunksize):
@@ -203,7 +287,11 @@ class DataFrame(DataFrame):
         new_df.actions.append(("filter", {"expression": expression}))
         return new_df
 
-    def sum(self, column: str):
+    def sum(self, column: str, approx: bool = False, sample_fraction: Optional[float] = None,
+            confidence: float = DEFAULT_CONFIDENCE):
+        """approx 为 True 或指定 sample_fraction 时返回带置信区间的 ApproximateResult，见 approximate。"""
+        if approx or sample_fraction is not None:
+            return self.approximate(column, "sum", sample_fraction=sample_fraction, confidence=confidence)
         if self.data is None:
             ticket = {
                 "dataframe": json.dumps(self, default=vars),
@@ -218,7 +306,11 @@ class DataFrame(DataFrame):
             arrow_table = self.handle_prev_actions(self.data, self.actions)
             return pc.sum(arrow_table[column]).as_py()
 
-    def mean(self, column):
+    def mean(self, column, approx: bool = False, sample_fraction: Optional[float] = None,
+             confidence: float = DEFAULT_CONFIDENCE):
+        """approx 为 True 或指定 sample_fraction 时返回带置信区间的 ApproximateResult，见 approximate。"""
+        if approx or sample_fraction is not None:
+            return self.approximate(column, "mean", sample_fraction=sample_fraction, confidence=confidence)
         if self.data is None:
             ticket = {
                 "dataframe": json.dumps(self, default=vars),
@@ -263,6 +355,79 @@ class DataFrame(DataFrame):
             arrow_table = self.handle_prev_actions(self.data, self.actions)
             return pc.max(arrow_table[column]).as_py()
 
+    def quantile(self, column: str, q: float = 0.5, approx: bool = False, sample_fraction: Optional[float] = None,
+                 confidence: float = DEFAULT_CONFIDENCE):
+        """分位数（线性插值）；approx 为 True 或指定 sample_fraction 时在批次样本上用 t-digest 估计，返回 ApproximateResult。"""
+        result = self.approximate(column, "quantile", approx or sample_fraction is not None, sample_fraction, confidence, q)
+        return result if approx or sample_fraction is not None else result.value
+
+    def count_distinct(self, column: str, approx: bool = False, confidence: float = DEFAULT_CONFIDENCE):
+        """不同值个数（不含 null）；approx 为 True 时使用缓存中的 HyperLogLog，返回 ApproximateResult。"""
+        result = self.approximate(column, "count_distinct", approx, confidence=confidence)
+        return result if approx else result.value
+
+    def approximate(self, column: str, function: str, approx: bool = True, sample_fraction: Optional[float] = None,
+                    confidence: float = DEFAULT_CONFIDENCE, q: float = 0.5, seed: Optional[int] = None) -> ApproximateResult:
+        """
+        近似计算 sum / mean / quantile / count_distinct，返回估计值及置信区间：
+        - sum / mean / quantile 随机抽取 sample_fraction 比例（默认 1%）的批次估计，action 链只能包含 select / filter / map；
+        - count_distinct 使用缓存中的 HyperLogLog，action 链只能包含 select；
+        - sum / mean 能由缓存的统计信息直接得到，或不满足上述条件时返回精确值（exact 为 True）。
+        """
+        if self.data is None:
+            ticket = {
+                "dataframe": json.dumps(self, default=vars),
+                "column": column,
+                "function": function,
+                "approx": approx,
+                "sample_fraction": sample_fraction,
+                "confidence": confidence,
+                "q": q,
+                "seed": seed
+            }
+            with ConnectionManager.get_connection() as conn:
+                results = conn.do_action(pa.flight.Action("compute_approximate", json.dumps(ticket).encode("utf-8")))
+                for res in results:
+                    return ApproximateResult(**json.loads(res.body.to_pybytes().decode("utf-8"))["result"])
+        arrow_table = self.handle_prev_actions(self.data, self.actions)
+        return exact_result(exact_aggregate(arrow_table[column], function, q), arrow_table.num_rows, confidence)
+
+    def aggregate(self, aggregations, group_by: Optional[List[str]] = None, ddof: int = 0) -> pa.Table:
+        """
+        一次扫描完成多个聚合，可选分组，返回聚合结果表（每个分组一行）。
+        aggregations 为 [("x", "sum"), ("y", "mean"), ("*", "count")] 或 {"x": ["sum", "max"]}，
+        函数可选 count / sum / mean / min / max / variance / stddev；结果列名为 {列}_{函数}，count("*") 为 count。
+        """
+        aggregations = normalize_aggregations(aggregations)
+        group_by = list(group_by or [])
+        if self.data is None:
+            ticket = {
+                "dataframe": json.dumps(self, default=vars),
+                "aggregations": aggregations,
+                "group_by": group_by,
+                "ddof": ddof
+            }
+            with ConnectionManager.get_connection() as conn:
+                results = conn.do_action(pa.flight.Action("compute_aggregate", json.dumps(ticket).encode("utf-8")))
+                for res in results:
+                    return pa.ipc.open_stream(res.body).read_all()
+        arrow_table = self.handle_prev_actions(self.data, self.actions)
+        return aggregate_batches(arrow_table.to_batches(), arrow_table.schema, aggregations, group_by, ddof=ddof)
+
+    def describe(self) -> pandas.DataFrame:
+        """数值列的 count / mean / std / min / max，与 pandas.DataFrame.describe 的对应行一致，只需一次请求。"""
+        if self.data is None:
+            ticket = {
+                "dataframe": json.dumps(self, default=vars)
+            }
+            with ConnectionManager.get_connection() as conn:
+                results = conn.do_action(pa.flight.Action("compute_describe", json.dumps(ticket).encode("utf-8")))
+                table = pa.ipc.open_stream(next(iter(results)).body).read_all()
+        else:
+            arrow_table = self.handle_prev_actions(self.data, self.actions)
+            table = describe_batches(arrow_table.to_batches(), arrow_table.schema)
+        return table.to_pandas().set_index("statistic").rename_axis(None)
+
     def sort(self, column: str, order: str = "ascending") -> DataFrame:
         new_df = DataFrame(self.id, self.data, self.actions[:], self.connection_id)
         new_df.actions.append(("sort", {"column": column, "order": order}))
@@ -274,10 +439,24 @@ class DataFrame(DataFrame):
         return new_df
 
     def map(self, column: str, func: Any, new_column_name: Optional[str] = None) -> DataFrame:
+        """
+        对 column 计算新列 new_column_name（默认 {column}_mapped），在服务端按批次向量化执行：
+        - func 为函数名：服务端注册的 UDF、sqrt / log / abs 等或 pyarrow.compute 函数，如 map("tas", "kelvin_to_celsius")；
+        - func 为表达式字符串：如 map("tas", "tas - 273.15")，表达式中可以引用任意列。
+        Python 函数无法发送给服务端，只能用于已 collect 到本地的 dataframe，且逐个值调用。
+        """
+        if callable(func) and self.data is None:
+            raise TypeError("远程 dataframe 的 map 不支持 Python 函数，请使用服务端注册的 UDF 名称或表达式字符串")
         new_df = DataFrame(self.id, self.data, self.actions[:], self.connection_id)
         new_df.actions.append(("map", {"column": column, "func": func, "new_column_name": new_column_name}))
         return new_df
 
+    def with_column(self, name: str, expression: str) -> DataFrame:
+        """用表达式计算新列 name（同名列则替换），如 with_column("speed", "sqrt(u ** 2 + v ** 2)")。"""
+        new_df = DataFrame(self.id, self.data, self.actions[:], self.connection_id)
+        new_df.actions.append(("map", {"column": None, "func": expression, "new_column_name": name}))
+        return new_df
+
     def to_pandas(self, **kwargs) -> pandas.DataFrame:
         if self.data is None:
             with ConnectionManager.get_connection() as conn:
@@ -327,17 +506,11 @@ class DataFrame(DataFrame):
                 columns = params.get("columns")
                 arrow_table = arrow_table.select(columns)
             elif action_type == "filter":
-                column_names = arrow_table.column_names
-                locals_dict = {col: arrow_table[col].to_pandas() for col in column_names}
-                mask = eval(params.get("expression"), {"__builtins__": None}, locals_dict)
-                arrow_table = arrow_table.filter(pa.array(mask))
+                arrow_table = filter_table(arrow_table, params.get("expression"))
             elif action_type == "map":
                 column = params.get("column")
-                func = params.get("func")
-                new_column_name = params.get("new_column_name", f"{column}_mapped")
-                column_data = arrow_table[column].to_pylist()
-                mapped_data = [func(value) for value in column_data]
-                arrow_table = arrow_table.append_column(new_column_name, pa.array(mapped_data))
+                new_column_name = params.get("new_column_name") or f"{column}_mapped"
+                arrow_table = map_table(arrow_table, column, params.get("func"), new_column_name)
             elif action_type == "sort":
                 column = params.get("column")
                 order = params.get("order", "ascending")
@@ -346,8 +519,13 @@ class DataFrame(DataFrame):
                 else:
                     arrow_table = arrow_table.sort_by([(column, "descending")])
             elif action_type == "sql":
-                dataframe = arrow_table
-                arrow_table = duckdb.sql(params.get("sql_str")).arrow()
+                # 独立的 DuckDB 连接，不使用全局默认连接和变量名替换扫描
+                with duckdb.connect() as con:
+                    con.register("dataframe", arrow_table)
+                    arrow_table = con.execute(params.get("sql_str")).arrow()
+                    # 新版本 duckdb 的 arrow() 返回 RecordBatchReader
+                    if isinstance(arrow_table, pa.RecordBatchReader):
+                        arrow_table = arrow_table.read_all()
             else:
                 raise ValueError(f"Unsupported action type: {action_type}")
         return arrow_table
@@ -0,0 +1,125 @@
+import json
+import os
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterator, Tuple
+
+from utils.logger_utils import get_logger
+logger = get_logger(__name__)
+
+PART_SUFFIX = ".part"
+PROGRESS_SUFFIX = ".part.json"
+DEFAULT_SEGMENT_BYTES = 64 * 1024 * 1024
+# 进度文件的最短写入间隔（秒），写入前先 fsync 数据，保证记录的偏移之前的数据都已落盘
+PROGRESS_FLUSH_INTERVAL = 1.0
+
+
+class ChecksumError(Exception):
+    pass
+
+
+class RangeDownloader:
+    """
+    把远端文件按 segment_bytes 切成若干段，用多个线程并行按字节范围下载，写入 dest_path.part。
+    每一块校验 CRC32 后才推进该段的已完成偏移，进度记录在 dest_path.part.json 中；
+    中断后再次运行时从各段最后校验通过的偏移继续，文件版本变化时丢弃旧进度重新下载。
+
+    fetch_range(offset, length) 返回 (偏移, 数据, crc32) 的迭代器，块必须按偏移顺序连续返回。
+    """
+
+    def __init__(self, fetch_range: Callable[[int, int], Iterator[Tuple[int, object, int]]],
+                 size: int, version: str, dest_path: str, parallelism: int = 4,
+                 segment_bytes: int = DEFAULT_SEGMENT_BYTES, retries: int = 3):
+        self.fetch_range = fetch_range
+        self.size = size
+        self.version = version
+        self.dest_path = dest_path
+        self.parallelism = max(1, parallelism)
+        self.segment_bytes = max(1, segment_bytes)
+        self.retries = retries
+        self._part_path = dest_path + PART_SUFFIX
+        self._progress_path = dest_path + PROGRESS_SUFFIX
+        self._lock = threading.Lock()
+        self._last_flush = 0.0
+        self._done = {}
+
+    def run(self) -> str:
+        self._load_progress()
+        fd = os.open(self._part_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            os.ftruncate(fd, self.size)
+            pending = [start for start in range(0, self.size, self.segment_bytes)
+                       if self._done.get(start, 0) < self._segment_length(start)]
+            if pending:
+                logger.info(f"开始下载 {self.dest_path}: {len(pending)} 个分段待下载，"
+                            f"已完成 {sum(self._done.values())} / {self.size} Bytes")
+            with ThreadPoolExecutor(max_workers=min(self.parallelism, max(1, len(pending)))) as executor:
+                for future in [executor.submit(self._download_segment, fd, start) for start in pending]:
+                    future.result()
+        finally:
+            os.fsync(fd)
+            os.close(fd)
+            with self._lock:
+                self._save_progress()
+        os.replace(self._part_path, self.dest_path)
+        os.remove(self._progress_path)
+        return self.dest_path
+
+    def _segment_length(self, start: int) -> int:
+        return min(self.segment_bytes, self.size - start)
+
+    def _download_segment(self, fd: int, start: int):
+        end = start + self._segment_length(start)
+        for attempt in range(self.retries + 1):
+            position = start + self._done.get(start, 0)
+            if position >= end:
+                return
+            try:
+                for offset, data, crc in self.fetch_range(position, end - position):
+                    if offset != position:
+                        raise ChecksumError(f"期望偏移 {position}，收到 {offset}")
+                    if zlib.crc32(data) != crc:
+                        raise ChecksumError(f"偏移 {offset} 处的数据块校验失败")
+                    os.pwrite(fd, data, offset)
+                    position += len(data)
+                    self._advance(fd, start, position - start)
+                if position < end:
+                    raise ChecksumError(f"分段 [{start}, {end}) 在 {position} 处提前结束")
+                return
+            except Exception as e:
+                if attempt == self.retries:
+                    raise
+                logger.warning(f"下载分段 [{start}, {end}) 失败，从 {position} 继续重试: {e}")
+
+    def _advance(self, fd: int, start: int, done: int):
+        with self._lock:
+            self._done[start] = done
+            now = time.monotonic()
+            if now - self._last_flush >= PROGRESS_FLUSH_INTERVAL:
+                os.fsync(fd)
+                self._save_progress()
+                self._last_flush = now
+
+    def _load_progress(self):
+        try:
+            with open(self._progress_path) as f:
+                progress = json.load(f)
+        except (OSError, ValueError):
+            progress = None
+        if (progress and progress.get("version") == self.version and progress.get("size") == self.size
+                and progress.get("segment_bytes") == self.segment_bytes and os.path.exists(self._part_path)):
+            self._done = {int(start): done for start, done in progress.get("done", {}).items()}
+        else:
+            if progress:
+                logger.info(f"远端文件或分段大小已变化，重新下载 {self.dest_path}")
+            self._done = {}
+
+    def _save_progress(self):
+        progress = {"version": self.version, "size": self.size, "segment_bytes": self.segment_bytes,
+                    "done": {str(start): done for start, done in self._done.items()}}
+        tmp_path = self._progress_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(progress, f)
+        os.replace(tmp_path, self._progress_path)
@@ -3,6 +3,7 @@ from dataclasses import dataclass, field
 from typing import List, Optional
 
 from services.types.thread_safe_dict import ThreadSafeDict
+from services.types.result_cache import ResultCache
 
 @dataclass
 class FairdConnection:
@@ -10,12 +11,15 @@ class FairdConnection:
     clientIp: Optional[str]
     username: Optional[str]
     token: Optional[str]
-    dataframes: ThreadSafeDict  # FlightDescriptor -> FairdDataFrame
+    dataframes: ThreadSafeDict  # dataframe_name -> TableSource
+    result_cache: ResultCache  # (dataframe_id, actions) -> 物化后的 Arrow Table
 
-    def __init__(self, clientIp: Optional[str] = None, username: Optional[str] = None, token: Optional[str] = None):
+    def __init__(self, clientIp: Optional[str] = None, username: Optional[str] = None, token: Optional[str] = None,
+                 result_cache: Optional[ResultCache] = None):
         self.connectionID = str(uuid.uuid4())
         self.clientIp = clientIp
         self.username = username
         self.token = token
         self.dataframes = ThreadSafeDict()
+        self.result_cache = result_cache if result_cache is not None else ResultCache()
 
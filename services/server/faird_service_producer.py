@@ -1,17 +1,24 @@
 import os
+import uuid
+import zlib
 from urllib.parse import urlparse
 import math
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import pyarrow.flight
 
-from sdk.dataframe import DataFrame
 from services.connection.faird_connection import FairdConnection
 from utils.format_utils import format_arrow_table
 from services.datasource.services import *
 from services.types.thread_safe_dict import ThreadSafeDict
+from services.types.result_cache import ResultCache
+from services.types.blob_loader import BlobLoader, binary_array
+from services.types.table_registry import TableRegistry
 from services.connection.connection_service import connect_server_with_oauth, connect_server_with_controld
 from parser import *
 from compute.interactive.interactive import *
+from compute.interactive.plan import TableSource
 from core.config import FairdConfigManager
+from utils.udf_utils import load_udf_modules
 from utils.logger_utils import get_logger, get_access_logger
 logger = get_logger(__name__)
 access_logger = get_access_logger(__name__)
@@ -25,6 +32,26 @@ class FairdServiceProducer(pa.flight.FlightServerBase):
         self.connections = ThreadSafeDict() # connection_id -> Connection
         self.user_compute_resources = ThreadSafeDict()  # username -> UserComputeResource
 
+        # 物化结果缓存，scope=server 时所有连接共享同一个缓存
+        self.shared_result_cache = None
+        if FairdConfigManager.get_config().result_cache_scope == "server":
+            self.shared_result_cache = ResultCache(FairdConfigManager.get_config().result_cache_max_bytes)
+
+        # Arrow 线程池是进程内全局的，CSV 解析线程数只在启动时设置一次，避免并发请求间互相修改
+        csv_parse_threads = FairdConfigManager.get_config().csv_parse_threads
+        if csv_parse_threads > 1:
+            pa.set_cpu_count(csv_parse_threads)
+
+        # 共享表注册表，所有连接 open 同一文件时共享同一份 memory-mapped 表
+        self.table_registry = TableRegistry()
+
+        # 加载配置的 UDF 模块，注册 map / filter 中可以按名字调用的向量化函数
+        load_udf_modules(FairdConfigManager.get_config().map_udf_modules)
+
+        # sample_many / count_many / open_many 共用的线程池，限制批量元数据操作占用的服务端线程数
+        self.batch_executor = ThreadPoolExecutor(max_workers=FairdConfigManager.get_config().batch_workers,
+                                                 thread_name_prefix="faird-batch")
+
         # 初始化datasource_service
         self.data_source_service = None;
         if FairdConfigManager.get_config().access_mode == "interface":
@@ -41,80 +68,93 @@ class FairdServiceProducer(pa.flight.FlightServerBase):
         pass
 
     def get_flight_info(self, context, descriptor):
-        dataframe = json.loads(descriptor.command.decode("utf-8")).get("dataframe")
+        params = json.loads(descriptor.command.decode("utf-8"))
+        dataframe = params.get("dataframe")
         dataframe_id = json.loads(dataframe).get("id")
         actions = json.loads(dataframe).get("actions")
         connection_id = json.loads(dataframe).get("connection_id")
 
-        # 获取 Arrow Table 的 schema
         conn = self.connections[connection_id]
-        arrow_table = conn.dataframes[dataframe_id].data
-        arrow_table = handle_prev_actions(arrow_table, actions)
-        schema = arrow_table.schema
-
-        # 构造 FlightInfo
-        ticket = pa.flight.Ticket(json.dumps({"dataframe_id": dataframe_id}).encode("utf-8"))
-        endpoints = [pa.flight.FlightEndpoint(ticket, [])]
+        config = FairdConfigManager.get_config()
+        layout = result_layout(conn, dataframe_id, actions)
+        # 构造 FlightInfo：行数不执行 action 链就能确定（只有下推的 action 或结果已缓存）的大结果
+        # 按行范围拆分为多个 endpoint，客户端可以用多个连接并行下载，按顺序拼接
+        if layout is not None:
+            schema, num_rows, num_bytes = layout
+            ranges = split_row_ranges(num_rows, num_bytes, config.flight_max_endpoints, config.flight_endpoint_min_bytes)
+        elif not params.get("stream"):
+            # schema / num_rows / shape 需要准确的行数：执行并缓存结果，后续的 collect 直接使用缓存。
+            # 结果可能超出缓存预算而未被缓存，拆分后每个 endpoint 都会重新执行，因此只返回一个 endpoint
+            arrow_table = get_result_table(conn, dataframe_id, actions)
+            schema, num_rows, num_bytes = arrow_table.schema, arrow_table.num_rows, arrow_table.nbytes
+            ranges = [(0, None)]
+        else:
+            # collect / get_stream 的结果需要执行后才知道：不预先执行，只返回一个 endpoint，在 do_get 中流式执行
+            schema, num_rows, num_bytes = pa.schema([]), -1, -1
+            ranges = [(0, None)]
+        endpoints = []
+        for offset, length in ranges:
+            ticket = {"dataframe": dataframe, "max_chunksize": params.get("max_chunksize")}
+            if len(ranges) > 1:
+                ticket.update({"offset": offset, "length": length})
+            endpoints.append(pa.flight.FlightEndpoint(pa.flight.Ticket(json.dumps(ticket).encode("utf-8")), []))
         flight_info = pa.flight.FlightInfo(
             schema,
             descriptor,
             endpoints,
-            total_records=arrow_table.num_rows,
-            total_bytes=arrow_table.nbytes
+            total_records=num_rows,
+            total_bytes=num_bytes
         )
         return flight_info
 
     def do_get(self, context, ticket):
         ticket_data = json.loads(ticket.ticket.decode('utf-8'))
+        if ticket_data.get('type') == "file_range":
+            return self.file_range_stream(ticket_data)
         dataframe_id = json.loads(ticket_data.get('dataframe')).get('id')
         actions = json.loads(ticket_data.get('dataframe')).get('actions')
         connection_id = json.loads(ticket_data.get('dataframe')).get("connection_id")
         max_chunksize = ticket_data.get('max_chunksize')
         row_index = ticket_data.get('row_index')  # 获取行索引
+        offset = ticket_data.get('offset')  # 多 endpoint 下载时的行范围
+        length = ticket_data.get('length')
         column_name = ticket_data.get('column_name')  # 获取列名
         type = ticket_data.get('type')
 
-        # 从conn中获取dataframe.data
         conn = self.connections[connection_id]
-        arrow_table = conn.dataframes[dataframe_id].data
-        arrow_table = handle_prev_actions(arrow_table, actions)
 
         # todo: 暂时在这里处理collect_blob
         if type is not None and type == "collect_blob":
-            batches = arrow_table.to_batches()
-            updated_batches = []
-            for batch in batches:
-                path_column = batch.column(batch.schema.get_field_index("path")).to_pylist()
-                blob_column_index = batch.schema.get_field_index("blob")
-                blob_data = []
-                for path in path_column:
-                    try:
-                        file_path = FairdConfigManager.get_config().storage_local_path + path
-                        logger.info(f"Reading file: {file_path}")
-                        with open(file_path, "rb") as f:
-                            blob_data.append(f.read())
-                    except Exception as e:
-                        logger.error(f"Error reading file {path}: {e}")
-                        blob_data.append(None)
-                blob_array = pa.array(blob_data, type=pa.binary())
-                updated_batch = batch.set_column(blob_column_index, "blob", blob_array)
-                updated_batches.append(updated_batch)
-            return pa.flight.GeneratorStream(arrow_table.schema, iter(updated_batches))
+            # 线程池并发读取文件内容，批次按字节上限切分，读满一个批次就发送
+            config = FairdConfigManager.get_config()
+            loader = BlobLoader(config.storage_local_path, workers=config.blob_workers,
+                                batch_max_bytes=config.blob_batch_max_bytes, max_file_bytes=config.blob_max_file_bytes)
+            reader = get_result_stream(conn, dataframe_id, actions)
+            return pa.flight.GeneratorStream(BlobLoader.output_schema(reader.schema), loader.load(reader, max_chunksize))
+
+        if row_index is None and column_name is None:  # 如果没有指定行或列，则流式返回整个结果（或 endpoint 的行范围）
+            if offset is not None:
+                reader = get_range_stream(conn, dataframe_id, actions, offset, length)
+            else:
+                reader = get_result_stream(conn, dataframe_id, actions)
+            return pa.flight.GeneratorStream(reader.schema, rechunk_batches(reader, max_chunksize))
+
+        # 请求某行或某列时从conn中获取物化的结果表，优先使用结果缓存
+        arrow_table = get_result_table(conn, dataframe_id, actions)
 
         if column_name is not None and column_name == "blob":
             # 如果请求的是 blob 列
             row_data = arrow_table.slice(row_index, 1).to_pydict()
             path = row_data["path"][0]
 
-            # 生成流式加载的生成器
+            # 生成流式加载的生成器，每块是 memory map 的零拷贝切片，直接作为 blob 数组的数据缓冲区发送
             def blob_stream():
                 try:
                     chunk_size = 100 * 1024 * 1024 # 每次返回的最大块大小为 100MB
                     file_path = FairdConfigManager.get_config().storage_local_path + path
                     logger.info(f"Reading file: {file_path}")
-                    with open(file_path, "rb") as f:
-                        while chunk := f.read(chunk_size):
-                            yield pa.RecordBatch.from_arrays([pa.array([chunk], type=pa.binary())], ["blob"])
+                    for _, chunk in read_file_range(file_path, 0, None, chunk_size):
+                        yield pa.RecordBatch.from_arrays([binary_array([chunk])], ["blob"])
                 except Exception as e:
                     logger.error(f"Error reading file {path}: {e}")
                     yield pa.RecordBatch.from_arrays([pa.array([None], type=pa.binary())], ["blob"])
@@ -135,18 +175,12 @@ class FairdServiceProducer(pa.flight.FlightServerBase):
                 pa.schema([(col, pa.binary() if col == "blob" else arrow_table.schema.field(col).type) for col in row_data.keys()]),
                 iter([pa.RecordBatch.from_pydict(row_data)])
             )
-        elif column_name is not None:  # 如果请求某列
+        else:  # 如果请求某列
             column_data = arrow_table[column_name].combine_chunks()
             return pa.flight.GeneratorStream(
                 pa.schema([(column_name, column_data.type)]),
                 iter([pa.RecordBatch.from_arrays([column_data], [column_name])])
             )
-        else: # 如果没有指定行或列，则返回整个表
-            if max_chunksize:
-                batches = arrow_table.to_batches(max_chunksize)
-            else:
-                batches = arrow_table.to_batches()
-            return pa.flight.GeneratorStream(arrow_table.schema, iter(batches))
 
     def do_put(self, context, descriptor, reader, writer):
         # 实现数据写入逻辑
@@ -159,23 +193,23 @@ class FairdServiceProducer(pa.flight.FlightServerBase):
             auth_type = ticket_data.get('auth_type')
             if auth_type == "oauth":
                 token = connect_server_with_oauth(ticket_data.get('type'), ticket_data.get('username'), ticket_data.get('password'))
-                conn = FairdConnection(clientIp=ticket_data.get('clientIp'), username=ticket_data.get('username'), token=token)
+                conn = self.create_connection(clientIp=ticket_data.get('clientIp'), username=ticket_data.get('username'), token=token)
                 self.connections[conn.connectionID] = conn
                 return iter([pa.flight.Result(json.dumps({"token": token, "connectionID": conn.connectionID}).encode("utf-8"))])
             elif auth_type == "controld":
                 verified = connect_server_with_controld(ticket_data.get('controld_domain_name'), ticket_data.get('signature'))
                 if verified:
-                    conn = FairdConnection(clientIp=ticket_data.get('clientIp'))
+                    conn = self.create_connection(clientIp=ticket_data.get('clientIp'))
                     self.connections[conn.connectionID] = conn
                     return iter([pa.flight.Result(json.dumps({"connectionID": conn.connectionID}).encode("utf-8"))])
                 else:
                     return iter([pa.flight.Result(json.dumps({"errorMsg": "connect verification error"}).encode("utf-8"))])
             elif auth_type == "anonymous":
-                conn = FairdConnection(clientIp=ticket_data.get('clientIp'))
+                conn = self.create_connection(clientIp=ticket_data.get('clientIp'))
                 self.connections[conn.connectionID] = conn
                 return iter([pa.flight.Result(json.dumps({"connectionID": conn.connectionID}).encode("utf-8"))])
             else:
-                conn = FairdConnection(clientIp=ticket_data.get('clientIp'))
+                conn = self.create_connection(clientIp=ticket_data.get('clientIp'))
                 self.connections[conn.connectionID] = conn
                 return iter([pa.flight.Result(json.dumps({"connectionID": conn.connectionID}).encode("utf-8"))])
 
@@ -247,7 +281,7 @@ class FairdServiceProducer(pa.flight.FlightServerBase):
             ticket_data = json.loads(action.body.to_pybytes().decode("utf-8"))
             dataframe_name = ticket_data.get("dataframe_name")
             connection_id = ticket_data.get("connection_id")
-            sample_json = self.sample_action(dataframe_name)
+            sample_json = self.sample_action(dataframe_name, reservoir=ticket_data.get("reservoir", False))
             conn = self.connections.get(connection_id)
             if conn:
                 access_logger.info(f"Dataframe: {dataframe_name}, Action: sample, Client IP: {conn.clientIp}, Username: {conn.username}")
@@ -265,15 +299,46 @@ class FairdServiceProducer(pa.flight.FlightServerBase):
 
         elif action_type == "open":
             ticket_data = json.loads(action.body.to_pybytes().decode("utf-8"))
-            connection_id = ticket_data.get('connection_id')
-            dataframe_name = ticket_data.get("dataframe_name")  # uri
-            # open with parser
-            df = self.open_action(dataframe_name)
-            # put dataframe to connection memory
+            self.open_dataframe(ticket_data.get("dataframe_name"), ticket_data.get('connection_id'))
+            return None
+
+        elif action_type in ("sample_many", "count_many", "open_many"):
+            # 一次请求处理多个 dataframe：在线程池中并发执行，按完成顺序逐个返回结果
+            ticket_data = json.loads(action.body.to_pybytes().decode("utf-8"))
+            connection_id = ticket_data.get("connection_id")
+            if action_type == "sample_many":
+                reservoir = ticket_data.get("reservoir", False)
+                func = lambda name: self.sample_action(name, reservoir=reservoir)
+            elif action_type == "count_many":
+                func = self.count_action
+            else:
+                def func(name):
+                    self.open_dataframe(name, connection_id)
+                    return None
             conn = self.connections.get(connection_id)
-            conn.dataframes[dataframe_name] = df
             if conn:
-                access_logger.info(f"Dataframe: {dataframe_name}, Action: open, Client IP: {conn.clientIp}, Username: {conn.username}")
+                access_logger.info(f"Dataframes: {len(ticket_data.get('dataframe_names', []))}, Action: {action_type}, "
+                                   f"Client IP: {conn.clientIp}, Username: {conn.username}")
+            return self.run_many(ticket_data.get("dataframe_names", []), func)
+
+        elif action_type == "close_dataframe":
+            ticket_data = json.loads(action.body.to_pybytes().decode("utf-8"))
+            self.close_dataframe(ticket_data.get("dataframe_name"), ticket_data.get('connection_id'))
+            return None
+
+        elif action_type == "disconnect":
+            ticket_data = json.loads(action.body.to_pybytes().decode("utf-8"))
+            connection_id = ticket_data.get('connection_id')
+            conn = self.connections.pop(connection_id)
+            if conn:
+                if conn.result_cache is not self.shared_result_cache:
+                    conn.result_cache.clear()
+                else:
+                    for dataframe_name, source in list(conn.dataframes.items()):
+                        released = self.table_registry.release((connection_id, dataframe_name))
+                        self.invalidate_results(conn, dataframe_name, source, released)
+                access_logger.info(f"Action: disconnect, Client IP: {conn.clientIp}, Username: {conn.username}")
+            self.table_registry.release_connection(connection_id)
             return None
 
         elif action_type == "get_dataframe_stream":
@@ -284,34 +349,51 @@ class FairdServiceProducer(pa.flight.FlightServerBase):
             conn = self.connections.get(connection_id)
             if max_chunksize is None:
                 max_chunksize = 1024 * 1024 * 5
-            # 获取文件路径
-            parsed_url = urlparse(dataframe_name)
-            relative_path = '/' + parsed_url.path.split('/', 2)[2]  # 相对路径
-            file_path = FairdConfigManager.get_config().storage_local_path + relative_path  # 绝对路径
-            # 分块生成器
+            file_path = dataframe_file_path(dataframe_name)  # 绝对路径
+            # 分块生成器，offset / length 指定时只返回该字节范围，用于断点续传
             def file_chunk_generator(file_path, chunk_size=max_chunksize):
                 try:
-                    with open(file_path, "rb") as file:
-                        while chunk := file.read(chunk_size):
-                            access_logger.info(f"Dataframe: {dataframe_name}, Action: get_dataframe_stream, Data Size: {len(chunk)} Bytes, "
-                                               f"Client IP: {conn.clientIp}, Username: {conn.username}")
-                            yield pa.flight.Result(chunk)
+                    for _, chunk in read_file_range(file_path, ticket_data.get("offset", 0), ticket_data.get("length"), chunk_size):
+                        access_logger.info(f"Dataframe: {dataframe_name}, Action: get_dataframe_stream, Data Size: {chunk.size} Bytes, "
+                                           f"Client IP: {conn.clientIp}, Username: {conn.username}")
+                        yield pa.flight.Result(chunk)
                 except FileNotFoundError:
                     raise ValueError(f"文件未找到: {file_path}")
                 except Exception as e:
                     raise ValueError(f"读取文件失败: {str(e)}")
             return file_chunk_generator(file_path)
-    
+
+        elif action_type == "stat_dataframe_file":
+            ticket_data = json.loads(action.body.to_pybytes().decode("utf-8"))
+            file_path = dataframe_file_path(ticket_data.get("dataframe_name"))
+            if not os.path.isfile(file_path):
+                raise ValueError(f"文件未找到: {file_path}")
+            stat = {"size": os.path.getsize(file_path), "version": file_version(file_path)}
+            return iter([pa.flight.Result(json.dumps(stat).encode("utf-8"))])
+
         elif action_type == "to_string":
             return self.to_string_action(context, action)
 
+        elif action_type == "get_cache_stats":
+            ticket_data = json.loads(action.body.to_pybytes().decode("utf-8"))
+            conn = self.connections.get(ticket_data.get("connection_id"))
+            stats = conn.result_cache.stats() if conn else {}
+            stats["table_registry"] = self.table_registry.stats()
+            return iter([pa.flight.Result(json.dumps(stats).encode("utf-8"))])
+
         elif action_type.startswith("compute_"):
             return handle_compute_actions(self.connections, action)
 
         else:
             return None
 
-    def sample_action(self, dataframe_name):
+    def create_connection(self, clientIp=None, username=None, token=None):
+        result_cache = self.shared_result_cache
+        if result_cache is None:
+            result_cache = ResultCache(FairdConfigManager.get_config().result_cache_max_bytes)
+        return FairdConnection(clientIp=clientIp, username=username, token=token, result_cache=result_cache)
+
+    def sample_action(self, dataframe_name, reservoir=False):
         parsed_url = urlparse(dataframe_name)
         dataset_name = f"{parsed_url.scheme}://{parsed_url.netloc}/{parsed_url.path.split('/', 2)[1]}"
         relative_path = '/' + parsed_url.path.split('/', 2)[2]  # 相对路径
@@ -335,7 +417,11 @@ class FairdServiceProducer(pa.flight.FlightServerBase):
             if not parser_class:
                 raise ValueError(f"Unsupported file extension: {file_extension}")
             parser = parser_class()
-            sample_table = parser.sample(file_path)
+            if reservoir and parser_class is csv_parser.CSVParser:
+                # 目前只有 CSV 支持对整个文件做蓄水池抽样
+                sample_table = parser.sample(file_path, reservoir=True)
+            else:
+                sample_table = parser.sample(file_path)
             if hasattr(parser, "count") and callable(getattr(parser, "count", None)):
                 try:
                     total_count = parser.count(file_path)
@@ -397,7 +483,60 @@ class FairdServiceProducer(pa.flight.FlightServerBase):
         }
         return rtn_json
 
-    def open_action(self, dataframe_name):
+    def open_dataframe(self, dataframe_name, connection_id):
+        """打开 dataframe 并放入连接的 dataframes 中。"""
+        # open with parser
+        df = self.open_action(dataframe_name, connection_id)
+        # put dataframe to connection memory
+        conn = self.connections.get(connection_id)
+        if conn:
+            conn.dataframes[dataframe_name] = df
+            if conn.result_cache is not self.shared_result_cache:
+                conn.result_cache.invalidate(dataframe_name)
+            access_logger.info(f"Dataframe: {dataframe_name}, Action: open, Client IP: {conn.clientIp}, Username: {conn.username}")
+        return df
+
+    def close_dataframe(self, dataframe_name, connection_id):
+        """关闭 dataframe：从连接中移除并释放共享表的引用。"""
+        conn = self.connections.get(connection_id)
+        source = conn.dataframes.pop(dataframe_name, None) if conn else None
+        released = self.table_registry.release((connection_id, dataframe_name))
+        if conn:
+            self.invalidate_results(conn, dataframe_name, source, released)
+            access_logger.info(f"Dataframe: {dataframe_name}, Action: close_dataframe, Client IP: {conn.clientIp}, Username: {conn.username}")
+
+    def invalidate_results(self, conn, dataframe_name, source, released):
+        """
+        close 时使 dataframe 的结果缓存失效。连接级的结果缓存直接失效；
+        服务端共享的结果缓存（cache.result.scope=server）以来源版本区分结果，
+        只在该版本不再被任何连接持有时（共享表已从注册表移除，或来源本就不经过注册表）失效该版本。
+        """
+        if conn.result_cache is not self.shared_result_cache:
+            conn.result_cache.invalidate(dataframe_name)
+        elif source is not None and (released or source.parser is None):
+            conn.result_cache.invalidate(dataframe_name, source.version)
+
+    def run_many(self, dataframe_names, func):
+        """
+        在服务端共享的线程池中对每个 dataframe 执行 func，按完成顺序返回 Result：
+        {"dataframe_name": ..., "result": ...}，失败时为 {"dataframe_name": ..., "error": ...}，单个失败不影响其它。
+        """
+        futures = {self.batch_executor.submit(func, name): name for name in dict.fromkeys(dataframe_names)}
+        try:
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    item = {"dataframe_name": name, "result": future.result()}
+                except Exception as e:
+                    logger.warning(f"批量操作 {name} 失败: {e}")
+                    item = {"dataframe_name": name, "error": str(e)}
+                yield pa.flight.Result(json.dumps(item).encode("utf-8"))
+        finally:
+            # 客户端提前断开时取消尚未开始的任务
+            for future in futures:
+                future.cancel()
+
+    def open_action(self, dataframe_name, connection_id=None):
         parsed_url = urlparse(dataframe_name)
         dataset_name = f"{parsed_url.scheme}://{parsed_url.netloc}/{parsed_url.path.split('/', 2)[1]}"
         relative_path = '/' + parsed_url.path.split('/', 2)[2]  # 相对路径
@@ -405,8 +544,10 @@ class FairdServiceProducer(pa.flight.FlightServerBase):
         file_extension = os.path.splitext(file_path)[1].lower()
         # 暂时这样适配文件夹类型
         if file_extension == "":
+            self.table_registry.release((connection_id, dataframe_name))
             arrow_table = dir_parser.DirParser().parse_dir(file_path, dataset_name)
-            return DataFrame(id=dataframe_name, data=arrow_table)
+            # 目录不经过共享表注册表，每次 open 使用独立的版本
+            return TableSource(id=dataframe_name, data=arrow_table, version=uuid.uuid4().hex)
         parser_switch = {
             ".csv": csv_parser.CSVParser,
             ".json": None,
@@ -418,9 +559,33 @@ class FairdServiceProducer(pa.flight.FlightServerBase):
         parser_class = parser_switch.get(file_extension)
         if not parser_class:
             raise ValueError(f"Unsupported file extension: {file_extension}")
-        parser = parser_class()
-        arrow_table = parser.parse(file_path)
-        return DataFrame(id=dataframe_name, data=arrow_table)
+        if not os.path.exists(file_path):
+            raise ValueError(f"文件未找到: {file_path}")
+        # 延迟解析：select/filter/limit 等在执行时下推到解析器，只在需要完整表时才 parse；
+        # 同一文件（路径 + mtime 相同）在所有连接间共享同一个 TableSource
+        return self.table_registry.acquire((connection_id, dataframe_name), dataframe_name, file_path, parser_class)
+
+    def file_range_stream(self, ticket_data):
+        """
+        按字节范围下载原始文件：ticket 中的 offset / length 指定范围，每个批次是一块数据及其 CRC32，
+        客户端校验后即可记录已完成的偏移，中断后从该偏移继续。version 与文件当前版本不一致时拒绝，
+        避免把新旧两个版本的内容拼在一起。
+        """
+        dataframe_name = ticket_data.get("dataframe_name")
+        file_path = dataframe_file_path(dataframe_name)
+        if not os.path.isfile(file_path):
+            raise ValueError(f"文件未找到: {file_path}")
+        version = ticket_data.get("version")
+        if version is not None and version != file_version(file_path):
+            raise ValueError(f"文件已变化，请重新下载: {dataframe_name}")
+        offset = ticket_data.get("offset", 0)
+        length = ticket_data.get("length")
+        conn = self.connections.get(ticket_data.get("connection_id"))
+        if conn:
+            access_logger.info(f"Dataframe: {dataframe_name}, Action: file_range, Offset: {offset}, Length: {length}, "
+                               f"Client IP: {conn.clientIp}, Username: {conn.username}")
+        chunk_size = ticket_data.get("max_chunksize") or FILE_RANGE_CHUNK_BYTES
+        return pa.flight.GeneratorStream(FILE_RANGE_SCHEMA, file_range_batches(file_path, offset, length, chunk_size))
 
     def to_string_action(self, context, action):
         params = json.loads(action.body.to_pybytes().decode("utf-8"))
@@ -434,12 +599,53 @@ class FairdServiceProducer(pa.flight.FlightServerBase):
         display_all = params.get("display_all", False)
 
         conn = self.connections[connection_id]
-        arrow_table = conn.dataframes[dataframe_id].data
-        arrow_table = handle_prev_actions(arrow_table, actions)
+        arrow_table = get_result_table(conn, dataframe_id, actions)
 
         table_str = format_arrow_table(arrow_table, head_rows, tail_rows, first_cols, last_cols, display_all)
         return iter([pa.flight.Result(table_str.encode("utf-8"))])
 
+FILE_RANGE_CHUNK_BYTES = 4 * 1024 * 1024
+FILE_RANGE_SCHEMA = pa.schema([("offset", pa.int64()), ("data", pa.binary()), ("crc32", pa.uint32())])
+
+def dataframe_file_path(dataframe_name):
+    """dataframe 名（dacp://host:port/dataset/relative/path）对应的本地绝对路径。"""
+    parsed_url = urlparse(dataframe_name)
+    relative_path = '/' + parsed_url.path.split('/', 2)[2]  # 相对路径
+    return FairdConfigManager.get_config().storage_local_path + relative_path
+
+def file_version(file_path):
+    """文件版本标识（大小 + mtime），续传前后版本不一致说明文件被修改过。"""
+    stat = os.stat(file_path)
+    return f"{stat.st_size}-{stat.st_mtime_ns}"
+
+def read_file_range(file_path, offset=0, length=None, chunk_size=FILE_RANGE_CHUNK_BYTES):
+    """以 memory map 打开文件，按 chunk_size 逐块返回 [offset, offset + length) 内的 (偏移, pa.Buffer)，块是映射内存的零拷贝切片。"""
+    with pa.memory_map(file_path, "r") as source:
+        end = source.size() if length is None else min(source.size(), offset + length)
+        position = offset
+        while position < end:
+            source.seek(position)
+            chunk = source.read_buffer(min(chunk_size, end - position))
+            yield position, chunk
+            position += chunk.size
+
+def file_range_batches(file_path, offset=0, length=None, chunk_size=FILE_RANGE_CHUNK_BYTES):
+    """把 read_file_range 的每一块包装为一行 RecordBatch（偏移、数据、CRC32），数据列直接引用映射内存。"""
+    for position, chunk in read_file_range(file_path, offset, length, chunk_size):
+        yield pa.RecordBatch.from_arrays(
+            [pa.array([position], pa.int64()), binary_array([chunk]), pa.array([zlib.crc32(chunk)], pa.uint32())],
+            schema=FILE_RANGE_SCHEMA)
+
+def split_row_ranges(num_rows, total_bytes, max_endpoints, min_bytes):
+    """把结果按行均分为若干 (offset, length)，每段不小于 min_bytes，段数不超过 max_endpoints。"""
+    if num_rows <= 0 or max_endpoints <= 1 or min_bytes <= 0:
+        return [(0, num_rows)]
+    count = int(min(max_endpoints, total_bytes // min_bytes, num_rows))
+    if count <= 1:
+        return [(0, num_rows)]
+    step = math.ceil(num_rows / count)
+    return [(start, min(step, num_rows - start)) for start in range(0, num_rows, step)]
+
 # 将字典中的 bytes 类型键转换为字符串类型
 def decode_bytes_keys(data):
     if isinstance(data, dict):
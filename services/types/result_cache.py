@@ -0,0 +1,83 @@
+import json
+import threading
+from collections import OrderedDict
+
+from utils.logger_utils import get_logger
+logger = get_logger(__name__)
+
+
+class ResultCache:
+    """
+    物化结果缓存：以 (dataframe_id, 来源版本, 规范化后的 actions) 为键缓存 action 链执行后的 Arrow Table。
+    来源版本是 dataframe 对应数据的标识（如共享表注册表的 (真实路径, mtime, size, 解析器)），
+    文件被修改后版本随之变化，持有旧版本的连接写入的结果不会被新版本命中。
+    按字节预算做 LRU 淘汰，并统计命中/未命中次数。
+    """
+
+    def __init__(self, max_bytes: int = 1024 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (dataframe_id, version, arrow_table, nbytes)
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(dataframe_id, actions, version=None):
+        # actions 经过 json 往返后 tuple 变为 list，这里统一序列化为字符串作为键
+        canonical_actions = json.dumps(actions or [], sort_keys=True, separators=(",", ":"), default=str)
+        return dataframe_id, version, canonical_actions
+
+    def get(self, dataframe_id, actions, version=None):
+        key = self.make_key(dataframe_id, actions, version)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, dataframe_id, actions, arrow_table, version=None):
+        if self.max_bytes <= 0:
+            return
+        nbytes = arrow_table.nbytes
+        if nbytes > self.max_bytes:
+            logger.debug(f"结果大小 {nbytes} 字节超过缓存预算 {self.max_bytes}，不缓存")
+            return
+        key = self.make_key(dataframe_id, actions, version)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._total_bytes -= old[3]
+            self._entries[key] = (dataframe_id, version, arrow_table, nbytes)
+            self._total_bytes += nbytes
+            while self._total_bytes > self.max_bytes and self._entries:
+                _, (_, _, _, evicted_bytes) = self._entries.popitem(last=False)
+                self._total_bytes -= evicted_bytes
+                self.evictions += 1
+
+    def invalidate(self, dataframe_id, version=None):
+        """使 dataframe 的结果失效，指定 version 时只失效该版本的结果。"""
+        with self._lock:
+            for key in [k for k, v in self._entries.items()
+                        if v[0] == dataframe_id and (version is None or v[1] == version)]:
+                self._total_bytes -= self._entries.pop(key)[3]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "total_bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
@@ -0,0 +1,81 @@
+import os
+import threading
+
+from compute.interactive.plan import TableSource
+from utils.logger_utils import get_logger
+logger = get_logger(__name__)
+
+
+class TableRegistry:
+    """
+    服务端共享的表注册表：以 (文件真实路径, mtime, size, 解析器) 为键，
+    所有连接 open 同一个文件时拿到同一个 TableSource，从而共享同一份 memory-mapped 的 Arrow Table。
+    每个持有者 (connection_id, dataframe_name) 计一次引用，最后一个持有者释放后移除该表。
+    文件被修改后 mtime 变化，新的 open 会得到新的表，旧表在其持有者释放后回收。
+    """
+
+    def __init__(self):
+        self._entries = {}  # key -> TableSource
+        self._refs = {}  # key -> set(holder)
+        self._holders = {}  # holder -> key
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(file_path, parser_class):
+        real_path = os.path.realpath(file_path)
+        stat = os.stat(real_path)
+        return real_path, stat.st_mtime_ns, stat.st_size, parser_class.__name__
+
+    def acquire(self, holder, dataframe_name, file_path, parser_class) -> TableSource:
+        """为 holder 获取 file_path 对应的共享 TableSource，holder 之前持有的表会先被释放。"""
+        key = self.make_key(file_path, parser_class)
+        with self._lock:
+            self._release_locked(holder)
+            source = self._entries.get(key)
+            if source is None:
+                source = TableSource(id=dataframe_name, file_path=file_path, parser=parser_class(), version=key)
+                self._entries[key] = source
+                self._refs[key] = set()
+                logger.info(f"共享表注册: {key[0]}")
+            self._refs[key].add(holder)
+            self._holders[holder] = key
+            return source
+
+    def release(self, holder) -> bool:
+        """释放 holder 持有的表，返回该表是否因此被移除。"""
+        with self._lock:
+            return self._release_locked(holder)
+
+    def release_connection(self, connection_id) -> int:
+        """释放某个连接持有的全部表，返回释放的持有数。"""
+        with self._lock:
+            holders = [holder for holder in self._holders if holder[0] == connection_id]
+            for holder in holders:
+                self._release_locked(holder)
+            return len(holders)
+
+    def _release_locked(self, holder) -> bool:
+        key = self._holders.pop(holder, None)
+        if key is None:
+            return False
+        refs = self._refs.get(key)
+        refs.discard(holder)
+        if refs:
+            return False
+        del self._refs[key]
+        del self._entries[key]
+        logger.info(f"共享表释放: {key[0]}")
+        return True
+
+    def ref_count(self, file_path, parser_class) -> int:
+        key = self.make_key(file_path, parser_class)
+        with self._lock:
+            return len(self._refs.get(key, ()))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "tables": len(self._entries),
+                "holders": len(self._holders),
+                "materialized": sum(1 for source in self._entries.values() if source.is_materialized),
+            }
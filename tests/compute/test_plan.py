@@ -0,0 +1,87 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+import numpy as np
+import pyarrow as pa
+import pyarrow.csv as csv
+import pytest
+from compute.interactive.interactive import execute_plan, execute_plan_stream, handle_prev_actions
+from compute.interactive.plan import LogicalPlan, TableSource
+from parser import cache_manager
+from parser.csv_parser import CSVParser
+
+ACTION_CHAINS = [
+    [["select", {"columns": ["id", "lat"]}], ["limit", {"rowNum": 5}]],
+    [["slice", {"offset": 10, "length": 100}], ["limit", {"rowNum": 7}], ["select", {"columns": ["lat"]}]],
+    [["filter", {"expression": "lat > 30"}], ["select", {"columns": ["id"]}], ["slice", {"offset": 3, "length": 4}]],
+    [["filter", {"expression": "lat > 30"}], ["limit", {"rowNum": 50}], ["filter", {"expression": "lon < 0"}]],
+    [["select", {"columns": ["id", "lat"]}], ["sort", {"column": "lat", "order": "descending"}], ["limit", {"rowNum": 3}]],
+    [["limit", {"rowNum": 20}], ["map", {"column": "id", "func": lambda x: x * 2}], ["filter", {"expression": "id_mapped > 10"}]],
+]
+
+@pytest.fixture
+def csv_file(tmp_path):
+    n = 5000
+    rng = np.random.default_rng(0)
+    table = pa.table({
+        "id": np.arange(n),
+        "lat": rng.uniform(-90, 90, n),
+        "lon": rng.uniform(-180, 180, n),
+    })
+    path = tmp_path / "plan.csv"
+    csv.write_csv(table, str(path))
+    return str(path), table
+
+def test_plan_pushdown():
+    plan = LogicalPlan.from_actions(ACTION_CHAINS[2])
+    assert plan.columns == ["id"]
+    assert plan.predicate_columns == ["lat"]
+    assert plan.scan_columns() == ["id", "lat"]
+    assert (plan.offset, plan.length) == (3, 4)
+    assert plan.remaining_actions == []
+
+    plan = LogicalPlan.from_actions(ACTION_CHAINS[3])
+    assert (plan.offset, plan.length) == (0, 50)
+    assert plan.remaining_actions == [ACTION_CHAINS[3][2]]
+
+    plan = LogicalPlan.from_actions(ACTION_CHAINS[1])
+    assert (plan.offset, plan.length) == (10, 7)
+
+@pytest.mark.parametrize("actions", ACTION_CHAINS)
+def test_plan_matches_full_execution(csv_file, actions):
+    path, table = csv_file
+    expected = handle_prev_actions(table, actions)
+    lazy = TableSource(id=path, file_path=path, parser=CSVParser())
+    result = execute_plan(lazy, actions)
+    assert not lazy.is_materialized
+    assert result.equals(expected)
+    materialized = TableSource(id=path, data=table)
+    assert execute_plan(materialized, actions).equals(expected)
+
+def test_full_scan_materializes_once(csv_file, tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_manager, "DEFAULT_CACHE_ROOT", str(tmp_path / "cache"))
+    monkeypatch.setattr(cache_manager, "_cache_manager", None)
+    path, table = csv_file
+    parser = CSVParser()
+    source = TableSource(id=path, file_path=path, parser=parser)
+    actions = [["filter", {"expression": "lat > 30"}]]
+    assert execute_plan(source, actions).equals(handle_prev_actions(table, actions))
+    # 只有谓词时需要读取整个文件：写入缓存后，之后的查询从缓存读取而不是重新解析 CSV
+    assert source.is_materialized and parser.lookup_arrow_cache(path) is not None
+    monkeypatch.setattr(parser, "parse", None)
+    assert execute_plan(source, actions).equals(handle_prev_actions(table, actions))
+
+@pytest.mark.parametrize("actions", ACTION_CHAINS)
+def test_stream_matches_full_execution(csv_file, actions):
+    path, table = csv_file
+    expected = handle_prev_actions(table, actions)
+    lazy = TableSource(id=path, file_path=path, parser=CSVParser())
+    reader = execute_plan_stream(lazy, actions)
+    assert pa.Table.from_batches(list(reader), schema=reader.schema).equals(expected)
+
+def test_stream_empty_result(csv_file):
+    path, table = csv_file
+    source = TableSource(id=path, data=table)
+    reader = execute_plan_stream(source, [["filter", {"expression": "lat > 1000"}], ["select", {"columns": ["id"]}]])
+    assert reader.schema.names == ["id"]
+    assert reader.read_all().num_rows == 0
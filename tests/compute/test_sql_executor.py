@@ -0,0 +1,73 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+import types
+import numpy as np
+import pyarrow as pa
+import pyarrow.csv as csv
+import pytest
+from compute.interactive import sql_executor
+from compute.interactive.interactive import execute_plan, execute_plan_stream, handle_prev_actions
+from compute.interactive.plan import TableSource
+from compute.interactive.sql_executor import cache_relation, open_connection
+from parser import cache_manager
+from parser.csv_parser import CSVParser
+
+SQL_CHAINS = [
+    [["sql", {"sql_str": "select id, lat from dataframe where lon < 0 order by id"}]],
+    [["filter", {"expression": "lat > 30"}], ["select", {"columns": ["id", "lat"]}],
+     ["sql", {"sql_str": "select count(*) as n, sum(id) as s from dataframe"}]],
+    [["slice", {"offset": 100, "length": 1000}], ["sql", {"sql_str": "select * from dataframe order by lat desc"}],
+     ["limit", {"rowNum": 5}]],
+    [["sql", {"sql_str": "select a.id from dataframe a join dataframe b on a.id = b.id + 1 order by a.id"}]],
+    [["map", {"column": "id", "func": lambda x: x * 2}],
+     ["sql", {"sql_str": "select max(id_mapped) as m from dataframe"}]],
+    [["sort", {"column": "lat"}], ["sql", {"sql_str": "select id from dataframe limit 3"}],
+     ["sql", {"sql_str": "select count(*) as n from dataframe"}]],
+]
+
+@pytest.fixture
+def cached_csv(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_manager, "DEFAULT_CACHE_ROOT", str(tmp_path / "cache"))
+    monkeypatch.setattr(cache_manager, "_cache_manager", None)
+    n = 5000
+    rng = np.random.default_rng(0)
+    table = pa.table({"id": np.arange(n), "lat": rng.uniform(-90, 90, n), "lon": rng.uniform(-180, 180, n)})
+    path = str(tmp_path / "sql.csv")
+    csv.write_csv(table, path)
+    parser = CSVParser()
+    parser.parse(path)
+    return path, parser, table
+
+@pytest.mark.parametrize("actions", SQL_CHAINS)
+def test_sql_matches_materialized_execution(cached_csv, actions):
+    path, parser, table = cached_csv
+    expected = handle_prev_actions(table, actions)
+    source = TableSource(id=path, file_path=path, parser=parser)
+    reader = execute_plan_stream(source, actions)
+    assert reader.read_all().equals(expected)
+    assert execute_plan(source, actions).equals(expected)
+    assert not source.is_materialized or actions[0][0] in ("map", "sort")
+
+def test_pushable_actions_scan_cache_file(cached_csv):
+    path, parser, _ = cached_csv
+    source = TableSource(id=path, file_path=path, parser=parser)
+    dataset, view = cache_relation(source, [["filter", {"expression": "lat > 0"}], ["select", {"columns": ["id"]}],
+                                            ["slice", {"offset": 5, "length": 10}]])
+    assert dataset.files == [parser.lookup_arrow_cache(path)]
+    assert view.endswith('SELECT "id" FROM __faird_source LIMIT 10 OFFSET 5')
+    assert cache_relation(source, [["map", {"column": "id", "func": abs}]]) is None
+    assert cache_relation(TableSource(id="t", data=pa.table({"a": [1]})), []) is None
+
+def test_connection_limits_from_config(monkeypatch, tmp_path):
+    config = types.SimpleNamespace(sql_threads=2, sql_memory_limit="256MB", sql_temp_directory=str(tmp_path / "spill"),
+                                   sql_batch_rows=100)
+    monkeypatch.setattr(sql_executor.FairdConfigManager, "get_config", classmethod(lambda cls: config))
+    con = open_connection()
+    try:
+        assert con.execute("select current_setting('threads')").fetchone()[0] == 2
+        assert con.execute("select current_setting('temp_directory')").fetchone()[0] == str(tmp_path / "spill")
+    finally:
+        con.close()
+    reader = sql_executor.sql_stream(pa.table({"a": np.arange(1000)}), "select a from dataframe")
+    assert max(batch.num_rows for batch in reader) <= 100
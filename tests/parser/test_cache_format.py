@@ -0,0 +1,78 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as csv
+import pyarrow.parquet as pq
+import pytest
+from compute.interactive.interactive import execute_plan, handle_prev_actions
+from compute.interactive.plan import TableSource
+from parser import abstract_parser, cache_manager, csv_parser
+from parser.csv_parser import CSVParser
+
+@pytest.fixture
+def csv_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_manager, "DEFAULT_CACHE_ROOT", str(tmp_path / "cache"))
+    monkeypatch.setattr(cache_manager, "_cache_manager", None)
+    monkeypatch.setattr(abstract_parser, "_COUNT_MEMO", abstract_parser.OrderedDict())
+    # 小块大小使缓存中有多个批次 / 行组
+    monkeypatch.setattr(csv_parser, "DEFAULT_BLOCK_SIZE", 64 * 1024)
+    n = 50000
+    table = pa.table({"id": np.arange(n), "value": np.random.default_rng(0).random(n)})
+    path = str(tmp_path / "fmt.csv")
+    csv.write_csv(table, path)
+    return path, csv.read_csv(path)
+
+def make_parser(monkeypatch, cache_format):
+    monkeypatch.setattr(CSVParser, "cache_format", lambda self: cache_format)
+    return CSVParser()
+
+@pytest.mark.parametrize("cache_format", cache_manager.CACHE_FORMATS)
+def test_cache_formats_roundtrip(csv_file, monkeypatch, cache_format):
+    path, expected = csv_file
+    parser = make_parser(monkeypatch, cache_format)
+    assert parser.parse(path).equals(expected)
+    cache_path = parser.lookup_arrow_cache(path)
+    assert cache_path.endswith(".parquet" if cache_format == "parquet" else ".arrow")
+    assert parser.count(path) == expected.num_rows
+    sliced = parser.scan(path, ["value"], 12345, 20000).read_all()
+    assert sliced.equals(expected.select(["value"]).slice(12345, 20000))
+
+def test_switching_format_replaces_cache(csv_file, monkeypatch):
+    path, _ = csv_file
+    ipc_path = make_parser(monkeypatch, "ipc").parse(path) and CSVParser().lookup_arrow_cache(path)
+    parquet_parser = make_parser(monkeypatch, "parquet")
+    parquet_parser.parse(path)
+    assert not os.path.exists(ipc_path)
+    assert parquet_parser.lookup_arrow_cache(path).endswith(".parquet")
+
+def test_parquet_predicate_skips_row_groups(csv_file, monkeypatch):
+    path, expected = csv_file
+    parser = make_parser(monkeypatch, "parquet")
+    parser.parse(path)
+    cache_path = parser.lookup_arrow_cache(path)
+    parquet_file = pq.ParquetFile(cache_path)
+    assert parquet_file.metadata.num_row_groups > 2
+
+    predicate = pc.field("id") >= 45000
+    groups = cache_manager.parquet_row_groups(parquet_file, cache_path, predicate)
+    assert 0 < len(groups) < parquet_file.metadata.num_row_groups
+    assert groups[-1][1] + groups[-1][2] == expected.num_rows
+
+    actions = [["filter", {"expression": "id >= 45000"}], ["select", {"columns": ["value"]}]]
+    source = TableSource(id=path, file_path=path, parser=parser)
+    assert execute_plan(source, actions).equals(handle_prev_actions(expected, actions))
+
+@pytest.mark.parametrize("cache_format", ["ipc_lz4", "ipc_zstd"])
+def test_count_compressed_cache_reads_no_batches(csv_file, monkeypatch, cache_format):
+    path, expected = csv_file
+    parser = make_parser(monkeypatch, cache_format)
+    parser.parse(path)
+    cache_path = parser.lookup_arrow_cache(path)
+    monkeypatch.setattr(pa.ipc.RecordBatchFileReader, "get_batch", None)
+    assert cache_manager.arrow_file_num_rows(cache_path) == expected.num_rows
+    # 没有 zone map 时只读取消息头
+    os.remove(cache_manager.zone_map_path(cache_path))
+    assert cache_manager.arrow_file_num_rows(cache_path) == expected.num_rows
@@ -0,0 +1,116 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+import pyarrow as pa
+import pyarrow.csv as csv
+import pyarrow.ipc as ipc
+import pytest
+from parser.cache_manager import ArrowCacheManager
+from parser import cache_manager
+from parser.csv_parser import CSVParser
+
+def write_table(table):
+    def write_func(path):
+        with ipc.new_file(path, table.schema) as writer:
+            writer.write_table(table)
+    return write_func
+
+@pytest.fixture
+def manager(tmp_path):
+    return ArrowCacheManager(root=str(tmp_path / "cache"), max_bytes=1024 * 1024)
+
+def test_same_name_in_different_dirs_do_not_collide(tmp_path, manager):
+    paths = []
+    for d in ("a", "b"):
+        os.makedirs(tmp_path / d)
+        path = str(tmp_path / d / "data.csv")
+        csv.write_csv(pa.table({"x": [len(d)]}), path)
+        paths.append(path)
+    key_a = manager.make_key(paths[0], "CSVParser", 1)
+    key_b = manager.make_key(paths[1], "CSVParser", 1)
+    assert key_a != key_b
+    assert manager.make_key(paths[0], "CSVParser", 2) != key_a
+    assert manager.make_key(paths[0], "CSVParser", 1, {"block_size": 1}) != key_a
+
+def test_modified_source_invalidates(tmp_path, manager):
+    path = str(tmp_path / "data.csv")
+    csv.write_csv(pa.table({"x": [1]}), path)
+    old_cache = manager.write(path, "csv", "CSVParser", 1, write_table(pa.table({"x": [1]})))
+    assert manager.lookup(path, "csv", "CSVParser", 1) == old_cache
+    csv.write_csv(pa.table({"x": [1, 2]}), path)
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 10**9))
+    assert manager.lookup(path, "csv", "CSVParser", 1) is None
+    manager.write(path, "csv", "CSVParser", 1, write_table(pa.table({"x": [1, 2]})))
+    assert not os.path.exists(old_cache)
+    assert len(os.listdir(manager.cache_dir("csv"))) == 1
+
+def test_failed_write_leaves_no_file(tmp_path, manager):
+    path = str(tmp_path / "data.csv")
+    csv.write_csv(pa.table({"x": [1]}), path)
+
+    def broken(tmp):
+        with open(tmp, "wb") as f:
+            f.write(b"partial")
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        manager.write(path, "csv", "CSVParser", 1, broken)
+    assert os.listdir(manager.cache_dir("csv")) == []
+    assert manager.lookup(path, "csv", "CSVParser", 1) is None
+
+def test_lru_eviction(tmp_path):
+    manager = ArrowCacheManager(root=str(tmp_path / "cache"), max_bytes=0)
+    table = pa.table({"x": list(range(1000))})
+    paths = []
+    for i in range(3):
+        path = str(tmp_path / f"{i}.csv")
+        csv.write_csv(table, path)
+        paths.append(path)
+        manager.write(path, "csv", "CSVParser", 1, write_table(table))
+    # 预算为 0 时只保留最新写入的一份
+    assert manager.lookup(paths[2], "csv", "CSVParser", 1) is not None
+    assert manager.lookup(paths[0], "csv", "CSVParser", 1) is None
+    assert manager.lookup(paths[1], "csv", "CSVParser", 1) is None
+
+def test_csv_reopen_uses_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_manager, "DEFAULT_CACHE_ROOT", str(tmp_path / "cache"))
+    monkeypatch.setattr(cache_manager, "_cache_manager", None)
+    path = str(tmp_path / "data.csv")
+    csv.write_csv(pa.table({"x": [1, 2, 3]}), path)
+    parser = CSVParser()
+    assert parser.lookup_arrow_cache(path) is None
+    first = parser.parse(path)
+    cache_path = parser.lookup_arrow_cache(path)
+    mtime = os.stat(cache_path).st_mtime_ns
+    second = parser.parse(path)
+    assert first.equals(second)
+    assert os.stat(cache_path).st_mtime_ns == mtime
+
+def test_lookup_hit_does_not_rewrite_index(tmp_path, manager, monkeypatch):
+    path = str(tmp_path / "data.csv")
+    csv.write_csv(pa.table({"x": [1]}), path)
+    manager.write(path, "csv", "CSVParser", 1, write_table(pa.table({"x": [1]})))
+    mtime = os.stat(manager.index_path).st_mtime_ns
+    for _ in range(5):
+        assert manager.lookup(path, "csv", "CSVParser", 1) is not None
+    assert os.stat(manager.index_path).st_mtime_ns == mtime
+    # 超过间隔后合并写回访问时间
+    monkeypatch.setattr(cache_manager, "ACCESS_FLUSH_INTERVAL", 0)
+    before = ArrowCacheManager(root=manager.root)._load_index()
+    manager.lookup(path, "csv", "CSVParser", 1)
+    after = ArrowCacheManager(root=manager.root)._load_index()
+    key = manager.make_key(path, "CSVParser", 1)
+    assert after[key]["last_access"] > before[key]["last_access"]
+
+def test_managers_do_not_overwrite_each_other(tmp_path):
+    # 两个 manager 模拟两个进程，各自持有旧的内存索引
+    root = str(tmp_path / "cache")
+    first, second = ArrowCacheManager(root=root), ArrowCacheManager(root=root)
+    paths = []
+    for i, manager in enumerate((first, second, first, second)):
+        path = str(tmp_path / f"{i}.csv")
+        csv.write_csv(pa.table({"x": [i]}), path)
+        manager.write(path, "csv", "CSVParser", 1, write_table(pa.table({"x": [i]})))
+        paths.append(path)
+    index = ArrowCacheManager(root=root)._load_index()
+    assert {entry["source"] for entry in index.values()} == {os.path.abspath(p) for p in paths}
@@ -0,0 +1,86 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+import netCDF4
+import numpy as np
+import pyarrow.csv as csv
+import pytest
+from parser import abstract_parser, cache_manager, csv_parser
+from parser.csv_parser import CSVParser, count_csv_rows
+from parser.nc_parser import NCParser, get_auto_chunk_size, plan_windows
+
+CSV_TEXT = 'id,note\r\n1,"two\nlines"\r\n\r\n2,"say ""hi""\r\nthere"\n\n3,plain\n4,last'
+
+@pytest.fixture(autouse=True)
+def isolated_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_manager, "DEFAULT_CACHE_ROOT", str(tmp_path / "cache"))
+    monkeypatch.setattr(cache_manager, "_cache_manager", None)
+    monkeypatch.setattr(abstract_parser, "_COUNT_MEMO", abstract_parser.OrderedDict())
+
+@pytest.fixture
+def csv_file(tmp_path):
+    path = tmp_path / "quoted.csv"
+    path.write_bytes(CSV_TEXT.encode())
+    return str(path)
+
+@pytest.mark.parametrize("chunk_bytes", [1, 2, 5, 1024])
+def test_csv_count_matches_read_csv(csv_file, chunk_bytes):
+    # 引号内换行、"" 转义、空行、\r\n 和末行无换行符
+    assert count_csv_rows(csv_file, chunk_bytes) == csv.read_csv(csv_file).num_rows == 4
+
+@pytest.mark.parametrize("text", [
+    'a,b\r1,2\r3,4\r',
+    'a,b\r1,2\r\r3,4',
+    'a\r\n1\r\r2\n\n3\r',
+    'a\n"x\ry"\r\n2\r',
+    'a\r\r\n1\r\n\r',
+])
+@pytest.mark.parametrize("chunk_bytes", [1, 2, 3, 1024])
+def test_csv_count_bare_cr(tmp_path, text, chunk_bytes):
+    # 单独的 \r 也是行尾，块边界落在 \r 与 \n 之间时不能把 \r\n 当作两个行尾
+    path = tmp_path / "cr.csv"
+    path.write_bytes(text.encode())
+    assert count_csv_rows(str(path), chunk_bytes) == csv.read_csv(str(path)).num_rows
+
+def test_count_reads_arrow_footer_and_memoizes(csv_file, monkeypatch):
+    parser = CSVParser()
+    parser.parse(csv_file)
+
+    def fail(_):
+        raise AssertionError("已有缓存时不应扫描源文件")
+    monkeypatch.setattr(csv_parser, "count_csv_rows", fail)
+    assert parser.count(csv_file) == 4
+
+    os.remove(parser.lookup_arrow_cache(csv_file))
+    assert parser.count(csv_file) == 4
+
+def test_plan_windows_shares_window_for_same_shape():
+    shapes = [(120, 4), (120, 4), (120,)]
+    max_chunks, other_dims, _ = plan_windows(shapes, ["time", "time", "time"], [6, 8, None])
+    assert max_chunks[0] == max_chunks[1]
+    assert max_chunks[0] % 24 == 0
+    assert other_dims == [4, 4, 1]
+
+def test_plan_windows_caps_lcm_at_target():
+    # 97、89、83 的最小公倍数远大于按内存估算的切片长度，改为对齐到最大的原生分块
+    shapes = [(100000, 1000)] * 3
+    max_chunks, _, total_chunks = plan_windows(shapes, ["time"] * 3, [89, 97, 83])
+    target = get_auto_chunk_size(shapes[0], dtype=np.float64, target_mem_mb=10)
+    assert max_chunks == [max_chunks[0]] * 3
+    assert max_chunks[0] % 97 == 0 and max_chunks[0] <= target
+    assert total_chunks == -(-100000 // max_chunks[0])
+
+def test_nc_count_matches_parse(tmp_path):
+    path = str(tmp_path / "mixed.nc")
+    with netCDF4.Dataset(path, "w") as ds:
+        ds.createDimension("time", 100)
+        ds.createDimension("lat", 3)
+        ds.createVariable("time", "f8", ("time",))[:] = np.arange(100)
+        ds.createVariable("lat", "f4", ("lat",))[:] = np.arange(3)
+        for name, chunk in (("tas", 6), ("pr", 8)):
+            var = ds.createVariable(name, "f4", ("time", "lat"), zlib=True, chunksizes=(chunk, 3))
+            var[:] = np.arange(300, dtype="f4").reshape(100, 3)
+    parser = NCParser()
+    count = parser.count(path)
+    assert count == 300
+    assert parser.parse(path).num_rows == count
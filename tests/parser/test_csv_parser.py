@@ -0,0 +1,111 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+import numpy as np
+import pyarrow as pa
+import pyarrow.csv as csv
+import pyarrow.ipc as ipc
+import pytest
+from parser import cache_manager
+from parser import csv_parser
+from parser.csv_parser import CSVParser, convert_csv_to_cache
+
+@pytest.fixture
+def csv_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_manager, "DEFAULT_CACHE_ROOT", str(tmp_path / "cache"))
+    monkeypatch.setattr(cache_manager, "_cache_manager", None)
+    n = 200000
+    table = pa.table({"id": np.arange(n), "value": np.random.default_rng(0).random(n)})
+    path = str(tmp_path / "sample.csv")
+    csv.write_csv(table, path)
+    return path, table
+
+def test_head_sample_matches_read_csv(csv_file):
+    path, _ = csv_file
+    sample = CSVParser().sample(path)
+    assert sample.equals(csv.read_csv(path).slice(0, 10))
+
+def test_reservoir_sample(csv_file):
+    path, table = csv_file
+    parser = CSVParser()
+    sample = parser.sample(path, rows=50, reservoir=True, seed=7)
+    ids = sample["id"].to_pylist()
+    assert sample.num_rows == 50
+    assert ids == sorted(set(ids))
+    # 抽样覆盖整个文件而不是只来自开头
+    assert ids[-1] > table.num_rows // 2
+    assert sample.equals(table.take(pa.array(ids)))
+    assert parser.sample(path, rows=50, reservoir=True, seed=7).equals(sample)
+
+    # 有 .arrow 缓存时从缓存抽样，结果相同
+    parser.parse(path)
+    assert parser.sample(path, rows=50, reservoir=True, seed=7).equals(sample)
+
+def test_reservoir_sample_small_file(tmp_path):
+    path = str(tmp_path / "small.csv")
+    csv.write_csv(pa.table({"id": [1, 2, 3]}), path)
+    assert CSVParser().sample(path, reservoir=True)["id"].to_pylist() == [1, 2, 3]
+
+def test_reservoir_sample_widens_types(tmp_path, monkeypatch):
+    path = str(tmp_path / "widen_sample.csv")
+    with open(path, "w") as f:
+        f.write("a,b\n" + "".join(f"{i},1\n" for i in range(20000)) + "2.5,x\n")
+    read_csv = csv.read_csv
+    # 类型不一致时仍然流式抽样，不完整读取文件
+    monkeypatch.setattr(csv_parser.csv, "read_csv", lambda source, *args, **kwargs:
+                        pytest.fail("完整读取了 CSV 文件") if source == path else read_csv(source, *args, **kwargs))
+    sample = CSVParser().sample(path, rows=20001, reservoir=True, seed=1)
+    assert sample.schema == pa.schema([("a", pa.float64()), ("b", pa.string())])
+    assert sample["a"].to_pylist() == [float(i) for i in range(20000)] + [2.5]
+
+@pytest.mark.parametrize("tail, expected_type", [
+    ("2.5", pa.float64()),
+    ('"x, ""quoted"""', pa.string()),
+])
+def test_streaming_conversion_widens_types(tmp_path, tail, expected_type):
+    path = str(tmp_path / "widen.csv")
+    with open(path, "w") as f:
+        f.write("a,b\n" + "1,\n" * 20000 + f"{tail},true\n")
+    ipc_path = str(tmp_path / "widen.arrow")
+    schema = convert_csv_to_cache(path, ipc_path, csv.ReadOptions(block_size=4096))
+    expected = csv.read_csv(path)
+    assert schema.field("a").type == expected_type
+    assert schema.field("b").type == pa.bool_()
+    assert ipc.open_file(ipc_path).read_all().equals(expected)
+
+def test_widening_many_columns_reconverts_once(tmp_path, monkeypatch):
+    path = str(tmp_path / "widen_many.csv")
+    with open(path, "w") as f:
+        f.write("a,b,c\n" + "1,,1\n" * 10000 + "2.5,,1\n" + "1,,1\n" * 10000 + "1,7,1\n" + "1,,x\n")
+    passes = []
+    open_csv = csv.open_csv
+    monkeypatch.setattr(csv_parser.csv, "open_csv", lambda *args, **kwargs: passes.append(args) or open_csv(*args, **kwargs))
+    ipc_path = str(tmp_path / "widen_many.arrow")
+    schema = convert_csv_to_cache(path, ipc_path, csv.ReadOptions(block_size=4096))
+    expected = csv.read_csv(path)
+    assert schema == expected.schema
+    assert ipc.open_file(ipc_path).read_all().equals(expected)
+    # 首次转换 + 扫描类型 + 重新转换一次，与需要放宽的列数无关
+    assert len(passes) == 3
+
+def test_parse_streams_into_cache(csv_file):
+    path, _ = csv_file
+    result = CSVParser().parse(path)
+    assert result.equals(csv.read_csv(path))
+
+def test_scan_without_window_writes_cache(csv_file):
+    path, table = csv_file
+    parser = CSVParser()
+    assert parser.scan(path, columns=["id"], offset=5).read_all().equals(table.select(["id"]).slice(5))
+    assert parser.lookup_arrow_cache(path) is not None
+
+def test_windowed_scan_widens_types(tmp_path, monkeypatch):
+    path = str(tmp_path / "widen_scan.csv")
+    with open(path, "w") as f:
+        f.write("a,b\n" + "1,1\n" * 400000 + "2.5,1\n")  # 超过一个 1MB 的块
+    read_csv = csv.read_csv
+    monkeypatch.setattr(csv_parser.csv, "read_csv", lambda source, *args, **kwargs:
+                        pytest.fail("完整读取了 CSV 文件") if source == path else read_csv(source, *args, **kwargs))
+    result = CSVParser().scan(path, columns=["a"], offset=399990, length=20).read_all()
+    assert result.schema == pa.schema([("a", pa.float64())])
+    assert result["a"].to_pylist() == [1.0] * 10 + [2.5]
@@ -0,0 +1,69 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+import netCDF4
+import numpy as np
+import pytest
+from parser import cache_manager
+from parser.nc_parser import NCParser, align_to_native_chunk, plan_chunk_decodes
+
+@pytest.fixture
+def chunked_nc(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_manager, "DEFAULT_CACHE_ROOT", str(tmp_path / "cache"))
+    monkeypatch.setattr(cache_manager, "_cache_manager", None)
+    path = str(tmp_path / "chunked.nc")
+    with netCDF4.Dataset(path, "w") as ds:
+        ds.createDimension("time", 40)
+        ds.createDimension("lat", 8)
+        ds.createVariable("time", "f8", ("time",))[:] = np.arange(40)
+        tas = ds.createVariable("tas", "f4", ("time", "lat"), zlib=True, chunksizes=(6, 8))
+        tas[:] = np.arange(320, dtype="f4").reshape(40, 8)
+    return path
+
+def test_align_to_native_chunk():
+    assert align_to_native_chunk(160, None) == 160
+    assert align_to_native_chunk(160, 7) == 154
+    assert align_to_native_chunk(160, 500) == 500
+
+def test_plan_chunk_decodes():
+    # 切片与分块对齐时每个分块只解压一次
+    assert plan_chunk_decodes(1000, 100, 50) == (20, 20)
+    # 切片小于分块时同一分块被多次解压
+    assert plan_chunk_decodes(1000, 30, 100) == (10, 40)
+
+def test_layout_uses_native_chunking(chunked_nc):
+    import xarray as xr
+    with xr.open_dataset(chunked_nc, decode_cf=False) as ds:
+        layout = NCParser()._read_layout(ds, chunked_nc)
+    i = layout["var_names"].index("tas")
+    assert layout["native_chunks"][i] == 6
+    assert layout["max_chunks"][i] % 6 == 0
+    assert layout["var_compress"]["tas"]["chunksizes"] == [6, 8]
+    assert layout["var_compress"]["tas"]["zlib"] is True
+
+def test_scan_decodes_each_chunk_once(chunked_nc):
+    parser = NCParser()
+    table = parser.scan(chunked_nc, columns=["tas"], offset=5 * 8, length=20 * 8).read_all()
+    assert table["tas"].to_pylist() == list(range(40, 200))
+    tas_counts = {k: n for k, n in parser.last_decode_counts.items() if k[0] == "tas"}
+    assert set(n for n in tas_counts.values()) == {1}
+    assert sorted(k[1] for k in tas_counts) == [0, 1, 2, 3, 4]
+
+def test_parse_decodes_each_chunk_once(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_manager, "DEFAULT_CACHE_ROOT", str(tmp_path / "cache"))
+    monkeypatch.setattr(cache_manager, "_cache_manager", None)
+    path = str(tmp_path / "mixed.nc")
+    with netCDF4.Dataset(path, "w") as ds:
+        ds.createDimension("time", 40)
+        ds.createDimension("lat", 8)
+        # 主轴和 shape 相同的变量共用切片长度，分块不同的变量切片会跨越其分块边界
+        ds.createVariable("tas", "f4", ("time", "lat"), zlib=True, chunksizes=(6, 8))[:] = \
+            np.arange(320, dtype="f4").reshape(40, 8)
+        ds.createVariable("pr", "f4", ("time", "lat"), zlib=True, chunksizes=(4, 8))[:] = \
+            -np.arange(320, dtype="f4").reshape(40, 8)
+    parser = NCParser(workers=1)
+    table = parser.parse(path)
+    assert table["tas"].to_pylist() == list(range(320))
+    assert table["pr"].to_pylist() == [-float(i) for i in range(320)]
+    assert set(parser.last_decode_counts.values()) == {1}
+    assert len([k for k in parser.last_decode_counts if k[0] == "pr"]) == 10
@@ -0,0 +1,50 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+import netCDF4
+import numpy as np
+import pyarrow as pa
+import pytest
+from parser import nc_parser, cache_manager
+from parser.nc_parser import NCParser
+
+@pytest.fixture
+def nc_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_manager, "DEFAULT_CACHE_ROOT", str(tmp_path / "cache"))
+    monkeypatch.setattr(cache_manager, "_cache_manager", None)
+    # 每块 3 行，小文件也能切出多个分块
+    monkeypatch.setattr(nc_parser, "get_auto_chunk_size", lambda shape, dtype=None, target_mem_mb=None: 3)
+    path = str(tmp_path / "parallel.nc")
+    with netCDF4.Dataset(path, "w") as ds:
+        ds.createDimension("time", 10)
+        ds.createDimension("lat", 4)
+        ds.createDimension("lon", 5)
+        ds.createVariable("time", "f8", ("time",))[:] = np.arange(10)
+        ds.createVariable("lat", "f4", ("lat",))[:] = np.linspace(-30, 30, 4)
+        tas = ds.createVariable("tas", "f4", ("time", "lat", "lon"), fill_value=-999.0)
+        data = np.random.default_rng(0).random((10, 4, 5)).astype("f4")
+        data[0, 0, 0] = -999.0
+        tas[:] = data
+        ds.createVariable("count", "i4", ("time", "lat"))[:] = np.arange(40).reshape(10, 4)
+    return path
+
+def arrays(table):
+    return {c: table[c].to_numpy() for c in table.column_names}
+
+def test_parallel_parse_matches_serial(nc_file):
+    serial = NCParser(workers=1).parse(nc_file)
+    cache_manager.get_cache_manager().clear()
+    parallel = NCParser(workers=2).parse(nc_file)
+    assert parallel.schema.equals(serial.schema, check_metadata=True)
+    assert [b.num_rows for b in parallel.to_batches()] == [b.num_rows for b in serial.to_batches()]
+    expected = arrays(serial)
+    for name, values in arrays(parallel).items():
+        assert np.array_equal(values, expected[name], equal_nan=True)
+    # 并行解析汇总各 worker 的解压次数，而不是保留上一次解析的统计
+    parser = NCParser(workers=2)
+    parser.last_decode_counts = {("stale", 0): 99}
+    cache_manager.get_cache_manager().clear()
+    parser.parse(nc_file)
+    assert ("stale", 0) not in parser.last_decode_counts
+    assert {k[0] for k in parser.last_decode_counts} == {"time", "lat", "tas", "count"}
+    assert not any(name.endswith(".segments") for name in os.listdir(cache_manager.get_cache_manager().cache_dir("nc")))
@@ -3,6 +3,7 @@ import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
 import numpy as np
 import pyarrow as pa
+import pytest
 import tifffile
 from parser.tif_parser import TIFParser
 from utils.logger_utils import get_logger
@@ -115,6 +116,30 @@ def test_invalid_shape(tmp_path):
     logger.info("------------------------")
     print(table)
 
+def test_windowed_parse_tiled_and_striped(tmp_path, monkeypatch):
+    from parser import tif_parser
+    # 每批只有少量像素，强制跨多个 tile / strip 窗口读取
+    monkeypatch.setattr(tif_parser, "BATCH_BYTES", 1000)
+    data = np.random.randint(0, 60000, size=(2, 37, 45, 3), dtype=np.uint16)
+    for name, options in [("tiled", {"tile": (16, 16), "compression": "zlib"}),
+                          ("striped", {"rowsperstrip": 5, "compression": "zlib", "predictor": True})]:
+        tif_path = str(tmp_path / f"{name}.tif")
+        tifffile.imwrite(tif_path, data, **options)
+        table = TIFParser().parse(tif_path)
+        assert table.to_batches()[0].num_rows < table.num_rows
+        assert table.column_names == [f"page{p}_band{b}" for p in (1, 2) for b in (1, 2, 3)]
+        for p in range(2):
+            for b in range(3):
+                np.testing.assert_array_equal(table[f"page{p+1}_band{b+1}"].to_numpy(), data[p, :, :, b].ravel())
+        window = TIFParser().scan(tif_path, columns=["page2_band3"], offset=100, length=200).read_all()
+        np.testing.assert_array_equal(window["page2_band3"].to_numpy(), data[1, :, :, 2].ravel()[100:300])
+
+def test_count_reads_tags_only(tmp_path, monkeypatch):
+    tif_path = tmp_path / "count.tif"
+    create_test_tiff(str(tif_path), shape=(4, 12, 10))
+    monkeypatch.setattr(tifffile, "imread", lambda *args, **kwargs: pytest.fail("count 不应解码像素"))
+    assert TIFParser().count(str(tif_path)) == 12 * 10
+
 def test_real_tif(tif_path, tem_path, out_tif_path):
     """测试实际的TIFF文件解析和写入"""
     # 这里可以放一个实际的TIFF文件路径进行测试
@@ -0,0 +1,232 @@
+import sys
+import os
+import math
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as csv
+import pyarrow.ipc as ipc
+import pytest
+from compute.interactive.interactive import aggregate_from_stats, approximate_aggregate, execute_plan, handle_prev_actions
+from compute.interactive.plan import TableSource
+from parser import cache_manager, csv_parser
+from parser.csv_parser import CSVParser
+from parser.zone_map import ZoneMapWriter, load_zone_map, zone_map_path
+from utils.expression_utils import compile_filter_expression
+
+FILTERS = [
+    "id >= 45000",
+    "(id >= 12000) & (id < 12500)",
+    "value > 0.99",
+    "~(value < 0.5)",
+    "value != value",
+    "tag == 'k3'",
+    "tag.isnull()",
+    "id in [5, 49999]",
+]
+
+@pytest.fixture
+def cached_csv(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_manager, "DEFAULT_CACHE_ROOT", str(tmp_path / "cache"))
+    monkeypatch.setattr(cache_manager, "_cache_manager", None)
+    monkeypatch.setattr(csv_parser, "DEFAULT_BLOCK_SIZE", 64 * 1024)
+    n = 50000
+    ids = np.arange(n)
+    value = np.random.default_rng(0).random(n)
+    value[ids % 97 == 0] = np.nan
+    tag = pa.array([None if i % 1000 == 0 else f"k{i // 5000}" for i in ids])
+    path = str(tmp_path / "zone.csv")
+    csv.write_csv(pa.table({"id": ids, "value": value, "tag": tag}), path)
+    parser = CSVParser()
+    table = parser.parse(path)
+    return path, parser, table
+
+def test_zone_map_written_with_cache(cached_csv):
+    path, parser, table = cached_csv
+    cache_path = parser.lookup_arrow_cache(path)
+    zone_map = load_zone_map(cache_path)
+    assert zone_map is not None
+    assert zone_map.num_batches == len(table["id"].chunks) > 2
+    assert int(zone_map.num_rows.sum()) == table.num_rows
+
+    first = table["id"].chunks[1]
+    assert zone_map.batches_in_range(first[0].as_py(), 1) == [1]
+    assert zone_map.candidate_batches(pc.field("id") < 0) == []
+
+def test_slice_reads_only_overlapping_batches(cached_csv):
+    path, parser, table = cached_csv
+    cache_path = parser.lookup_arrow_cache(path)
+    batches = list(parser.scan_arrow_file(cache_path, ["id"], 30000, 10))
+    assert len(batches) == 1
+    assert pa.Table.from_batches(batches).equals(table.select(["id"]).slice(30000, 10))
+
+@pytest.mark.parametrize("expression", FILTERS)
+def test_filter_skips_batches_without_changing_result(cached_csv, expression):
+    path, parser, table = cached_csv
+    actions = [["filter", {"expression": expression}]]
+    expected = handle_prev_actions(table, actions)
+    lazy = TableSource(id=path, file_path=path, parser=parser)
+    assert execute_plan(lazy, actions).equals(expected)
+    # 已物化的 TableSource 同样通过缓存按批次读取
+    materialized = TableSource(id=path, file_path=path, parser=parser)
+    assert materialized.data.num_rows == table.num_rows
+    assert execute_plan(materialized, actions).equals(expected)
+
+def test_selective_filter_prunes(cached_csv):
+    path, parser, _ = cached_csv
+    zone_map = load_zone_map(parser.lookup_arrow_cache(path))
+    predicate, _ = compile_filter_expression("(id >= 12000) & (id < 12500)")
+    assert len(zone_map.candidate_batches(predicate)) < zone_map.num_batches // 2
+
+def test_zone_map_removed_with_cache(cached_csv):
+    path, parser, _ = cached_csv
+    cache_path = parser.lookup_arrow_cache(path)
+    cache_manager.get_cache_manager().clear()
+    assert not os.path.exists(cache_path)
+    assert not os.path.exists(zone_map_path(cache_path))
+
+@pytest.mark.parametrize("actions", [
+    [],
+    [["slice", {"offset": 12345, "length": 20000}]],
+    [["select", {"columns": ["id", "value"]}], ["limit", {"rowNum": 777}]],
+    [["slice", {"offset": 49990}]],
+])
+def test_aggregates_from_stats_match_scan(cached_csv, actions, monkeypatch):
+    path, parser, table = cached_csv
+    expected_table = handle_prev_actions(table, actions)
+    source = TableSource(id=path, file_path=path, parser=parser)
+    scanned = []
+    original_scan = CSVParser.scan_arrow_file
+    monkeypatch.setattr(CSVParser, "scan_arrow_file", staticmethod(lambda *args: scanned.append(args) or original_scan(*args)))
+    for column in ("id", "value"):
+        for function in ("sum", "mean", "min", "max"):
+            found, result = aggregate_from_stats(source, actions, column, function)
+            expected = getattr(pc, function)(expected_table[column]).as_py()
+            assert found
+            if isinstance(expected, float) and math.isnan(expected):
+                assert math.isnan(result)
+            else:
+                assert result == pytest.approx(expected, rel=1e-12)
+    # 只读取行窗口边界上的批次：每次聚合最多两个
+    if not actions:
+        assert scanned == []
+    assert len(scanned) <= 2 * 8
+
+def test_aggregates_from_stats_fall_back(cached_csv):
+    path, parser, _ = cached_csv
+    source = TableSource(id=path, file_path=path, parser=parser)
+    assert aggregate_from_stats(source, [["filter", {"expression": "id > 5"}]], "id", "sum") == (False, None)
+    assert aggregate_from_stats(source, [["select", {"columns": ["value"]}]], "id", "sum") == (False, None)
+    assert aggregate_from_stats(source, [], "tag", "sum") == (False, None)
+
+def test_sketches_off_by_default(cached_csv):
+    path, parser, _ = cached_csv
+    source = TableSource(id=path, file_path=path, parser=parser)
+    assert load_zone_map(parser.lookup_arrow_cache(path)).sketches == {}
+    assert approximate_aggregate(source, [], "tag", "count_distinct") is None
+
+def test_sketch_selected_columns(tmp_path):
+    schema = pa.schema([pa.field("a", pa.int64()), pa.field("b", pa.string())])
+    cache_path = str(tmp_path / "s.arrow")
+    with ZoneMapWriter(ipc.new_file(cache_path, schema), cache_path, schema, sketches=["b"]) as writer:
+        writer.write_batch(pa.record_batch([pa.array([1, 2]), pa.array(["x", "y"])], schema=schema))
+    assert set(load_zone_map(cache_path).sketches) == {"b"}
+
+def test_approximate_aggregates_on_cache(cached_csv, monkeypatch):
+    path, parser, table = cached_csv
+    monkeypatch.setattr(cache_manager, "ZoneMapWriter",
+                        lambda writer, path, schema, sketches: ZoneMapWriter(writer, path, schema, True))
+    cache_manager.get_cache_manager().clear()
+    parser.parse(path)
+    source = TableSource(id=path, file_path=path, parser=parser)
+    assert set(load_zone_map(parser.lookup_arrow_cache(path)).sketches) == {"id", "value", "tag"}
+    distinct = approximate_aggregate(source, [], "tag", "count_distinct")
+    assert distinct.lower <= pc.count_distinct(table["tag"]).as_py() <= distinct.upper and distinct.sampled_rows == 0
+    # 带 filter 时不能由 sketch 估计
+    assert approximate_aggregate(source, [["filter", {"expression": "id > 5"}]], "tag", "count_distinct") is None
+    # 无 filter 的 sum / mean 由统计信息精确得到
+    assert approximate_aggregate(source, [], "id", "sum").exact
+
+    actions = [["filter", {"expression": "tag != 'k3'"}]]
+    expected = pc.sum(handle_prev_actions(table, actions)["id"]).as_py()
+    result = approximate_aggregate(source, actions, "id", "sum", sample_fraction=0.5, seed=1)
+    assert not result.exact and 0 < result.sampled_rows < table.num_rows
+    assert result.lower <= expected <= result.upper
+
+@pytest.fixture
+def null_csv(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_manager, "DEFAULT_CACHE_ROOT", str(tmp_path / "cache"))
+    monkeypatch.setattr(cache_manager, "_cache_manager", None)
+    monkeypatch.setattr(csv_parser, "DEFAULT_BLOCK_SIZE", 16 * 1024)
+    n = 8000
+    ids = np.arange(n)
+    x = pa.array([None if i % 2 else (1.5 if i % 4 == 0 else 5.5) for i in ids], pa.float64())
+    # id 在 [4000, 5000) 的行全部为 null（CSV 读取时 nan 也解析为 null，NaN 见 test_zone_map_writer_nulls_and_nans）
+    y = pa.array([None if i % 3 == 0 or 4000 <= i < 5000 else i + 0.5 for i in ids], pa.float64())
+    path = str(tmp_path / "nulls.csv")
+    csv.write_csv(pa.table({"id": ids, "x": x, "y": y}), path)
+    parser = CSVParser()
+    table = parser.parse(path)
+    return path, parser, table
+
+def test_zone_map_separates_nulls_from_nans(null_csv):
+    path, parser, table = null_csv
+    zone_map = load_zone_map(parser.lookup_arrow_cache(path))
+    mins, maxs, nulls, nans = zone_map._stats["x"]
+    assert sum(nans) == 0 and sum(nulls) == table["x"].null_count
+    assert all(low is not None for low, rows in zip(mins, zone_map.num_rows) if rows > 1)
+    _, _, nulls, nans = zone_map._stats["y"]
+    assert sum(nulls) == table["y"].null_count and sum(nans) == 0
+
+def test_zone_map_writer_nulls_and_nans(tmp_path):
+    nan = float("nan")
+    batches = [[1.5, None, nan, 5.5], [None, None], [nan, None], [nan, nan], [2.5, None]]
+    schema = pa.schema([pa.field("x", pa.float64())])
+    cache_path = str(tmp_path / "x.arrow")
+    with ZoneMapWriter(ipc.new_file(cache_path, schema), cache_path, schema) as writer:
+        for values in batches:
+            writer.write_batch(pa.record_batch([pa.array(values, pa.float64())], schema=schema))
+    zone_map = load_zone_map(cache_path)
+    mins, maxs, nulls, nans = zone_map._stats["x"]
+    assert nulls == [1, 2, 1, 0, 1] and nans == [1, 0, 1, 2, 0]
+    assert mins == [1.5, None, None, None, 2.5] and maxs == [5.5, None, None, None, 2.5]
+    assert zone_map.candidate_batches(pc.field("x") > 0) == [0, 4]
+    assert zone_map.candidate_batches(pc.field("x").is_null()) == [0, 1, 2, 4]
+    everything = list(range(len(batches)))
+    assert zone_map.aggregate("x", "min", everything) == (True, 1.5)
+    assert zone_map.aggregate("x", "max", everything) == (True, 5.5)
+    # 没有有效值的批次不参与 min / max
+    assert zone_map.aggregate("x", "min", [1, 2, 3]) == (True, None)
+    assert zone_map.aggregate("x", "nan_count", [1, 2, 3]) == (True, 3)
+
+@pytest.mark.parametrize("expression", ["x > 0", "x < 2", "y > 100", "y.notnull()", "y.isnull()", "(x > 2) | (y < 50)"])
+def test_filter_with_nulls_and_nans(null_csv, expression):
+    path, parser, table = null_csv
+    actions = [["filter", {"expression": expression}]]
+    expected = handle_prev_actions(table, actions)
+    assert expected.num_rows > 0
+    assert execute_plan(TableSource(id=path, file_path=path, parser=parser), actions).equals(expected)
+
+@pytest.mark.parametrize("actions", [
+    [],
+    [["slice", {"offset": 4100, "length": 800}]],
+    [["slice", {"offset": 3990, "length": 2000}]],
+])
+def test_aggregates_from_stats_with_nulls(null_csv, actions):
+    path, parser, table = null_csv
+    expected_table = handle_prev_actions(table, actions)
+    source = TableSource(id=path, file_path=path, parser=parser)
+    for column in ("x", "y"):
+        min_max = pc.min_max(expected_table[column])
+        for function in ("min", "max"):
+            found, result = aggregate_from_stats(source, actions, column, function)
+            assert found and result == min_max[function].as_py()
+    assert aggregate_from_stats(source, [], "x", "min") == (True, 1.5)
+    assert aggregate_from_stats(source, [], "x", "max") == (True, 5.5)
+
+def test_stale_zone_map_ignored(null_csv, monkeypatch):
+    path, parser, _ = null_csv
+    from parser import zone_map
+    monkeypatch.setattr(zone_map, "_FORMAT_VERSION", b"1")
+    assert load_zone_map(parser.lookup_arrow_cache(path)) is None
@@ -0,0 +1,58 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+import asyncio
+import threading
+import time
+import pyarrow as pa
+from sdk.async_client import AsyncDacpClient, AsyncDataFrame
+from sdk.dataframe import DataFrame
+
+class SlowClient:
+    """同步客户端替身：记录同时进行的调用数。"""
+    def __init__(self):
+        self.active = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def count(self, dataframe_name):
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(0.02)
+        with self.lock:
+            self.active -= 1
+        return len(dataframe_name)
+
+    def get_dataframe_stream(self, dataframe_name, max_chunksize, offset):
+        for i in range(offset, 5):
+            yield bytes([i])
+
+def test_gather_is_bounded():
+    async def main():
+        client = AsyncDacpClient(SlowClient(), max_concurrency=3)
+        names = [f"df-{i}" * (i + 1) for i in range(20)]
+        counts = await asyncio.gather(*(client.count(name) for name in names))
+        assert counts == [len(name) for name in names]
+        return client.client.peak
+    assert asyncio.run(main()) == 3
+
+def test_async_iteration_and_early_exit():
+    async def main():
+        client = AsyncDacpClient(SlowClient())
+        chunks = [chunk async for chunk in client.get_dataframe_stream("df", offset=2)]
+        assert chunks == [b"\x02", b"\x03", b"\x04"]
+        async for chunk in client.get_dataframe_stream("df"):
+            break
+    asyncio.run(main())
+
+def test_dataframe_operations():
+    table = pa.table({"id": list(range(10)), "x": [float(i) for i in range(10)]})
+    async def main():
+        df = AsyncDataFrame(DataFrame("df", table, []), AsyncDacpClient(SlowClient()))
+        filtered = df.filter("id >= 5")
+        assert await filtered.sum("x") == 35.0
+        assert await df.num_rows() == 10
+        batches = [batch async for batch in df]
+        assert pa.Table.from_batches(batches).equals(table)
+    asyncio.run(main())
@@ -0,0 +1,43 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../')))
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from services.server.faird_service_producer import FairdServiceProducer
+
+def run_many(names, func, workers=4):
+    producer = SimpleNamespace(batch_executor=ThreadPoolExecutor(max_workers=workers))
+    return FairdServiceProducer.run_many(producer, names, func)
+
+def test_results_stream_in_completion_order():
+    delays = {"slow": 0.2, "fast": 0.0, "broken": 0.05}
+
+    def func(name):
+        time.sleep(delays[name])
+        if name == "broken":
+            raise ValueError("Unsupported file extension")
+        return {"total_count": len(name)}
+
+    items = [json.loads(result.body.to_pybytes()) for result in run_many(["slow", "fast", "broken", "fast"], func)]
+    assert [item["dataframe_name"] for item in items] == ["fast", "broken", "slow"]
+    assert items[0]["result"] == {"total_count": 4}
+    assert "Unsupported" in items[1]["error"]
+
+def test_closing_stream_cancels_pending():
+    started = []
+    lock = threading.Lock()
+
+    def func(name):
+        with lock:
+            started.append(name)
+        time.sleep(0.05)
+        return name
+
+    stream = run_many([f"df-{i}" for i in range(20)], func, workers=2)
+    next(stream)
+    stream.close()
+    time.sleep(0.2)
+    assert len(started) < 20
@@ -0,0 +1,54 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../')))
+from types import MethodType, SimpleNamespace
+import pyarrow as pa
+import pyarrow.csv as csv
+import pytest
+from parser.csv_parser import CSVParser
+from services.connection.faird_connection import FairdConnection
+from services.server.faird_service_producer import FairdServiceProducer
+from services.types.result_cache import ResultCache
+from services.types.table_registry import TableRegistry
+from compute.interactive.interactive import get_result_table
+
+ACTIONS = [["limit", {"rowNum": 1}]]
+
+def make_producer(tmp_path, shared):
+    path = str(tmp_path / "shared.csv")
+    csv.write_csv(pa.table({"id": list(range(10))}), path)
+    producer = SimpleNamespace(connections={}, table_registry=TableRegistry(),
+                               shared_result_cache=ResultCache(1 << 20) if shared else None)
+    producer.invalidate_results = MethodType(FairdServiceProducer.invalidate_results, producer)
+    for connection_id in ("conn-a", "conn-b"):
+        conn = FairdConnection(result_cache=producer.shared_result_cache or ResultCache(1 << 20))
+        producer.connections[connection_id] = conn
+        source = producer.table_registry.acquire((connection_id, "df"), "df", path, CSVParser)
+        conn.dataframes["df"] = source
+        conn.result_cache.put("df", ACTIONS, pa.table({"id": [0]}), source.version)
+    return producer, source.version
+
+@pytest.mark.parametrize("shared", [True, False])
+def test_close_keeps_results_used_by_other_connections(tmp_path, shared):
+    producer, version = make_producer(tmp_path, shared)
+    FairdServiceProducer.close_dataframe(producer, "df", "conn-a")
+    assert "df" not in producer.connections["conn-a"].dataframes
+    assert producer.connections["conn-b"].result_cache.get("df", ACTIONS, version) is not None
+    if not shared:
+        assert producer.connections["conn-a"].result_cache.get("df", ACTIONS, version) is None
+    # 最后一个持有者关闭后失效
+    FairdServiceProducer.close_dataframe(producer, "df", "conn-b")
+    assert producer.connections["conn-b"].result_cache.get("df", ACTIONS, version) is None
+    assert producer.table_registry.stats()["tables"] == 0
+
+def test_modified_file_does_not_hit_stale_results(tmp_path):
+    producer, _ = make_producer(tmp_path, shared=True)
+    path = str(tmp_path / "shared.csv")
+    csv.write_csv(pa.table({"id": list(range(20, 30))}), path)
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 10**9))
+    conn = FairdConnection(result_cache=producer.shared_result_cache)
+    producer.connections["conn-c"] = conn
+    conn.dataframes["df"] = producer.table_registry.acquire(("conn-c", "df"), "df", path, CSVParser)
+    # conn-a 仍持有旧版本，它写入的结果不会被新版本命中
+    assert get_result_table(conn, "df", ACTIONS).to_pydict() == {"id": [20]}
+    assert get_result_table(producer.connections["conn-a"], "df", ACTIONS).to_pydict() == {"id": [0]}
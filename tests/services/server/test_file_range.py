@@ -0,0 +1,88 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../')))
+import zlib
+import pytest
+from sdk.file_download import ChecksumError, RangeDownloader
+from services.server.faird_service_producer import file_range_batches, read_file_range
+
+CHUNK = 1000
+
+@pytest.fixture
+def source_file(tmp_path):
+    path = str(tmp_path / "source.bin")
+    with open(path, "wb") as f:
+        f.write(os.urandom(10 * CHUNK + 123))
+    with open(path, "rb") as f:
+        return path, f.read()
+
+def fetcher(path, calls, fail_after=None, corrupt_at=None):
+    """用服务端的 file_range_batches 模拟 do_get；fail_after 块之后断开一次，corrupt_at 处的块损坏一次。"""
+    def fetch_range(offset, length):
+        calls.append((offset, length))
+        for i, batch in enumerate(file_range_batches(path, offset, length, CHUNK)):
+            if fail_after is not None and i == fail_after and not getattr(fetch_range, "failed", False):
+                fetch_range.failed = True
+                raise ConnectionError("连接中断")
+            data = batch.column(1)[0].as_buffer()
+            if batch.column(0)[0].as_py() == corrupt_at and not getattr(fetch_range, "corrupted", False):
+                fetch_range.corrupted = True
+                data = b"x" * len(data)
+            yield batch.column(0)[0].as_py(), data, batch.column(2)[0].as_py()
+    return fetch_range
+
+def test_read_file_range(source_file):
+    path, content = source_file
+    chunks = list(read_file_range(path, 1500, 2600, CHUNK))
+    assert [offset for offset, _ in chunks] == [1500, 2500, 3500]
+    assert b"".join(chunk.to_pybytes() for _, chunk in chunks) == content[1500:4100]
+    batch = next(file_range_batches(path, 0, None, CHUNK))
+    assert batch.column(2)[0].as_py() == zlib.crc32(content[:CHUNK])
+    assert list(read_file_range(path, len(content), None, CHUNK)) == []
+
+def test_parallel_download(source_file, tmp_path):
+    path, content = source_file
+    dest = str(tmp_path / "dest.bin")
+    calls = []
+    RangeDownloader(fetcher(path, calls), len(content), "v1", dest, parallelism=3, segment_bytes=3 * CHUNK).run()
+    with open(dest, "rb") as f:
+        assert f.read() == content
+    assert len(calls) == 4
+    assert not os.path.exists(dest + ".part.json")
+
+def test_retry_resumes_from_verified_offset(source_file, tmp_path):
+    path, content = source_file
+    dest = str(tmp_path / "dest.bin")
+    calls = []
+    fetch = fetcher(path, calls, fail_after=3, corrupt_at=6 * CHUNK)
+    RangeDownloader(fetch, len(content), "v1", dest, parallelism=1, segment_bytes=len(content)).run()
+    with open(dest, "rb") as f:
+        assert f.read() == content
+    # 断开后从第 3 块继续，校验失败后从损坏的块继续
+    assert [offset for offset, _ in calls] == [0, 3 * CHUNK, 6 * CHUNK]
+
+def test_interrupted_download_resumes_later(source_file, tmp_path, monkeypatch):
+    path, content = source_file
+    dest = str(tmp_path / "dest.bin")
+    monkeypatch.setattr("sdk.file_download.PROGRESS_FLUSH_INTERVAL", 0)
+    with pytest.raises(ChecksumError):
+        RangeDownloader(fetcher(path, [], corrupt_at=5 * CHUNK), len(content), "v1", dest,
+                        segment_bytes=len(content), retries=0).run()
+    assert os.path.exists(dest + ".part.json")
+
+    calls = []
+    RangeDownloader(fetcher(path, calls), len(content), "v1", dest, segment_bytes=len(content)).run()
+    assert calls == [(5 * CHUNK, len(content) - 5 * CHUNK)]
+    with open(dest, "rb") as f:
+        assert f.read() == content
+
+def test_version_change_restarts(source_file, tmp_path, monkeypatch):
+    path, content = source_file
+    dest = str(tmp_path / "dest.bin")
+    monkeypatch.setattr("sdk.file_download.PROGRESS_FLUSH_INTERVAL", 0)
+    with pytest.raises(ChecksumError):
+        RangeDownloader(fetcher(path, [], corrupt_at=5 * CHUNK), len(content), "v1", dest,
+                        segment_bytes=len(content), retries=0).run()
+    calls = []
+    RangeDownloader(fetcher(path, calls), len(content), "v2", dest, segment_bytes=len(content)).run()
+    assert calls == [(0, len(content))]
@@ -0,0 +1,102 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../')))
+import json
+import types
+import numpy as np
+import pyarrow as pa
+import pyarrow.flight
+import pyarrow.csv as csv
+import pytest
+from parser import cache_manager
+from parser.csv_parser import CSVParser
+from compute.interactive import interactive
+from compute.interactive.interactive import get_range_stream, handle_prev_actions, result_layout
+from compute.interactive.plan import TableSource
+from services.connection.faird_connection import FairdConnection
+from services.server import faird_service_producer
+from services.server.faird_service_producer import FairdServiceProducer, split_row_ranges
+from services.types.result_cache import ResultCache
+
+def test_split_row_ranges():
+    assert split_row_ranges(10, 100, 4, 10) == [(0, 3), (3, 3), (6, 3), (9, 1)]
+    # 小于 2 倍 min_bytes 不拆分
+    assert split_row_ranges(10, 15, 4, 10) == [(0, 10)]
+    assert split_row_ranges(0, 100, 4, 10) == [(0, 0)]
+    assert split_row_ranges(1000, 10 ** 9, 1, 10) == [(0, 1000)]
+
+@pytest.mark.parametrize("cache_bytes", [0, 1 << 30])
+@pytest.mark.parametrize("actions", [
+    [],
+    [["filter", {"expression": "x > 0.5"}]],
+    [["filter", {"expression": "x > 0.5"}], ["sort", {"column": "x", "order": "descending"}]],
+])
+def test_ranges_reassemble_in_order(actions, cache_bytes):
+    table = pa.table({"id": np.arange(1000), "x": np.random.default_rng(1).random(1000)})
+    conn = FairdConnection(result_cache=ResultCache(cache_bytes))
+    conn.dataframes["df"] = TableSource(id="df", data=table)
+    expected = handle_prev_actions(table, actions)
+    if actions:
+        conn.result_cache.put("df", actions, expected)
+    ranges = split_row_ranges(expected.num_rows, expected.nbytes, 4, 1)
+    assert len(ranges) == 4
+    parts = [get_range_stream(conn, "df", actions, offset, length).read_all() for offset, length in ranges]
+    assert pa.concat_tables(parts).equals(expected)
+
+def test_layout_without_executing_actions(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_manager, "DEFAULT_CACHE_ROOT", str(tmp_path / "cache"))
+    monkeypatch.setattr(cache_manager, "_cache_manager", None)
+    table = pa.table({"id": np.arange(1000), "x": np.random.default_rng(1).random(1000)})
+    path = str(tmp_path / "layout.csv")
+    csv.write_csv(table, path)
+    parser = CSVParser()
+    parser.parse(path)
+    conn = FairdConnection(result_cache=ResultCache(1 << 30))
+    conn.dataframes["df"] = TableSource(id="df", file_path=path, parser=parser)
+    executed = []
+    monkeypatch.setattr(interactive, "execute_plan", lambda *args: executed.append(args))
+    monkeypatch.setattr(interactive, "execute_plan_stream", lambda *args: executed.append(args))
+
+    schema, num_rows, num_bytes = result_layout(conn, "df", [["select", {"columns": ["x"]}], ["slice", {"offset": 990}]])
+    assert schema.names == ["x"] and num_rows == 10 and num_bytes > 0
+    assert result_layout(conn, "df", [["slice", {"offset": 100, "length": 50}]])[1] == 50
+    # 行数需要执行之后才知道，不预先执行
+    assert result_layout(conn, "df", [["filter", {"expression": "x > 0.5"}]]) is None
+    assert result_layout(conn, "df", [["sort", {"column": "x"}]]) is None
+    assert executed == []
+
+    sorted_table = table.sort_by("x")
+    conn.result_cache.put("df", [["sort", {"column": "x"}]], sorted_table)
+    assert result_layout(conn, "df", [["sort", {"column": "x"}]])[1:] == (1000, sorted_table.nbytes)
+
+def test_uncached_ranges_execute_once(monkeypatch):
+    table = pa.table({"id": np.arange(1000), "x": np.random.default_rng(1).random(1000)})
+    conn = FairdConnection(result_cache=ResultCache(1 << 30))
+    conn.dataframes["df"] = TableSource(id="df", data=table)
+    actions = [["sort", {"column": "x"}]]
+    calls = []
+    execute_plan = interactive.execute_plan
+    monkeypatch.setattr(interactive, "execute_plan", lambda *args: calls.append(args) or execute_plan(*args))
+    parts = [get_range_stream(conn, "df", actions, offset, 250).read_all() for offset in range(0, 1000, 250)]
+    assert pa.concat_tables(parts).equals(table.sort_by("x"))
+    assert len(calls) == 1
+
+@pytest.mark.parametrize("cache_bytes", [0, 1 << 30])
+def test_executed_layout_returns_single_endpoint(monkeypatch, cache_bytes):
+    config = types.SimpleNamespace(flight_max_endpoints=4, flight_endpoint_min_bytes=1)
+    monkeypatch.setattr(faird_service_producer.FairdConfigManager, "get_config", classmethod(lambda cls: config))
+    table = pa.table({"id": np.arange(1000), "x": np.random.default_rng(1).random(1000)})
+    conn = FairdConnection(result_cache=ResultCache(cache_bytes))
+    conn.dataframes["df"] = TableSource(id="df", data=table)
+    producer = types.SimpleNamespace(connections={"conn": conn})
+
+    def flight_info(actions, **params):
+        dataframe = json.dumps({"id": "df", "actions": actions, "connection_id": "conn"})
+        command = json.dumps(dict(params, dataframe=dataframe)).encode("utf-8")
+        return FairdServiceProducer.get_flight_info(producer, None, pa.flight.FlightDescriptor.for_command(command))
+
+    # 行数要执行后才知道：即使已经执行得到行数，结果也可能没有被缓存，只返回一个 endpoint
+    info = flight_info([["filter", {"expression": "x > 0.5"}]])
+    assert len(info.endpoints) == 1 and info.total_records == int((table["x"].to_numpy() > 0.5).sum())
+    # 不执行 action 链就能确定行数时按行范围拆分
+    assert len(flight_info([]).endpoints) == 4
@@ -0,0 +1,55 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../')))
+import pyarrow as pa
+import pytest
+from services.types.blob_loader import BlobLoader, binary_array
+
+@pytest.fixture
+def directory(tmp_path):
+    contents = {f"/files/{i}.bin": os.urandom(100 * (i % 7 + 1)) for i in range(50)}
+    contents["/files/big.bin"] = os.urandom(5000)
+    os.makedirs(tmp_path / "files")
+    for path, data in contents.items():
+        with open(str(tmp_path) + path, "wb") as f:
+            f.write(data)
+    paths = list(contents) + ["/files/missing.bin"]
+    table = pa.table({"name": [os.path.basename(p) for p in paths], "path": paths,
+                      "blob": pa.nulls(len(paths), pa.binary())})
+    return str(tmp_path), table, contents
+
+def test_blobs_loaded_in_order(directory):
+    root, table, contents = directory
+    loader = BlobLoader(root, workers=8, batch_max_bytes=2000, max_file_bytes=4000)
+    batches = list(loader.load(table.to_batches(max_chunksize=20)))
+    result = pa.Table.from_batches(batches, schema=BlobLoader.output_schema(table.schema))
+    assert result["path"].to_pylist() == table["path"].to_pylist()
+    for path, blob, error in zip(*(result[c].to_pylist() for c in ("path", "blob", "blob_error"))):
+        if path in ("/files/big.bin", "/files/missing.bin"):
+            assert blob is None and error
+        else:
+            assert blob == contents[path] and error is None
+    # 每个批次在累计字节数达到上限时立即结束，且不跨越输入批次
+    for batch in batches:
+        sizes = [len(b or b"") for b in batch["blob"].to_pylist()]
+        assert sum(sizes[:-1]) < 2000
+        assert batch.num_rows <= 20
+
+def test_max_rows_and_early_close(directory):
+    root, table, _ = directory
+    loader = BlobLoader(root, workers=4, max_file_bytes=0)
+    stream = loader.load(table.to_batches(), max_rows=7)
+    first = next(stream)
+    assert first.num_rows == 7
+    assert first["blob_error"].null_count == 7
+    stream.close()
+
+def test_binary_array_from_buffers():
+    single = pa.py_buffer(b"abc")
+    array = binary_array([single])
+    # 单个缓冲区直接作为数据缓冲区，不拷贝
+    assert array.buffers()[2].address == single.address
+    mixed = binary_array([pa.py_buffer(b"ab"), None, pa.py_buffer(b""), pa.py_buffer(b"xyz")])
+    mixed.validate(full=True)
+    assert mixed.to_pylist() == [b"ab", None, b"", b"xyz"]
+    assert binary_array([]).to_pylist() == []
@@ -0,0 +1,49 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../')))
+import pyarrow as pa
+from services.types.result_cache import ResultCache
+
+def make_table(n):
+    return pa.table({"a": pa.array(range(n), type=pa.int64())})
+
+def test_hit_and_miss():
+    cache = ResultCache(max_bytes=1024 * 1024)
+    actions = [["filter", {"expression": "a > 1"}], ["sort", {"column": "a", "order": "ascending"}]]
+    assert cache.get("df1", actions) is None
+    table = make_table(10)
+    cache.put("df1", actions, table)
+    # tuple 与 list 形式的 actions 规范化后应命中同一个键
+    assert cache.get("df1", [("filter", {"expression": "a > 1"}), ("sort", {"order": "ascending", "column": "a"})]) is table
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+
+def test_byte_budget_eviction():
+    table = make_table(100)  # 800 字节
+    cache = ResultCache(max_bytes=table.nbytes * 2)
+    for i in range(3):
+        cache.put("df1", [["limit", {"rowNum": i}]], table)
+    assert cache.get("df1", [["limit", {"rowNum": 0}]]) is None
+    assert cache.get("df1", [["limit", {"rowNum": 2}]]) is table
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["total_bytes"] <= cache.max_bytes
+
+def test_invalidate():
+    cache = ResultCache()
+    cache.put("df1", [["limit", {"rowNum": 1}]], make_table(1))
+    cache.put("df2", [["limit", {"rowNum": 1}]], make_table(1))
+    cache.invalidate("df1")
+    assert cache.get("df1", [["limit", {"rowNum": 1}]]) is None
+    assert cache.get("df2", [["limit", {"rowNum": 1}]]) is not None
+
+def test_versions():
+    cache = ResultCache()
+    actions = [["limit", {"rowNum": 1}]]
+    cache.put("df1", actions, make_table(1), version="v1")
+    cache.put("df1", actions, make_table(2), version="v2")
+    assert cache.get("df1", actions, "v1").num_rows == 1
+    assert cache.get("df1", actions, "v2").num_rows == 2
+    cache.invalidate("df1", "v1")
+    assert cache.get("df1", actions, "v1") is None
+    assert cache.get("df1", actions, "v2") is not None
@@ -0,0 +1,44 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../')))
+import pyarrow as pa
+import pyarrow.csv as csv
+import pytest
+from services.types.table_registry import TableRegistry
+from parser.csv_parser import CSVParser
+
+@pytest.fixture
+def csv_file(tmp_path):
+    path = tmp_path / "shared.csv"
+    csv.write_csv(pa.table({"id": list(range(10))}), str(path))
+    return str(path)
+
+def test_connections_share_source(csv_file):
+    registry = TableRegistry()
+    a = registry.acquire(("conn-a", "df"), "df", csv_file, CSVParser)
+    b = registry.acquire(("conn-b", "df"), "df", csv_file, CSVParser)
+    assert a is b
+    assert registry.ref_count(csv_file, CSVParser) == 2
+    # 同一持有者重复 open 不增加引用
+    registry.acquire(("conn-a", "df"), "df", csv_file, CSVParser)
+    assert registry.ref_count(csv_file, CSVParser) == 2
+
+def test_release_last_holder_drops_table(csv_file):
+    registry = TableRegistry()
+    registry.acquire(("conn-a", "df"), "df", csv_file, CSVParser)
+    registry.acquire(("conn-b", "df"), "df", csv_file, CSVParser)
+    assert not registry.release(("conn-a", "df"))
+    assert registry.release_connection("conn-b") == 1
+    assert registry.stats() == {"tables": 0, "holders": 0, "materialized": 0}
+    assert not registry.release(("conn-b", "df"))
+
+def test_modified_file_gets_new_source(csv_file):
+    registry = TableRegistry()
+    old = registry.acquire(("conn-a", "df"), "df", csv_file, CSVParser)
+    csv.write_csv(pa.table({"id": list(range(20))}), csv_file)
+    os.utime(csv_file, ns=(0, os.stat(csv_file).st_mtime_ns + 10**9))
+    new = registry.acquire(("conn-b", "df"), "df", csv_file, CSVParser)
+    assert new is not old
+    assert new.data.num_rows == 20
+    assert new.version != old.version
+    assert registry.stats()["tables"] == 2
@@ -0,0 +1,106 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+import json
+import random
+import numpy as np
+import pyarrow as pa
+import pyarrow.flight
+import pytest
+from compute.interactive.interactive import handle_compute_actions
+from compute.interactive.plan import TableSource
+from services.connection.faird_connection import FairdConnection
+from services.types.result_cache import ResultCache
+from utils.aggregate_utils import aggregate_batches, describe_batches, estimate_from_clusters
+
+@pytest.fixture
+def table():
+    rng = np.random.default_rng(0)
+    n = 20000
+    y = rng.integers(0, 100, n).astype(object)
+    y[rng.random(n) < 0.1] = None
+    return pa.table({
+        "k": pa.array(rng.integers(0, 20, n)).cast(pa.string()),
+        "x": rng.normal(1e6, 2.0, n),
+        "y": pa.array(y.tolist(), pa.int64()),
+    })
+
+def test_group_by_matches_pandas(table):
+    aggregations = [("x", "mean"), ("x", "stddev"), ("y", "sum"), ("y", "count"), ("y", "max"), ("*", "count")]
+    result = aggregate_batches(table.to_batches(max_chunksize=999), table.schema, aggregations, ["k"], ddof=1).to_pandas()
+    expected = table.to_pandas().groupby("k").agg(
+        x_mean=("x", "mean"), x_stddev=("x", "std"), y_sum=("y", "sum"), y_count=("y", "count"),
+        y_max=("y", "max"), count=("x", "size")).reset_index()
+    assert list(result.columns) == list(expected.columns)
+    assert (result["k"] == expected["k"]).all()
+    for column in expected.columns[1:]:
+        np.testing.assert_allclose(result[column].astype(float), expected[column].astype(float), rtol=1e-9)
+
+def test_empty_input(table):
+    result = aggregate_batches([], table.schema, {"x": ["sum", "mean"], "*": "count"})
+    assert result.to_pylist() == [{"x_sum": None, "x_mean": None, "count": 0}]
+    assert aggregate_batches([], table.schema, {"x": "sum"}, ["k"]).num_rows == 0
+
+def test_invalid_aggregations(table):
+    with pytest.raises(ValueError):
+        aggregate_batches(table.to_batches(), table.schema, [("x", "median")])
+    with pytest.raises(ValueError):
+        aggregate_batches(table.to_batches(), table.schema, [("missing", "sum")])
+
+def test_describe_matches_pandas(table):
+    result = describe_batches(table.to_batches(max_chunksize=999), table.schema).to_pandas().set_index("statistic")
+    expected = table.to_pandas().describe().loc[list(result.index)]
+    np.testing.assert_allclose(result[["x", "y"]].to_numpy(), expected[["x", "y"]].to_numpy(), rtol=1e-9)
+
+def test_compute_aggregate_action(table):
+    conn = FairdConnection(result_cache=ResultCache(1 << 30))
+    conn.dataframes["df"] = TableSource(id="df", data=table)
+    dataframe = json.dumps({"id": "df", "actions": [["filter", {"expression": "y > 50"}]], "connection_id": "c"})
+    body = {"dataframe": dataframe, "aggregations": [["x", "sum"], ["*", "count"]], "group_by": ["k"]}
+    results = handle_compute_actions({"c": conn}, pa.flight.Action("compute_aggregate", json.dumps(body).encode()))
+    result = pa.ipc.open_stream(next(iter(results)).body).read_all()
+    filtered = table.filter(pa.compute.field("y") > 50)
+    assert result["count"].to_pylist() == filtered.group_by("k").aggregate([([], "count_all")]).sort_by("k")["count_all"].to_pylist()
+    assert result.column_names == ["k", "x_sum", "count"]
+
+@pytest.mark.parametrize("function", ["sum", "mean", "quantile"])
+def test_sample_intervals_cover_truth(table, function):
+    clusters = [pa.chunked_array([table["y"].slice(i, 100).combine_chunks()]) for i in range(0, table.num_rows, 100)]
+    truth = {"sum": pa.compute.sum, "mean": pa.compute.mean}.get(function, lambda c: pa.compute.quantile(c, q=0.5)[0])(table["y"]).as_py()
+    covered = 0
+    for seed in range(40):
+        sample = random.Random(seed).sample(clusters, 40)
+        result = estimate_from_clusters(sample, len(clusters), function, confidence=0.95)
+        assert not result.exact and result.lower <= result.value <= result.upper
+        covered += result.lower <= truth <= result.upper
+    # 95% 置信区间，40 次中至少 32 次覆盖真值
+    assert covered >= 32
+
+def test_quantile_interval_accounts_for_clustering():
+    # 批次内的值高度相关（整列有序）时，按简单随机抽样计算的区间过窄
+    values = np.sort(np.random.default_rng(3).normal(size=100000))
+    clusters = [pa.chunked_array([pa.array(values[i:i + 1000])]) for i in range(0, len(values), 1000)]
+    truth = float(np.quantile(values, 0.5))
+    covered = 0
+    for seed in range(40):
+        sample = random.Random(seed).sample(clusters, 20)
+        result = estimate_from_clusters(sample, len(clusters), "quantile", confidence=0.95)
+        covered += result.lower <= truth <= result.upper
+    assert covered >= 32
+    assert estimate_from_clusters(clusters[:1], len(clusters), "quantile").lower is None
+
+def test_sample_of_all_batches_is_exact(table):
+    clusters = [pa.chunked_array([batch.column("x")]) for batch in table.to_batches(max_chunksize=1000)]
+    result = estimate_from_clusters(clusters, len(clusters), "mean")
+    assert result.exact and result.value == pytest.approx(pa.compute.mean(table["x"]).as_py(), rel=1e-12)
+    assert estimate_from_clusters([pa.chunked_array([], pa.null())] * 3, 10, "sum").value is None
+
+def test_compute_approximate_action_falls_back_to_exact(table):
+    conn = FairdConnection()
+    conn.dataframes["df"] = TableSource(id="df", data=table)
+    dataframe = json.dumps({"id": "df", "actions": [["sort", {"column": "x"}]], "connection_id": "c"})
+    for function, expected in (("count_distinct", 100), ("mean", pa.compute.mean(table["y"]).as_py())):
+        body = {"dataframe": dataframe, "column": "y", "function": function, "approx": True}
+        results = handle_compute_actions({"c": conn}, pa.flight.Action("compute_approximate", json.dumps(body).encode()))
+        result = json.loads(next(iter(results)).body.to_pybytes())["result"]
+        assert result["exact"] and result["value"] == pytest.approx(expected) and result["sampled_rows"] == table.num_rows
@@ -0,0 +1,72 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+import math
+import pyarrow as pa
+import pytest
+from utils.expression_utils import compile_filter_expression, filter_table, map_table
+from utils.udf_utils import register_udf, registered_udfs
+
+def make_table():
+    return pa.table({
+        "lat": [10.0, 35.0, 50.0, float("nan"), 60.0],
+        "lon": [100, -20, 30, 40, None],
+        "name": ["a", "b", "c", "d", "e"],
+    })
+
+def test_referenced_columns():
+    _, columns = compile_filter_expression("(lat > 30) & (lon < 100)")
+    assert columns == {"lat", "lon"}
+
+@pytest.mark.parametrize("expression, expected", [
+    ("lat > 30", ["b", "c", "e"]),
+    ("(lat > 30) & (lon < 35)", ["b", "c"]),
+    ("(lat < 20) | (lon == 40)", ["a", "d"]),
+    ("30 < lat <= 50", ["b", "c"]),
+    ("name.isin(['a', 'e'])", ["a", "e"]),
+    ("name in ('b', 'c')", ["b", "c"]),
+    ("lat.isnull()", ["d"]),
+    ("~(lat > 30)", ["a", "d"]),
+    ("lon / 4 > 7", ["a", "c", "d"]),
+    ("lat.between(35, 50)", ["b", "c"]),
+    ("name.str.contains('c')", ["c"]),
+])
+def test_filter_matches_pandas_semantics(expression, expected):
+    result = filter_table(make_table(), expression)
+    assert result["name"].to_pylist() == expected
+
+def test_unknown_column():
+    with pytest.raises(ValueError):
+        filter_table(make_table(), "height > 1")
+
+def test_fallback_to_eval():
+    # 不支持的语法降级到 pandas eval
+    result = filter_table(make_table(), "lat.round() > 40")
+    assert result["name"].to_pylist() == ["c", "e"]
+
+def test_map_expression_matches_python():
+    table = make_table()
+    mapped = map_table(table, None, "sqrt(abs(lon)) + lat * 2", "v")
+    expected = [None if lon is None else math.sqrt(abs(lon)) + lat * 2
+                for lat, lon in zip(table["lat"].to_pylist(), table["lon"].to_pylist())]
+    result = mapped["v"].to_pylist()
+    assert mapped.column_names == ["lat", "lon", "name", "v"]
+    assert [r is None for r in result] == [e is None for e in expected]
+    assert all(r is None or math.isnan(e) or r == pytest.approx(e) for r, e in zip(result, expected))
+    # 同名列原位替换，函数名作用于 column
+    replaced = map_table(table, "lon", "abs", "lon")
+    assert replaced.column_names == table.column_names
+    assert replaced["lon"].to_pylist() == [100, 20, 30, 40, None]
+    with pytest.raises(ValueError):
+        map_table(table, None, "no_such_function(lat)", "v")
+
+def test_map_callable_fallback():
+    assert map_table(make_table(), "name", str.upper, "upper")["upper"].to_pylist() == ["A", "B", "C", "D", "E"]
+
+def test_registered_udf_in_map_and_filter():
+    register_udf("test_kelvin_to_celsius", lambda values: values - 273.15, {"values": pa.float64()}, pa.float64())
+    assert "test_kelvin_to_celsius" in registered_udfs()
+    table = pa.table({"tas": [273.15, None, 300.0]})
+    mapped = map_table(table, "tas", "test_kelvin_to_celsius", "celsius")
+    assert mapped["celsius"].to_pylist() == [0.0, None, pytest.approx(26.85)]
+    assert filter_table(table, "test_kelvin_to_celsius(tas) > 20")["tas"].to_pylist() == [300.0]
@@ -0,0 +1,27 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+import numpy as np
+import pyarrow as pa
+import pytest
+from utils.sketch_utils import HyperLogLog
+
+@pytest.mark.parametrize("cardinality", [1, 100, 5000, 200000])
+def test_estimate_within_error(cardinality):
+    sketch = HyperLogLog()
+    values = np.random.default_rng(cardinality).permutation(np.arange(cardinality).repeat(3))
+    for chunk in np.array_split(values, 7):
+        sketch.add(pa.array(chunk))
+    assert sketch.estimate() == pytest.approx(cardinality, rel=4 * sketch.standard_error)
+
+def test_strings_nulls_and_merge():
+    left, right = HyperLogLog(), HyperLogLog()
+    left.add(pa.array([f"k{i}" for i in range(3000)] + [None]))
+    right.add(pa.chunked_array([[f"k{i}" for i in range(2000, 6000)]]))
+    left.merge(right)
+    assert left.estimate() == pytest.approx(6000, rel=4 * left.standard_error)
+    restored = HyperLogLog.from_bytes(left.to_bytes())
+    assert restored.estimate() == left.estimate()
+    empty = HyperLogLog()
+    empty.add(pa.nulls(10, pa.int64()))
+    assert empty.estimate() == 0
@@ -0,0 +1,305 @@
+import math
+from statistics import NormalDist
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from utils.logger_utils import get_logger
+logger = get_logger(__name__)
+
+AGGREGATE_FUNCTIONS = ("count", "sum", "mean", "min", "max", "variance", "stddev")
+# column 为 "*" 时只支持 count，统计行数（含 null）
+ALL_ROWS = "*"
+# 分组的部分结果累计超过该行数时合并一次，保证内存只与分组数相关
+COMPACT_ROWS = 65536
+DESCRIBE_STATISTICS = ("count", "mean", "std", "min", "max")
+APPROXIMATE_FUNCTIONS = ("sum", "mean", "quantile", "count_distinct")
+DEFAULT_SAMPLE_FRACTION = 0.01
+DEFAULT_CONFIDENCE = 0.95
+
+
+class ApproximateResult(NamedTuple):
+    """
+    近似聚合的结果：估计值 value 及置信水平为 confidence 的区间 [lower, upper]，样本不足以估计区间时为 None。
+    exact 为 True 表示结果是精确值（例如样本覆盖了全部数据，或由缓存的统计信息得到）；
+    sampled_rows 为实际读取的行数，只用统计信息或 sketch 时为 0。
+    """
+    value: Any
+    lower: Any
+    upper: Any
+    confidence: float
+    exact: bool
+    sampled_rows: int
+
+
+def normalize_aggregations(aggregations: Union[Dict[str, Union[str, Sequence[str]]], Sequence[Sequence[str]]]) -> List[Tuple[str, str]]:
+    """把 {"x": ["sum", "mean"]} 或 [("x", "sum"), ...] 统一为 [(列, 函数), ...] 并校验函数名。"""
+    if isinstance(aggregations, dict):
+        pairs = []
+        for column, functions in aggregations.items():
+            for function in ([functions] if isinstance(functions, str) else functions):
+                pairs.append((column, function))
+    else:
+        pairs = [tuple(pair) for pair in aggregations]
+    if not pairs:
+        raise ValueError("至少需要一个聚合函数")
+    for column, function in pairs:
+        if function not in AGGREGATE_FUNCTIONS:
+            raise ValueError(f"不支持的聚合函数: {function}，可选: {', '.join(AGGREGATE_FUNCTIONS)}")
+        if column == ALL_ROWS and function != "count":
+            raise ValueError(f"列 {ALL_ROWS} 只支持 count")
+    return pairs
+
+
+def aggregate_output_name(column: str, function: str) -> str:
+    return "count" if column == ALL_ROWS else f"{column}_{function}"
+
+
+def aggregate_columns(aggregations: List[Tuple[str, str]], group_by: Optional[List[str]] = None) -> List[str]:
+    """聚合需要读取的列，用于投影下推。"""
+    columns = list(group_by or [])
+    for column, _ in aggregations:
+        if column != ALL_ROWS and column not in columns:
+            columns.append(column)
+    return columns
+
+
+class _StreamingAggregator:
+    """
+    分批的哈希聚合：每个批次用 Table.group_by 算出可合并的部分状态（count / sum / min / max，
+    以及方差所需的平移后的一阶、二阶和），部分结果累计到一定行数后再按分组合并，
+    因此只需扫描一遍数据，内存与分组数而不是行数相关。
+    方差按平移数据计算（以第一个批次的均值为参考点），避免大数值时 Σx² - (Σx)²/n 的精度损失。
+    """
+
+    def __init__(self, aggregations, group_by, ddof):
+        self.aggregations = aggregations
+        self.keys = list(group_by or [])
+        self.ddof = ddof
+        self.shifts = {}
+        self.partials = []
+        self.partial_rows = 0
+        # 部分状态：名称 -> (输入列, 批次内聚合函数, 合并函数)
+        self.states = {}
+        for column, function in aggregations:
+            if column == ALL_ROWS:
+                self.states["__rows"] = ([], "count_all", "sum")
+            elif function in ("count", "mean", "variance", "stddev"):
+                self.states[f"__count_{column}"] = (column, "count", "sum")
+            if function in ("sum", "mean") and column != ALL_ROWS:
+                self.states[f"__sum_{column}"] = (column, "sum", "sum")
+            if function in ("min", "max"):
+                self.states[f"__{function}_{column}"] = (column, function, function)
+            if function in ("variance", "stddev"):
+                self.states[f"__s1_{column}"] = (f"__shifted_{column}", "sum", "sum")
+                self.states[f"__s2_{column}"] = (f"__squared_{column}", "sum", "sum")
+
+    def add(self, batch: pa.RecordBatch):
+        table = pa.Table.from_batches([batch])
+        for column in {column for column, function in self.aggregations if function in ("variance", "stddev")}:
+            values = pc.cast(table[column], pa.float64())
+            if column not in self.shifts:
+                mean = pc.mean(values).as_py()
+                if mean is None:
+                    continue
+                self.shifts[column] = mean
+            shifted = pc.subtract(values, self.shifts[column])
+            table = table.append_column(f"__shifted_{column}", shifted)
+            table = table.append_column(f"__squared_{column}", pc.multiply(shifted, shifted))
+        for column in {column for column, function in self.aggregations if function in ("variance", "stddev")}:
+            if f"__shifted_{column}" not in table.column_names:
+                # 还没有非空值，平移量未确定：该批次对方差没有贡献
+                null = pa.nulls(table.num_rows, pa.float64())
+                table = table.append_column(f"__shifted_{column}", null).append_column(f"__squared_{column}", null)
+        self._add_partial(self._group(table, {name: (source, function) for name, (source, function, _) in self.states.items()}))
+
+    def _group(self, table, states):
+        specs = [(source, function) for source, function in states.values()]
+        grouped = table.group_by(self.keys, use_threads=False).aggregate(specs)
+        arrays = [grouped[key] for key in self.keys]
+        for (source, function), name in zip(specs, states):
+            arrays.append(grouped[f"{source}_{function}" if source else function])
+        return pa.Table.from_arrays(arrays, names=self.keys + list(states))
+
+    def _add_partial(self, partial):
+        self.partials.append(partial)
+        self.partial_rows += partial.num_rows
+        if self.partial_rows > COMPACT_ROWS and len(self.partials) > 1:
+            self._compact()
+
+    def _compact(self):
+        merged = pa.concat_tables(self.partials)
+        self.partials = [self._group(merged, {name: (name, merge) for name, (_, _, merge) in self.states.items()})]
+        self.partial_rows = self.partials[0].num_rows
+
+    def result(self, schema: pa.Schema) -> pa.Table:
+        if not self.partials:
+            empty = schema.empty_table()
+            for column in {column for column, function in self.aggregations if function in ("variance", "stddev")}:
+                empty = empty.append_column(f"__shifted_{column}", pa.array([], pa.float64()))
+                empty = empty.append_column(f"__squared_{column}", pa.array([], pa.float64()))
+            self.partials = [self._group(empty, {name: (source, function) for name, (source, function, _) in self.states.items()})]
+        self._compact()
+        state = self.partials[0]
+        arrays = [state[key] for key in self.keys]
+        names = list(self.keys)
+        for column, function in self.aggregations:
+            names.append(aggregate_output_name(column, function))
+            if column == ALL_ROWS:
+                arrays.append(state["__rows"])
+            elif function == "count":
+                arrays.append(state[f"__count_{column}"])
+            elif function == "sum":
+                arrays.append(state[f"__sum_{column}"])
+            elif function in ("min", "max"):
+                arrays.append(state[f"__{function}_{column}"])
+            elif function == "mean":
+                count = state[f"__count_{column}"]
+                mean = pc.divide(pc.cast(state[f"__sum_{column}"], pa.float64()), pc.if_else(pc.equal(count, 0), None, count))
+                arrays.append(mean)
+            else:
+                arrays.append(self._variance(state, column, function))
+        result = pa.Table.from_arrays(arrays, names=names)
+        if self.keys:
+            result = result.sort_by([(key, "ascending") for key in self.keys])
+        return result
+
+    def _variance(self, state, column, function):
+        n = pc.cast(state[f"__count_{column}"], pa.float64())
+        s1, s2 = state[f"__s1_{column}"], state[f"__s2_{column}"]
+        m2 = pc.subtract(s2, pc.divide(pc.multiply(s1, s1), pc.if_else(pc.equal(n, 0), None, n)))
+        # 舍入误差可能使 m2 略小于 0
+        m2 = pc.max_element_wise(m2, 0.0)
+        denominator = pc.subtract(n, float(self.ddof))
+        variance = pc.divide(m2, pc.if_else(pc.less_equal(denominator, 0), None, denominator))
+        return pc.sqrt(variance) if function == "stddev" else variance
+
+
+def aggregate_batches(batches: Iterable[pa.RecordBatch], schema: pa.Schema, aggregations, group_by: Optional[List[str]] = None,
+                      ddof: int = 0) -> pa.Table:
+    """
+    一遍扫描完成多个 (列, 函数) 聚合，可选按 group_by 分组。返回的表每个分组一行（无分组时一行），
+    分组列在前，聚合列命名为 {列}_{函数}，count("*") 命名为 count。
+    """
+    aggregations = normalize_aggregations(aggregations)
+    for column in aggregate_columns(aggregations, group_by):
+        if column not in schema.names:
+            raise ValueError(f"列不存在: {column}")
+    aggregator = _StreamingAggregator(aggregations, group_by, ddof)
+    for batch in batches:
+        if batch.num_rows:
+            aggregator.add(batch)
+    return aggregator.result(schema)
+
+
+def describe_batches(batches: Iterable[pa.RecordBatch], schema: pa.Schema) -> pa.Table:
+    """
+    对所有数值列一遍扫描计算 count / mean / std（ddof=1，与 pandas 一致）/ min / max，
+    返回 statistic 列加上每个数值列一列（float64）的表。
+    """
+    columns = [field.name for field in schema
+               if pa.types.is_integer(field.type) or pa.types.is_floating(field.type) or pa.types.is_decimal(field.type)]
+    statistic = pa.array(DESCRIBE_STATISTICS, pa.string())
+    if not columns:
+        return pa.table({"statistic": statistic})
+    functions = ("count", "mean", "stddev", "min", "max")
+    aggregations = [(column, function) for column in columns for function in functions]
+    result = aggregate_batches((batch.select(columns) for batch in batches), pa.schema([schema.field(c) for c in columns]),
+                               aggregations, ddof=1)
+    arrays = [statistic]
+    for column in columns:
+        values = [pc.cast(result[aggregate_output_name(column, function)], pa.float64())[0].as_py() for function in functions]
+        arrays.append(pa.array(values, pa.float64()))
+    return pa.Table.from_arrays(arrays, names=["statistic"] + columns)
+
+
+def _z(confidence: float) -> float:
+    return NormalDist().inv_cdf((1 + confidence) / 2)
+
+
+def _drop_nan(values):
+    values = values.drop_null()
+    if pa.types.is_floating(values.type):
+        values = values.filter(pc.invert(pc.is_nan(values)))
+    return values
+
+
+def exact_aggregate(values, function: str, q: float = 0.5):
+    """在全部数据上精确计算 APPROXIMATE_FUNCTIONS 中的函数，quantile 使用线性插值。"""
+    if function == "quantile":
+        return pc.quantile(values, q=q)[0].as_py()
+    if function == "count_distinct":
+        return pc.count_distinct(values).as_py()
+    return getattr(pc, function)(values).as_py()
+
+
+def exact_result(value, rows: int, confidence: float = DEFAULT_CONFIDENCE) -> ApproximateResult:
+    return ApproximateResult(value, value, value, confidence, True, rows)
+
+
+def estimate_from_clusters(clusters: List[pa.ChunkedArray], population: int, function: str,
+                           confidence: float = DEFAULT_CONFIDENCE, q: float = 0.5) -> ApproximateResult:
+    """
+    由批次样本估计整体的 sum / mean / quantile。样本是从 population 个批次中无放回随机抽取的 m 个批次（整群抽样），
+    clusters 为每个抽中的批次执行 action 后该列的值（可以为空）：
+    - sum：M/m·Σyᵢ，方差按 M²(1-f)s²/m 估计，f = m/M；
+    - mean：比率估计 Σyᵢ/Σnᵢ，方差用线性化的 (1-f)·Σ(yᵢ - r·nᵢ)²/(m-1)/(m·n̄²)；
+    - quantile：样本上的 t-digest 分位数 v，区间按 Woodruff 方法：各批次中 ≤ v 的值的比例 p 按与 mean 相同的
+      比率估计计算批次间方差，再取样本分位数 p ± z·se 处的值，同一批次内的值相关时区间相应变宽。
+    抽中全部批次时返回精确值；m < 2 时无法估计方差，区间为 None。
+    """
+    rows = sum(len(cluster) for cluster in clusters)
+    m, population = len(clusters), max(population, len(clusters))
+    if m == population:
+        values = pa.chunked_array([chunk for cluster in clusters for chunk in cluster.chunks]) if rows else None
+        value = exact_aggregate(values, function, q) if values is not None else None
+        return exact_result(value, rows, confidence)
+
+    if function == "quantile":
+        values = [_drop_nan(cluster) for cluster in clusters]
+        counts = [len(v) for v in values]
+        n = sum(counts)
+        if not n:
+            return ApproximateResult(None, None, None, confidence, False, rows)
+        combined = pa.chunked_array([chunk for v in values for chunk in v.chunks])
+        value = pc.tdigest(combined, q=q)[0].as_py()
+        if m < 2:
+            return ApproximateResult(value, None, None, confidence, False, rows)
+        below = [pc.sum(pc.less_equal(v, value)).as_py() if count else 0 for v, count in zip(values, counts)]
+        p = sum(below) / n
+        residuals = sum((b - p * count) ** 2 for b, count in zip(below, counts))
+        se = math.sqrt((1 - m / population) * residuals / (m - 1) / (m * (n / m) ** 2))
+        half = _z(confidence) * se
+        lower, upper = pc.tdigest(combined, q=[max(0.0, p - half), min(1.0, p + half)]).to_pylist()
+        return ApproximateResult(value, min(lower, value), max(upper, value), confidence, False, rows)
+
+    counts = [len(cluster) - cluster.null_count for cluster in clusters]
+    sums = [(pc.sum(cluster).as_py() or 0) if count else 0 for cluster, count in zip(clusters, counts)]
+    if not sum(counts):
+        return ApproximateResult(None, None, None, confidence, False, rows)
+    f = m / population
+    if function == "sum":
+        value = population * sum(sums) / m
+        if m < 2:
+            return ApproximateResult(value, None, None, confidence, False, rows)
+        mean = sum(sums) / m
+        se = population * math.sqrt((1 - f) * sum((y - mean) ** 2 for y in sums) / (m - 1) / m)
+    elif function == "mean":
+        value = sum(sums) / sum(counts)
+        if m < 2:
+            return ApproximateResult(value, None, None, confidence, False, rows)
+        mean_count = sum(counts) / m
+        residuals = sum((y - value * n) ** 2 for y, n in zip(sums, counts))
+        se = math.sqrt((1 - f) * residuals / (m - 1) / (m * mean_count ** 2))
+    else:
+        raise ValueError(f"函数 {function} 不能由批次样本估计")
+    half = _z(confidence) * se
+    return ApproximateResult(value, value - half, value + half, confidence, False, rows)
+
+
+def estimate_from_sketch(sketch, confidence: float = DEFAULT_CONFIDENCE) -> ApproximateResult:
+    """由 HyperLogLog 估计不同值个数，区间按相对标准误差计算。"""
+    value = sketch.estimate()
+    half = _z(confidence) * sketch.standard_error * value
+    return ApproximateResult(round(value), max(0, math.floor(value - half)), math.ceil(value + half), confidence, False, 0)
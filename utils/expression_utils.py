@@ -0,0 +1,322 @@
+import ast
+import operator
+
+import pyarrow as pa
+import pyarrow.acero as acero
+import pyarrow.compute as pc
+
+from utils.logger_utils import get_logger
+logger = get_logger(__name__)
+
+_COMPARE_OPS = {
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+}
+
+_ARITHMETIC_FUNCS = {
+    ast.Add: "add",
+    ast.Sub: "subtract",
+    ast.Mult: "multiply",
+    ast.Pow: "power",
+}
+
+# 表达式中可以直接调用的函数，名字与 numpy 一致；其余名字按 pyarrow.compute 中注册的函数（包括服务端注册的 UDF）调用
+_FUNCTIONS = {
+    "abs": "abs",
+    "sqrt": "sqrt",
+    "exp": "exp",
+    "log": "ln",
+    "log10": "log10",
+    "log2": "log2",
+    "floor": "floor",
+    "ceil": "ceil",
+    "round": "round",
+    "sin": "sin",
+    "cos": "cos",
+    "tan": "tan",
+    "arcsin": "asin",
+    "arccos": "acos",
+    "arctan": "atan",
+    "arctan2": "atan2",
+    "where": "if_else",
+}
+
+_STR_METHODS = {
+    "contains": "match_substring",
+    "startswith": "starts_with",
+    "endswith": "ends_with",
+}
+
+
+class _ExpressionCompiler(ast.NodeVisitor):
+    """
+    将 filter 字符串（兼容原先基于 pandas eval 的写法，如 "(lat > 30) & (lon < 100)"）或 map 表达式
+    （如 "sqrt(u ** 2 + v ** 2)"）编译为 pyarrow.compute.Expression，并记录表达式引用到的列名。
+    """
+
+    def __init__(self, kind: str = "filter"):
+        self.kind = kind
+        self.columns = set()
+
+    def compile(self, expression: str):
+        try:
+            tree = ast.parse(expression.strip(), mode="eval")
+        except SyntaxError as e:
+            raise ValueError(f"{self.kind} 表达式语法错误: {expression}") from e
+        return self.visit(tree.body)
+
+    def generic_visit(self, node):
+        raise ValueError(f"{self.kind} 表达式中不支持的语法: {ast.dump(node)}")
+
+    def visit_Name(self, node):
+        if node.id in ("True", "False", "None"):
+            return {"True": True, "False": False, "None": None}[node.id]
+        self.columns.add(node.id)
+        return pc.field(node.id)
+
+    def visit_Constant(self, node):
+        return node.value
+
+    def visit_List(self, node):
+        return [self._literal(elt) for elt in node.elts]
+
+    visit_Tuple = visit_List
+    visit_Set = visit_List
+
+    def visit_Subscript(self, node):
+        # 兼容 df["column name"] 写法
+        if isinstance(node.value, ast.Name) and isinstance(node.slice, ast.Constant) and isinstance(node.slice.value, str):
+            self.columns.add(node.slice.value)
+            return pc.field(node.slice.value)
+        raise ValueError(f"{self.kind} 表达式中不支持的下标写法: {ast.dump(node)}")
+
+    def visit_Compare(self, node):
+        left = self.visit(node.left)
+        result = None
+        for op, comparator in zip(node.ops, node.comparators):
+            if isinstance(op, (ast.In, ast.NotIn)):
+                values = self.visit(comparator)
+                if not isinstance(values, list):
+                    raise ValueError("in / not in 的右侧必须是常量列表")
+                cond = pc.coalesce(self._as_expr(left).isin(values), False)
+                if isinstance(op, ast.NotIn):
+                    cond = pc.invert(cond)
+                right = None
+            else:
+                op_func = _COMPARE_OPS.get(type(op))
+                if op_func is None:
+                    raise ValueError(f"{self.kind} 表达式中不支持的比较运算: {type(op).__name__}")
+                right = self.visit(comparator)
+                # 与 pandas 语义保持一致：与缺测值比较的结果为 False 而不是 null
+                cond = pc.coalesce(op_func(self._as_expr(left), right), False)
+            result = cond if result is None else (result & cond)
+            left = right
+        return result
+
+    def visit_BoolOp(self, node):
+        values = [self._as_expr(self.visit(v)) for v in node.values]
+        result = values[0]
+        for value in values[1:]:
+            result = (result & value) if isinstance(node.op, ast.And) else (result | value)
+        return result
+
+    def visit_BinOp(self, node):
+        left = self.visit(node.left)
+        right = self.visit(node.right)
+        if isinstance(node.op, ast.BitAnd):
+            return self._as_expr(left) & right
+        if isinstance(node.op, ast.BitOr):
+            return self._as_expr(left) | right
+        if isinstance(node.op, ast.BitXor):
+            return pc.xor(left, right)
+        if isinstance(node.op, ast.Div):
+            # 与 pandas 保持一致，整数相除得到浮点数
+            return pc.divide(self._as_expr(left).cast(pa.float64()), right)
+        if isinstance(node.op, ast.Mod):
+            left_expr = self._as_expr(left)
+            return pc.subtract(left_expr, pc.multiply(pc.floor(pc.divide(left_expr.cast(pa.float64()), right)), right))
+        func_name = _ARITHMETIC_FUNCS.get(type(node.op))
+        if func_name is None:
+            raise ValueError(f"{self.kind} 表达式中不支持的运算符: {type(node.op).__name__}")
+        return getattr(pc, func_name)(left, right)
+
+    def visit_UnaryOp(self, node):
+        operand = self.visit(node.operand)
+        if isinstance(node.op, (ast.Invert, ast.Not)):
+            return pc.invert(self._as_expr(operand))
+        if isinstance(node.op, ast.USub):
+            return pc.negate(operand) if isinstance(operand, pc.Expression) else -operand
+        if isinstance(node.op, ast.UAdd):
+            return operand
+        raise ValueError(f"{self.kind} 表达式中不支持的一元运算: {type(node.op).__name__}")
+
+    def visit_Call(self, node):
+        if node.keywords:
+            raise ValueError(f"{self.kind} 表达式中的函数调用不支持关键字参数")
+        # abs(col)、where(cond, a, b)、已注册的函数 udf_name(col, ...)
+        if isinstance(node.func, ast.Name):
+            return self._call_function(node.func.id, [self._as_expr(self.visit(arg)) for arg in node.args])
+        if not isinstance(node.func, ast.Attribute):
+            raise ValueError(f"{self.kind} 表达式中不支持的函数调用: {ast.dump(node.func)}")
+        method = node.func.attr
+        owner = node.func.value
+        # col.str.contains("x") / col.str.startswith("x") / col.str.endswith("x")
+        if isinstance(owner, ast.Attribute) and owner.attr == "str" and method in _STR_METHODS:
+            target = self._as_expr(self.visit(owner.value))
+            pattern = self._literal(node.args[0])
+            return pc.coalesce(getattr(pc, _STR_METHODS[method])(target, pattern), False)
+        target = self._as_expr(self.visit(owner))
+        if method == "isin":
+            values = self.visit(node.args[0])
+            if not isinstance(values, list):
+                raise ValueError("isin 的参数必须是常量列表")
+            return pc.coalesce(target.isin(values), False)
+        if method in ("isnull", "isna"):
+            return target.is_null(nan_is_null=True)
+        if method in ("notnull", "notna"):
+            return pc.invert(target.is_null(nan_is_null=True))
+        if method == "between" and len(node.args) == 2:
+            low, high = self._literal(node.args[0]), self._literal(node.args[1])
+            return pc.coalesce((target >= low) & (target <= high), False)
+        if method == "abs" and not node.args:
+            return pc.abs(target)
+        raise ValueError(f"{self.kind} 表达式中不支持的方法: {method}")
+
+    def _call_function(self, name, args):
+        function_name = _FUNCTIONS.get(name, name)
+        try:
+            pc.get_function(function_name)
+        except pa.ArrowKeyError:
+            raise ValueError(f"{self.kind} 表达式中不支持的函数: {name}")
+        return pc.Expression._call(function_name, args)
+
+    def _literal(self, node):
+        value = self.visit(node)
+        if isinstance(value, pc.Expression):
+            raise ValueError("此处只能使用常量")
+        return value
+
+    @staticmethod
+    def _as_expr(value):
+        return value if isinstance(value, pc.Expression) else pc.scalar(value)
+
+
+def compile_filter_expression(expression: str):
+    """
+    将 filter 字符串编译为 pyarrow.compute.Expression。
+
+    Args:
+        expression (str): filter 表达式，如 "(lat > 30) & (name.isin(['a', 'b']))"
+    Returns:
+        tuple: (pc.Expression, set) 编译后的表达式和引用到的列名集合
+    Raises:
+        ValueError: 表达式包含不支持的语法
+    """
+    compiler = _ExpressionCompiler()
+    compiled = compiler.compile(expression)
+    if not isinstance(compiled, pc.Expression):
+        compiled = pc.scalar(bool(compiled))
+    return compiled, compiler.columns
+
+
+def compile_map_expression(expression: str):
+    """
+    将 map 表达式编译为 pyarrow.compute.Expression，返回 (表达式, 引用到的列名集合)。
+    表达式可以使用列名、四则运算、sqrt / log / where 等函数以及服务端注册的 UDF，如 "tas - 273.15"。
+    """
+    compiler = _ExpressionCompiler("map")
+    compiled = compiler.compile(expression)
+    if not isinstance(compiled, pc.Expression):
+        compiled = pc.scalar(compiled)
+    return compiled, compiler.columns
+
+
+def map_expression(column, func: str):
+    """
+    map 的字符串 func：是函数名（sqrt 等内置函数、pyarrow.compute 函数或服务端注册的 UDF）时对 column 调用该函数，
+    否则作为 map 表达式编译。
+    """
+    if column is not None and func.isidentifier():
+        function_name = _FUNCTIONS.get(func, func)
+        try:
+            pc.get_function(function_name)
+            return pc.Expression._call(function_name, [pc.field(column)])
+        except pa.ArrowKeyError:
+            pass
+    return compile_map_expression(func)[0]
+
+
+def project_table(arrow_table: pa.Table, expression, name: str) -> pa.Table:
+    """计算 expression 并作为 name 列追加到表末尾（已有同名列时原位替换），向量化执行，不经过 Python 对象。"""
+    names = list(arrow_table.column_names)
+    expressions = [expression if column == name else pc.field(column) for column in names]
+    if name not in names:
+        names.append(name)
+        expressions.append(expression)
+    declaration = acero.Declaration.from_sequence([
+        acero.Declaration("table_source", acero.TableSourceNodeOptions(arrow_table)),
+        acero.Declaration("project", acero.ProjectNodeOptions(expressions, names)),
+    ])
+    return declaration.to_table(use_threads=False).replace_schema_metadata(arrow_table.schema.metadata)
+
+
+def map_table(arrow_table: pa.Table, column, func, new_column_name: str) -> pa.Table:
+    """
+    执行 map action：func 为字符串时按 map_expression 向量化计算；
+    为 Python 函数时（只能在同一进程内使用，无法序列化给服务端）逐个值调用。
+    """
+    if isinstance(func, str):
+        return project_table(arrow_table, map_expression(column, func), new_column_name)
+    mapped_data = [func(value) for value in arrow_table[column].to_pylist()]
+    return arrow_table.append_column(new_column_name, pa.array(mapped_data))
+
+
+def referenced_columns(expression: str):
+    """返回表达式中出现的所有名字（仅做语法分析，不要求能编译为 Arrow 表达式）。"""
+    tree = ast.parse(expression.strip(), mode="eval")
+    return {node.id for node in ast.walk(tree) if isinstance(node, ast.Name)}
+
+
+def filter_batch(batch: pa.RecordBatch, filter_expr) -> pa.RecordBatch:
+    """
+    对单个 RecordBatch 计算 filter。
+    pyarrow 的 RecordBatch.filter(Expression) 在结果为空时会抛出 IndexError，这里通过 Table 计算规避。
+    """
+    filtered = pa.Table.from_batches([batch]).filter(filter_expr).combine_chunks()
+    return filtered.to_batches()[0] if filtered.num_rows > 0 else batch.slice(0, 0)
+
+
+def filter_batches(batches, filter_expr):
+    """逐个 RecordBatch 计算 filter，不把整张表转换为 pandas。"""
+    for batch in batches:
+        filtered = filter_batch(batch, filter_expr)
+        if filtered.num_rows > 0:
+            yield filtered
+
+
+def filter_table(arrow_table: pa.Table, expression: str) -> pa.Table:
+    """
+    用 Arrow 原生表达式对表做 filter，只读取表达式引用到的列参与计算。
+    遇到无法编译的表达式时，降级为仅对引用列做 pandas eval 的旧实现。
+    """
+    try:
+        filter_expr, columns = compile_filter_expression(expression)
+    except ValueError as e:
+        logger.warning(f"filter 表达式无法编译为 Arrow 表达式，降级为 pandas eval: {e}")
+        return _eval_filter_table(arrow_table, expression)
+    missing = columns - set(arrow_table.column_names)
+    if missing:
+        raise ValueError(f"filter 表达式引用了不存在的列: {sorted(missing)}")
+    batches = list(filter_batches(arrow_table.to_batches(), filter_expr))
+    return pa.Table.from_batches(batches, schema=arrow_table.schema)
+
+
+def _eval_filter_table(arrow_table: pa.Table, expression: str) -> pa.Table:
+    names = referenced_columns(expression)
+    locals_dict = {col: arrow_table[col].to_pandas() for col in arrow_table.column_names if col in names}
+    mask = eval(expression, {"__builtins__": None}, locals_dict)
+    return arrow_table.filter(pa.array(mask))
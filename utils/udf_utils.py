@@ -0,0 +1,57 @@
+import importlib
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from utils.logger_utils import get_logger
+logger = get_logger(__name__)
+
+# 通过 register_udf 注册的函数：名称 -> 说明
+_registered_udfs = {}
+
+
+def register_udf(name: str, func: Callable, in_types: Dict[str, pa.DataType], out_type: pa.DataType,
+                 doc: Optional[str] = None, numpy: bool = True):
+    """
+    注册服务端的向量化 UDF，注册后可以在 map 中按名字调用（df.map("tas", "kelvin_to_celsius")），
+    也可以在 map / filter 表达式中使用（"kelvin_to_celsius(tas) > 20"）。
+    func 每次接收一个批次的整列数据：numpy=True 时为 NumPy 数组（null 按 NaN 或 None 传入，结果中对应位置仍为 null），
+    否则为 Arrow 数组；返回与输入等长的数组。常量参数以 Python 标量传入。
+    """
+    def udf(ctx, *args):
+        nulls = None
+        values = []
+        for arg in args:
+            if isinstance(arg, pa.Scalar):
+                values.append(arg.as_py())
+                continue
+            if numpy:
+                if arg.null_count:
+                    is_null = arg.is_null()
+                    nulls = is_null if nulls is None else pc.or_(nulls, is_null)
+                arg = arg.to_numpy(zero_copy_only=False)
+            values.append(arg)
+        result = func(*values)
+        if isinstance(result, (pa.Array, pa.ChunkedArray)):
+            return result.cast(out_type)
+        mask = nulls.to_numpy(zero_copy_only=False) if nulls is not None else None
+        return pa.array(np.asarray(result), type=out_type, mask=mask)
+
+    pc.register_scalar_function(udf, name, {"summary": doc or name, "description": doc or name}, in_types, out_type)
+    _registered_udfs[name] = doc or ""
+    logger.info(f"已注册 UDF: {name}")
+
+
+def registered_udfs() -> Dict[str, str]:
+    return dict(_registered_udfs)
+
+
+def load_udf_modules(modules: List[str]):
+    """导入 faird.conf 中 map.udf_modules 配置的模块，模块在导入时调用 register_udf 注册函数。"""
+    for module in modules:
+        try:
+            importlib.import_module(module)
+        except Exception as e:
+            logger.error(f"加载 UDF 模块 {module} 失败: {e}")